@@ -0,0 +1,64 @@
+"""
+Prompt build time and prompt size versus conversation length.
+
+Compares sending the full history with each context window strategy.
+
+Usage:
+    python benchmarks/bench_context_window.py [--max-tokens 8000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common import Timer  # noqa: E402
+
+from urpe.context import ContextWindow  # noqa: E402
+
+LENGTHS = [10, 100, 1000, 5000]
+
+
+async def summarize(previous, messages):
+    return (previous or "") + f" [{len(messages)} messages]"
+
+
+def conversation(length: int):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "lorem ipsum " * 20}
+        for i in range(length)
+    ]
+
+
+async def run(max_tokens: int, repeat: int) -> None:
+    windows = {
+        "sliding_window": ContextWindow(max_tokens=max_tokens),
+        "summarize": ContextWindow(max_tokens=max_tokens, strategy="summarize", summarizer=summarize),
+    }
+    print(f"{'messages':>8} {'full tokens':>12} {'strategy':>15} {'prompt tokens':>14} {'build ms':>9}")
+    for length in LENGTHS:
+        messages = conversation(length)
+        full = windows["sliding_window"].count_tokens(messages)
+        for name, window in windows.items():
+            summary = None
+            timings = []
+            for _ in range(repeat):
+                with Timer() as t:
+                    result = await window.build(messages, summary)
+                summary = result.summary
+                timings.append(t.ms)
+            print(f"{length:>8} {full:>12} {name:>15} {result.tokens:>14} {min(timings):>9.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-tokens", type=int, default=8000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.max_tokens, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Requests/sec and latency of `urpe ask` with and without the daemon.
+
+Every path talks to a local fake OpenAI-compatible endpoint, so the numbers
+show urpe's own overhead: per-process startup (imports, engine setup, new
+HTTP connections) versus a warm `urpe serve` daemon, reached either by the
+`urpe ask` CLI or directly over the socket.
+
+Usage:
+    python benchmarks/bench_daemon.py [--processes 8] [--requests 200] [--concurrency 4]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common import FakeLLMServer, Timer, percentile  # noqa: E402
+
+from urpe.client import DaemonClient  # noqa: E402
+
+MODEL = "openai/fake"
+
+
+def run_cli(args: List[str], env: Dict[str, str], cwd: str) -> float:
+    """Run one `urpe ask` process and return its latency in ms."""
+    with Timer() as t:
+        proc = subprocess.run(
+            [sys.executable, "-m", "urpe.cli", *args],
+            env=env, cwd=cwd, capture_output=True, text=True,
+        )
+    if proc.returncode != 0:
+        raise RuntimeError(f"urpe {' '.join(args)} failed:\n{proc.stdout[-2000:]}")
+    return t.ms
+
+
+def cli_load(count: int, concurrency: int, extra: List[str], env, cwd) -> Tuple[float, List[float]]:
+    """Run `count` ask processes, `concurrency` at a time; returns (seconds, latencies)."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(
+            lambda n: run_cli(["ask", f"question {n}", "--model", MODEL, "--no-tools", *extra], env, cwd),
+            range(count),
+        ))
+    return time.perf_counter() - start, latencies
+
+
+async def socket_load(socket_path: str, count: int, concurrency: int) -> Tuple[float, List[float]]:
+    """Send `count` one-turn requests straight to the daemon."""
+    latencies = []
+    queue = list(range(count))
+
+    async def worker():
+        while queue:
+            n = queue.pop()
+            client = await DaemonClient.connect(socket_path)
+            with Timer() as t:
+                async for _ in client.send_message(f"question {n}", model=MODEL, enable_tools=False):
+                    pass
+            await client.close()
+            latencies.append(t.ms)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+async def daemon_ready(socket_path: str) -> bool:
+    client = await DaemonClient.connect(socket_path)
+    if client is None:
+        return False
+    await client.close()
+    return True
+
+
+def wait_for_daemon(socket_path: str, daemon: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if daemon.poll() is not None:
+            raise RuntimeError(f"Daemon exited:\n{daemon.stderr.read().decode()}")
+        if asyncio.run(daemon_ready(socket_path)):
+            return
+        time.sleep(0.1)
+    raise RuntimeError("Daemon did not start")
+
+
+def report(name: str, seconds: float, latencies: List[float]):
+    print(
+        f"{name:<22} {len(latencies) / seconds:>8.1f} req/s   "
+        f"p50 {percentile(latencies, 50):>8.1f} ms   p99 {percentile(latencies, 99):>8.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", type=int, default=8, help="`urpe ask` processes per CLI run")
+    parser.add_argument("--requests", type=int, default=200, help="Requests sent straight to the daemon")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake provider latency in seconds")
+    args = parser.parse_args()
+
+    with FakeLLMServer(latency=args.latency) as llm, tempfile.TemporaryDirectory() as cwd:
+        socket_path = os.path.join(cwd, "urpe.sock")
+        env = {
+            **os.environ,
+            "OPENAI_API_BASE": llm.url,
+            "OPENAI_API_KEY": "fake",
+            "GEMINI_API_KEY": "fake",
+            "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+            "URPE_SOCKET": socket_path,
+        }
+
+        # Warm-up: creates the database and writes bytecode caches
+        run_cli(["ask", "warm-up", "--model", MODEL, "--no-tools", "--no-daemon"], env, cwd)
+        seconds, latencies = cli_load(args.processes, args.concurrency, ["--no-daemon"], env, cwd)
+        report("per-process", seconds, latencies)
+
+        daemon = subprocess.Popen(
+            [sys.executable, "-m", "urpe.cli", "serve"],
+            env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        try:
+            wait_for_daemon(socket_path, daemon)
+            seconds, latencies = cli_load(args.processes, args.concurrency, [], env, cwd)
+            report("urpe ask via daemon", seconds, latencies)
+            seconds, latencies = asyncio.run(socket_load(socket_path, args.requests, args.concurrency))
+            report("daemon socket", seconds, latencies)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    print(f"\nfake provider served {llm.requests} requests")
+
+
+if __name__ == "__main__":
+    main()
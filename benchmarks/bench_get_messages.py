@@ -0,0 +1,101 @@
+"""
+get_messages latency on a large messages table.
+
+Fills a database with --rows messages spread over --conversations
+conversations, then times get_messages for a sample of conversations with
+the (conversation_id, seq) index and again with it dropped.
+
+Usage:
+    python benchmarks/bench_get_messages.py [--rows 1000000] [--conversations 2000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common import Timer, percentile  # noqa: E402
+
+from urpe.memory.sqlite import MemoryStore  # noqa: E402
+
+
+def populate(db_path: str, rows: int, conversations: int) -> list:
+    """Bulk-load rows directly with sqlite3; MemoryStore is too slow for 1M inserts."""
+    conv_ids = [str(uuid.uuid4()) for _ in range(conversations)]
+    start = datetime(2026, 1, 1)
+    per_conversation = rows // conversations
+    
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO conversations (id, created_at, model, message_count) VALUES (?, ?, 'bench', ?)",
+        [(conv_id, start.isoformat(" "), per_conversation) for conv_id in conv_ids],
+    )
+    
+    def messages():
+        # Interleave conversations, as concurrent sessions would
+        for seq in range(1, per_conversation + 1):
+            for conv_id in conv_ids:
+                yield (
+                    str(uuid.uuid4()),
+                    conv_id,
+                    "user" if seq % 2 else "assistant",
+                    "lorem ipsum dolor sit amet",
+                    seq,
+                    (start + timedelta(seconds=seq)).isoformat(" "),
+                )
+    
+    conn.executemany(
+        "INSERT INTO messages (id, conversation_id, role, content, seq, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        messages(),
+    )
+    conn.commit()
+    conn.close()
+    return conv_ids
+
+
+def measure(store: MemoryStore, conv_ids: list, samples: int) -> list:
+    timings = []
+    for conv_id in random.sample(conv_ids, samples):
+        with Timer() as t:
+            store.get_messages(conv_id)
+        timings.append(t.ms)
+    return timings
+
+
+def report(label: str, timings: list) -> None:
+    print(f"{label:<24} p50 {percentile(timings, 50):>9.2f} ms   p99 {percentile(timings, 99):>9.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "bench.db")
+        MemoryStore(db_path=db_path).close()
+        
+        with Timer() as t:
+            conv_ids = populate(db_path, args.rows, args.conversations)
+        print(f"Loaded {args.rows} messages in {t.ms / 1000:.1f}s")
+        
+        store = MemoryStore(db_path=db_path)
+        report("with index", measure(store, conv_ids, args.samples))
+        
+        with store.engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_messages_conversation_seq")
+        report("without index", measure(store, conv_ids, min(args.samples, 10)))
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Tail latency of get_llm_response with fallback deadlines and hedging.
+
+Two fake models answer through the real scheduler and router: the primary
+usually streams its first token after `--fast` seconds but a `--slow-rate`
+fraction of requests stall for `--slow` seconds; the backup is steady at
+`--backup` seconds. Each configuration sends `--requests` requests,
+`--concurrency` at a time, and reports time-to-first-token percentiles.
+
+Usage:
+    python benchmarks/bench_hedging.py [--requests 400] [--slow-rate 0.05]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common import percentile  # noqa: E402
+
+from urpe.config import settings  # noqa: E402
+from urpe.llm import get_llm_response  # noqa: E402
+from urpe.llm_fallback import ModelRouter  # noqa: E402
+
+
+def fake_completion(args):
+    """Async stand-in for litellm.acompletion with per-model latency."""
+    async def completion(model, **kwargs):
+        if model == "primary":
+            delay = args.slow if random.random() < args.slow_rate else args.fast
+        else:
+            delay = args.backup
+
+        async def stream():
+            await asyncio.sleep(delay)
+            delta = SimpleNamespace(content=model, tool_calls=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        return stream()
+    return completion
+
+
+async def measure(args, router: ModelRouter, models):
+    latencies = []
+    queue = list(range(args.requests))
+
+    async def worker():
+        while queue:
+            n = queue.pop()
+            start = time.perf_counter()
+            stream = await get_llm_response("primary", [{"role": "user", "content": f"q{n}"}])
+            async for _ in stream:
+                latencies.append((time.perf_counter() - start) * 1000)
+                break
+            await stream.aclose()
+
+    with patch("urpe.llm.fallback_chain", return_value=models), patch("urpe.llm.get_router", return_value=router):
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return latencies
+
+
+async def run(args) -> None:
+    settings.llm_cache_enabled = False
+    configs = [
+        ("primary only", ModelRouter(), ["primary"]),
+        ("ttft fallback", ModelRouter(ttft_timeout=args.fast * 4), ["primary", "backup"]),
+        ("hedged (p95)", ModelRouter(hedge=True, hedge_delay=args.fast * 4), ["primary", "backup"]),
+    ]
+    with patch("urpe.llm.acompletion", fake_completion(args)):
+        for name, router, models in configs:
+            latencies = await measure(args, router, models)
+            stats = router.stats()
+            hedged = stats.get("primary", {}).get("hedged", 0) + stats.get("primary", {}).get("timeouts", 0)
+            print(
+                f"{name:<15} p50 {percentile(latencies, 50):>8.1f} ms   p95 {percentile(latencies, 95):>8.1f} ms   "
+                f"p99 {percentile(latencies, 99):>8.1f} ms   backup requests {hedged}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fast", type=float, default=0.02, help="Primary's usual first-token delay")
+    parser.add_argument("--slow", type=float, default=1.0, help="Primary's stalled first-token delay")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Fraction of stalled primary requests")
+    parser.add_argument("--backup", type=float, default=0.04, help="Backup's first-token delay")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
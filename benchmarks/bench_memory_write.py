@@ -0,0 +1,65 @@
+"""
+Message persistence throughput (messages/sec).
+
+Compares one transaction per add_message with the default SQLite journal
+("before"), the same with WAL and tuned pragmas, and WriteBehindStore
+group-committing each simulated turn.
+
+Usage:
+    python benchmarks/bench_memory_write.py [--messages 2000] [--per-turn 4]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from contextlib import nullcontext
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common import Timer  # noqa: E402
+
+from urpe.memory.sqlite import MemoryStore  # noqa: E402
+from urpe.memory.write_behind import WriteBehindStore  # noqa: E402
+
+
+def write(store, conv_id: str, messages: int, per_turn: int) -> None:
+    for i in range(messages):
+        store.add_message(conv_id, "user", f"message {i} " + "lorem ipsum " * 20)
+        if (i + 1) % per_turn == 0 and hasattr(store, "flush"):
+            store.flush()
+
+
+def run_case(name: str, messages: int, per_turn: int, pragmas=None, write_behind=False) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pragma_patch = nullcontext()
+        if pragmas is not None:
+            pragma_patch = patch.dict("urpe.memory.sqlite.SQLITE_PRAGMAS", pragmas, clear=True)
+        with pragma_patch:
+            base = MemoryStore(db_path=os.path.join(tmpdir, "bench.db"))
+            store = WriteBehindStore(base, flush_interval=3600) if write_behind else base
+            conv_id = store.create_conversation()
+            
+            with Timer() as t:
+                write(store, conv_id, messages, per_turn)
+                if write_behind:
+                    store.close()
+            
+            base.close()
+    print(f"{name:<32} {messages / (t.ms / 1000):>12.0f} msg/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--per-turn", type=int, default=4)
+    args = parser.parse_args()
+    
+    run_case("add_message, default journal", args.messages, args.per_turn, pragmas={})
+    run_case("add_message, WAL + pragmas", args.messages, args.per_turn)
+    run_case("write-behind, commit per turn", args.messages, args.per_turn, write_behind=True)
+
+
+if __name__ == "__main__":
+    main()
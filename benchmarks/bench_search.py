@@ -0,0 +1,60 @@
+"""
+Full-text search latency versus a LIKE scan.
+
+Usage:
+    python benchmarks/bench_search.py [--rows 200000] [--conversations 500]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common import Timer, percentile  # noqa: E402
+from bench_get_messages import populate  # noqa: E402
+
+from urpe.memory.sqlite import MemoryStore  # noqa: E402
+
+WORDS = ["nginx", "docker", "postgres", "kubernetes", "python", "rollback", "latency", "deploy"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--samples", type=int, default=20)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "bench.db")
+        MemoryStore(db_path=db_path).close()
+        conv_ids = populate(db_path, args.rows, args.conversations)
+        
+        store = MemoryStore(db_path=db_path)
+        # Sprinkle searchable words into a few messages
+        for word in WORDS:
+            store.add_message(random.choice(conv_ids), "user", f"how do I fix {word} issues?")
+        
+        fts, like = [], []
+        for _ in range(args.samples):
+            word = random.choice(WORDS)
+            with Timer() as t:
+                store.search(word)
+            fts.append(t.ms)
+            with Timer() as t, store.engine.connect() as conn:
+                conn.exec_driver_sql(
+                    "SELECT conversation_id FROM messages WHERE content LIKE ? LIMIT 20",
+                    (f"%{word}%",),
+                ).all()
+            like.append(t.ms)
+        store.close()
+    
+    print(f"{'FTS5 search':<12} p50 {percentile(fts, 50):>9.2f} ms   p99 {percentile(fts, 99):>9.2f} ms")
+    print(f"{'LIKE scan':<12} p50 {percentile(like, 50):>9.2f} ms   p99 {percentile(like, 99):>9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Throughput and latency of many concurrent sessions in one SessionManager.
+
+The provider is a fake that waits `--latency` seconds and then streams a
+short reply; `--rate-limit` makes that fraction of requests fail with a 429
+so the request scheduler's backoff is exercised. Every session runs `--turns` turns back to
+back, all sessions at once, against a throwaway SQLite database.
+
+Usage:
+    python benchmarks/bench_sessions.py [--sessions 500] [--turns 4] [--llm-calls 32]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common import Timer, percentile  # noqa: E402
+
+from urpe.config import settings  # noqa: E402
+from urpe.llm import get_scheduler  # noqa: E402
+from urpe.memory import WriteBehindStore  # noqa: E402
+from urpe.memory.sqlite import MemoryStore  # noqa: E402
+from urpe.sessions import SessionManager  # noqa: E402
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FakeLLM:
+    """Async stand-in for litellm.acompletion with latency and injected 429s."""
+
+    def __init__(self, latency: float, rate_limit: float, chunks: int = 8):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.chunks = chunks
+        self.requests = 0
+        self.rejected = 0
+        self.running = 0
+        self.peak = 0
+
+    async def _stream(self):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.latency)
+            for n in range(self.chunks):
+                delta = SimpleNamespace(content=f"token{n} ", tool_calls=None)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        finally:
+            self.running -= 1
+
+    async def __call__(self, **kwargs):
+        self.requests += 1
+        if random.random() < self.rate_limit:
+            self.rejected += 1
+            raise RateLimitError("rate limited")
+        return self._stream()
+
+
+async def run(args) -> None:
+    settings.llm_backoff = 0.05
+    settings.llm_cache_enabled = False
+    fake = FakeLLM(args.latency, args.rate_limit)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = WriteBehindStore(MemoryStore(db_path=os.path.join(tmpdir, "bench.db")))
+        manager = SessionManager(
+            memory_store=store,
+            model="fake",
+            enable_tools=False,
+            max_sessions=args.sessions,
+            max_llm_calls=args.llm_calls,
+        )
+        latencies = []
+
+        async def session_worker(n: int):
+            session = await manager.open()
+            for turn in range(args.turns):
+                with Timer() as t:
+                    async for _ in session.send(f"session {n} turn {turn}"):
+                        pass
+                latencies.append(t.ms)
+
+        with patch("urpe.llm.acompletion", fake):
+            start = time.perf_counter()
+            await asyncio.gather(*(session_worker(n) for n in range(args.sessions)))
+            seconds = time.perf_counter() - start
+            scheduled = get_scheduler().stats()["fake"]
+
+        await manager.close()
+        store.close()
+
+    turns = len(latencies)
+    print(f"{args.sessions} sessions x {args.turns} turns, {args.llm_calls} concurrent LLM calls")
+    print(f"  {turns / seconds:>10.1f} turns/s   ({seconds:.2f} s total)")
+    print(f"  p50 {percentile(latencies, 50):>8.1f} ms   p99 {percentile(latencies, 99):>8.1f} ms")
+    print(f"  peak concurrent streams: {fake.peak}")
+    print(f"  provider requests: {fake.requests} ({fake.rejected} rate limited, {scheduled['retries']} retried)")
+    print(f"  scheduler wait: p50 {scheduled['wait_p50_ms']:.1f} ms   p95 {scheduled['wait_p95_ms']:.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--llm-calls", type=int, default=32, help="Concurrent LLM streams allowed")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake provider latency in seconds")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of requests rejected with 429")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
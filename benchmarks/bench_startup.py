@@ -0,0 +1,167 @@
+"""
+Cold-start import time of each CLI subcommand, checked against a budget.
+
+Runs every subcommand in a fresh interpreter under `python -X importtime`
+and reports the median import and wall time. Exits non-zero when a command
+goes over its budget or imports a module it should not need, so it can
+guard against startup regressions in CI.
+
+`urpe tools` is also run with --plugins plugin tools installed from a tool
+directory, whose handler modules must not be imported just to list them,
+next to what importing every handler up front would cost.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--budget-scale 1.0] [--top 3] [--plugins 50]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common import Timer, write_plugin_tools  # noqa: E402
+
+RUN_CLI = "import sys; from urpe.cli import app; sys.argv = ['urpe', *sys.argv[1:]]; app()"
+# ask/chat need an API key and a provider; measure what they load before the first call
+LOAD_AGENT = "import urpe.cli, urpe.agent"
+
+IMPORT_HANDLERS = (
+    "from urpe.tools import registry; "
+    "[registry.get_handler(tool.name) for tool in registry.list_tools()]"
+)
+
+Command = Tuple[str, List[str], Optional[float], Tuple[str, ...]]
+
+# name: (code, args, import budget in ms or None, modules that must stay unimported).
+# Budgets leave headroom for slow machines; importing litellm alone takes ~5 s.
+COMMANDS: Dict[str, Command] = {
+    "--help": (RUN_CLI, ["--help"], 600, ("litellm", "sqlalchemy")),
+    "tools": (RUN_CLI, ["tools"], 600, ("litellm", "sqlalchemy")),
+    "history": (RUN_CLI, ["history", "--limit", "1"], 1200, ("litellm",)),
+    "search": (RUN_CLI, ["search", "startup"], 1200, ("litellm",)),
+    "cache": (RUN_CLI, ["cache"], 1200, ("litellm",)),
+    "ask/chat": (LOAD_AGENT, [], 1200, ("litellm",)),
+}
+
+# Run with plugin tools installed (their handler modules are bench_tool_NN)
+PLUGIN_COMMANDS: Dict[str, Command] = {
+    "tools+N": (RUN_CLI, ["tools"], 600, ("litellm", "sqlalchemy", "bench_tool_00")),
+    # For comparison: importing every handler at startup
+    "eager+N": (IMPORT_HANDLERS, [], None, ()),
+}
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Parse `-X importtime` output.
+
+    Returns:
+        Total import time in ms and the cumulative ms of each top-level import
+    """
+    top_level = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            top_level[name.strip()] = int(cumulative) / 1000
+    return sum(top_level.values()), top_level
+
+
+def imported_modules(stderr: str) -> set:
+    """Names of every module imported according to `-X importtime` output."""
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in stderr.splitlines()
+        if line.startswith("import time:") and "cumulative" not in line
+    }
+
+
+def run_once(
+    code: str,
+    args: List[str],
+    cwd: str,
+    pythonpath: Optional[str] = None,
+) -> Tuple[float, float, Dict[str, float], set]:
+    """Run one command in a fresh interpreter; returns (import ms, wall ms, top-level, modules)."""
+    env = {k: v for k, v in os.environ.items() if not k.startswith("URPE_")}
+    if pythonpath:
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [pythonpath, env.get("PYTHONPATH")]))
+    with Timer() as t:
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code, *args],
+            cwd=cwd,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{code} {args} failed:\n{proc.stderr[-2000:]}")
+    total, top_level = parse_importtime(proc.stderr)
+    return total, t.ms, top_level, imported_modules(proc.stderr)
+
+
+def run_commands(
+    commands: Dict[str, Command],
+    cwd: str,
+    args: argparse.Namespace,
+    failures: List[str],
+    pythonpath: Optional[str] = None,
+) -> None:
+    """Measure each command, print a row for it and record regressions in `failures`."""
+    for name, (code, cmd_args, budget, forbidden) in commands.items():
+        name = name.replace("N", str(args.plugins))
+        # Warm-up: writes bytecode caches and creates the database
+        run_once(code, cmd_args, cwd, pythonpath)
+        runs = [run_once(code, cmd_args, cwd, pythonpath) for _ in range(args.runs)]
+
+        import_ms = statistics.median(r[0] for r in runs)
+        wall_ms = statistics.median(r[1] for r in runs)
+        budget_ms = budget * args.budget_scale if budget is not None else None
+        heaviest = sorted(runs[-1][2].items(), key=lambda item: item[1], reverse=True)[:args.top]
+        unexpected = sorted(m for m in forbidden if m in runs[-1][3])
+
+        status = "ok"
+        if budget_ms is not None and import_ms > budget_ms:
+            status = "OVER BUDGET"
+            failures.append(f"{name}: {import_ms:.0f} ms > {budget_ms:.0f} ms")
+        if unexpected:
+            status = "UNEXPECTED IMPORTS"
+            failures.append(f"{name}: imports {', '.join(unexpected)}")
+
+        heavy = ", ".join(f"{module} {ms:.0f}" for module, ms in heaviest)
+        budget_text = f"{budget_ms:>7.0f} ms" if budget_ms is not None else f"{'-':>10}"
+        print(f"{name:<10} {import_ms:>7.0f} ms {wall_ms:>7.0f} ms {budget_text}   {heavy}  [{status}]")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+                        help="Multiply every budget, e.g. 2 on a slow CI machine")
+    parser.add_argument("--top", type=int, default=3, help="Heaviest imports to list per command")
+    parser.add_argument("--plugins", type=int, default=50, help="Plugin tools installed for tools+N")
+    args = parser.parse_args()
+
+    failures: List[str] = []
+    print(f"{'command':<10} {'import':>10} {'wall':>10} {'budget':>10}   heaviest imports")
+    with tempfile.TemporaryDirectory() as cwd:
+        run_commands(COMMANDS, cwd, args, failures)
+    with tempfile.TemporaryDirectory() as cwd:
+        tools_dir = write_plugin_tools(cwd, args.plugins)
+        run_commands(PLUGIN_COMMANDS, cwd, args, failures, pythonpath=tools_dir)
+
+    if failures:
+        print("\nStartup regressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
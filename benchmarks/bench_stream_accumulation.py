@@ -0,0 +1,108 @@
+"""
+Cost of accumulating and yielding a long streamed response.
+
+Compares the old per-chunk `+=` accumulation with StreamAccumulator on a
+--tokens token synthetic stream, for reply text and for the arguments of a
+tool call, then runs a whole turn through Agent.process_message with chunk
+coalescing off and on, printing each chunk to an off-screen rich console
+the way `urpe chat` does, and counts the chunks the consumer receives.
+
+Usage:
+    python benchmarks/bench_stream_accumulation.py [--tokens 100000]
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from rich.console import Console
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common import FakeStreamingLLM, Timer  # noqa: E402
+
+from urpe.agent import Agent  # noqa: E402
+from urpe.config import settings  # noqa: E402
+from urpe.memory.sqlite import MemoryStore  # noqa: E402
+from urpe.streaming import StreamAccumulator  # noqa: E402
+
+
+def text_deltas(tokens: int):
+    return [SimpleNamespace(content=f"tok{n} ", tool_calls=None) for n in range(tokens)]
+
+
+def argument_deltas(tokens: int):
+    deltas = []
+    for n in range(tokens):
+        function = SimpleNamespace(name="write_file" if n == 0 else None, arguments=f"arg{n} ")
+        call = SimpleNamespace(index=0, id="call-1" if n == 0 else None, function=function)
+        deltas.append(SimpleNamespace(content=None, tool_calls=[call]))
+    return deltas
+
+
+def naive(deltas):
+    """The accumulation process_message used to do."""
+    full_content = ""
+    tool_calls = []
+    for delta in deltas:
+        if delta.content:
+            full_content += delta.content
+        if delta.tool_calls:
+            for tc in delta.tool_calls:
+                if tc.index >= len(tool_calls):
+                    tool_calls.append({"id": tc.id, "name": tc.function.name if tc.function else "", "arguments": ""})
+                if tc.function and tc.function.arguments:
+                    tool_calls[tc.index]["arguments"] += tc.function.arguments
+    return full_content, tool_calls
+
+
+def accumulated(deltas):
+    accumulator = StreamAccumulator()
+    for delta in deltas:
+        accumulator.add(delta)
+    return accumulator.content, accumulator.tool_calls
+
+
+async def turn(tokens: int, interval: float, store: MemoryStore):
+    agent = Agent(model="fake", enable_tools=False, memory_store=store)
+    agent.coalesce_interval = interval
+    await agent.astart_conversation()
+    console = Console(file=io.StringIO(), force_terminal=True)
+    chunks = 0
+    with patch("urpe.llm.acompletion", FakeStreamingLLM(tokens=tokens)), Timer() as t:
+        async for chunk in agent.process_message("go"):
+            console.print(chunk, end="")
+            chunks += 1
+    return t.ms, chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"{'stream':<22} {'naive ms':>10} {'accumulator ms':>15}")
+    for name, deltas in (("text", text_deltas(args.tokens)), ("tool arguments", argument_deltas(args.tokens))):
+        with Timer() as before:
+            naive(deltas)
+        with Timer() as after:
+            accumulated(deltas)
+        print(f"{name:<22} {before.ms:>10.1f} {after.ms:>15.1f}")
+
+    settings.llm_cache_enabled = False
+    print(f"\n{'process_message':<22} {'ms':>10} {'chunks yielded':>15}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = MemoryStore(db_path=os.path.join(tmpdir, "bench.db"))
+        for label, interval in (("coalescing off", 0), ("coalescing 30 ms", 0.03)):
+            ms, chunks = asyncio.run(turn(args.tokens, interval, store))
+            print(f"{label:<22} {ms:>10.1f} {chunks:>15}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Per-turn overhead of Agent.process_message as conversation history grows.
+
+The LLM is replaced by an instant fake stream, so the numbers reflect only
+the agent's own bookkeeping (context building and persistence).
+
+Usage:
+    python benchmarks/bench_turn_overhead.py [--turns 1000] [--every 100]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common import Timer, fake_stream  # noqa: E402
+
+from urpe.agent import Agent  # noqa: E402
+from urpe.memory.sqlite import MemoryStore  # noqa: E402
+
+
+async def run(turns: int, every: int) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = MemoryStore(db_path=os.path.join(tmpdir, "bench.db"))
+        
+        async def fake_llm(**kwargs):
+            return fake_stream()
+        
+        with patch("urpe.agent.memory", store), patch("urpe.agent.get_llm_response", fake_llm):
+            agent = Agent(model="fake", enable_tools=False)
+            agent.start_conversation()
+            
+            window = []
+            print(f"{'history':>8} {'avg ms/turn':>12}")
+            for turn in range(1, turns + 1):
+                with Timer() as t:
+                    async for _ in agent.process_message(f"message {turn}"):
+                        pass
+                window.append(t.ms)
+                if turn % every == 0:
+                    print(f"{len(agent.messages):>8} {sum(window) / len(window):>12.3f}")
+                    window = []
+        
+        store.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--every", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.turns, args.every))
+
+
+if __name__ == "__main__":
+    main()
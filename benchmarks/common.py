@@ -0,0 +1,194 @@
+"""Shared helpers for the benchmark scripts."""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from urpe.tracing import percentile  # noqa: F401 (re-exported for the scripts)
+
+
+def fake_stream(text: str = "ok"):
+    """Return an async LiteLLM-style stream that yields a single text delta."""
+    async def stream():
+        delta = SimpleNamespace(content=text, tool_calls=None)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+    return stream()
+
+
+def _chunk(**delta):
+    delta.setdefault("content", None)
+    delta.setdefault("tool_calls", None)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(**delta))])
+
+
+class FakeStreamingLLM:
+    """
+    Deterministic stand-in for litellm.acompletion(stream=True).
+    
+    Waits `latency` seconds, then streams `tokens` tokens of text, one chunk
+    each, paced at `tokens_per_second` (None for as fast as possible). With
+    `tool_call` set to (name, arguments), a request whose last message is not
+    a tool result is answered with that tool call instead, its arguments
+    split over `tool_call_chunks` chunks the way providers send them.
+    """
+    
+    def __init__(
+        self,
+        tokens: int = 32,
+        tokens_per_second: Optional[float] = None,
+        latency: float = 0.0,
+        tool_call: Optional[Tuple[str, Dict[str, Any]]] = None,
+        tool_call_chunks: int = 4,
+    ):
+        self.tokens = tokens
+        self.tokens_per_second = tokens_per_second
+        self.latency = latency
+        self.tool_call = tool_call
+        self.tool_call_chunks = tool_call_chunks
+        self.requests = 0
+    
+    def _chunks(self, messages: List[Dict[str, Any]]):
+        if self.tool_call and messages[-1]["role"] != "tool":
+            name, arguments = self.tool_call
+            encoded = json.dumps(arguments)
+            size = max(1, -(-len(encoded) // self.tool_call_chunks))
+            for n, start in enumerate(range(0, len(encoded), size)):
+                function = SimpleNamespace(name=name if n == 0 else None, arguments=encoded[start:start + size])
+                call = SimpleNamespace(index=0, id=f"call-{self.requests}" if n == 0 else None, function=function)
+                yield _chunk(tool_calls=[call])
+            return
+        for n in range(self.tokens):
+            yield _chunk(content=f"token{n} ")
+    
+    async def _stream(self, messages: List[Dict[str, Any]]):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        interval = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        for chunk in self._chunks(messages):
+            if interval:
+                await asyncio.sleep(interval)
+            yield chunk
+    
+    async def __call__(self, **kwargs):
+        self.requests += 1
+        return self._stream(kwargs["messages"])
+
+
+def write_plugin_tools(directory: str, count: int = 50, functions: int = 200) -> str:
+    """
+    Write `count` plugin tools to `directory/tools` with a config.yaml that
+    loads them: a manifest per tool and a handler module `bench_tool_NN`
+    per tool, each defining `functions` functions so importing it costs
+    about what a real handler module does. Run with `directory/tools` on
+    PYTHONPATH; returns that path.
+    """
+    tools_dir = os.path.join(directory, "tools")
+    os.makedirs(tools_dir, exist_ok=True)
+    with open(os.path.join(directory, "config.yaml"), "w") as f:
+        f.write("tool_dirs: [tools]\n")
+    body = "".join(
+        f"def helper_{n}(value):\n    return [value] * {n}\n\n" for n in range(functions)
+    )
+    for index in range(count):
+        name = f"bench_tool_{index:02d}"
+        with open(os.path.join(tools_dir, f"{name}.py"), "w") as f:
+            f.write(f"from urpe.tools import ToolResult\n\n{body}"
+                    f"def run(text):\n    return ToolResult(success=True, output=text)\n")
+        manifest = {
+            "name": name,
+            "description": f"Benchmark tool {index}",
+            "parameters": {"type": "object", "properties": {"text": {"type": "string"}}, "required": ["text"]},
+            "requires_confirmation": False,
+            "handler": f"{name}:run",
+        }
+        with open(os.path.join(tools_dir, f"{name}.json"), "w") as f:
+            json.dump(manifest, f)
+    return tools_dir
+
+
+class Timer:
+    """Context manager measuring elapsed wall time in milliseconds."""
+    
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.ms = (time.perf_counter() - self._start) * 1000
+
+
+class FakeLLMServer:
+    """
+    OpenAI-compatible chat completions endpoint streaming canned replies.
+    
+    Runs in a background thread; point LiteLLM at it with an `openai/` model
+    and `OPENAI_API_BASE=server.url`.
+    """
+    
+    def __init__(self, reply: str = "Hello from the fake model.", latency: float = 0.02, chunks: int = 8):
+        self.reply = reply
+        self.latency = latency
+        self.chunks = chunks
+        self.requests = 0
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+    
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+    
+    def _handler(self):
+        fake = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, *args):
+                pass
+            
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                fake.requests += 1
+                time.sleep(fake.latency)
+                
+                size = max(1, len(fake.reply) // fake.chunks)
+                pieces = [fake.reply[i:i + size] for i in range(0, len(fake.reply), size)]
+                events = [{"role": "assistant", "content": piece} for piece in pieces]
+                body = b""
+                for index, delta in enumerate(events + [{}]):
+                    chunk = {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion.chunk",
+                        "created": 0,
+                        "model": "fake",
+                        "choices": [{
+                            "index": 0,
+                            "delta": delta,
+                            "finish_reason": None if delta else "stop",
+                        }],
+                    }
+                    body += f"data: {json.dumps(chunk)}\n\n".encode()
+                body += b"data: [DONE]\n\n"
+                
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        
+        return Handler
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,274 @@
+"""
+Benchmark suite with JSON results for comparing commits.
+
+Runs the agent against FakeStreamingLLM (a deterministic local stand-in for
+the provider, patched in as litellm.acompletion so the scheduler and router
+are exercised too) and measures:
+
+  turn       per-turn overhead of Agent.process_message, text only and with
+             a tool call, and streaming throughput of a long reply
+  memory     MemoryStore insert and read throughput at several DB sizes
+  tools      ToolExecutor overhead over calling a handler directly
+  startup    CLI cold start in a fresh interpreter, also with 50 plugin tools
+
+Results go to benchmarks/results/<commit>.json. Pass --compare with an
+earlier result to print the change of every metric; the run exits non-zero
+if any got worse by more than --threshold.
+
+Usage:
+    python benchmarks/suite.py [--quick] [--only turn,memory] [--compare benchmarks/results/abc1234.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from common import FakeStreamingLLM, Timer, percentile, write_plugin_tools  # noqa: E402
+
+from urpe.agent import Agent  # noqa: E402
+from urpe.config import settings  # noqa: E402
+from urpe.memory.sqlite import MemoryStore  # noqa: E402
+from urpe.tools import ToolExecutor, ToolResult  # noqa: E402
+from urpe.tools.base import Tool, ToolRegistry  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+Metrics = Dict[str, float]
+
+
+def _noop_registry() -> ToolRegistry:
+    tool_registry = ToolRegistry()
+    tool_registry.register(
+        Tool(name="noop", description="Does nothing", parameters={"type": "object", "properties": {}},
+             requires_confirmation=False),
+        lambda **kwargs: ToolResult(success=True, output="ok"),
+    )
+    return tool_registry
+
+
+async def _turns(agent: Agent, count: int) -> list:
+    latencies = []
+    for turn in range(count):
+        with Timer() as t:
+            async for _ in agent.process_message(f"message {turn}"):
+                pass
+        latencies.append(t.ms)
+    return latencies
+
+
+async def bench_turn(quick: bool) -> Metrics:
+    turns = 100 if quick else 500
+    metrics = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = MemoryStore(db_path=os.path.join(tmpdir, "bench.db"))
+        executor = ToolExecutor(_noop_registry(), max_workers=2)
+
+        cases = {
+            "text": (FakeStreamingLLM(tokens=32), False),
+            "tool": (FakeStreamingLLM(tokens=32, tool_call=("noop", {"path": "."})), True),
+        }
+        for name, (fake, tools) in cases.items():
+            agent = Agent(model="fake", enable_tools=tools, memory_store=store, tool_executor=executor)
+            await agent.astart_conversation()
+            with patch("urpe.llm.acompletion", fake):
+                latencies = await _turns(agent, turns)
+            metrics[f"{name}_turn_p50_ms"] = percentile(latencies, 50)
+            metrics[f"{name}_turn_p95_ms"] = percentile(latencies, 95)
+
+        # One long reply: how fast the agent loop consumes chunks
+        tokens = 5_000 if quick else 50_000
+        agent = Agent(model="fake", enable_tools=False, memory_store=store)
+        await agent.astart_conversation()
+        with patch("urpe.llm.acompletion", FakeStreamingLLM(tokens=tokens)), Timer() as t:
+            await _turns(agent, 1)
+        metrics["stream_tokens_per_s"] = tokens / (t.ms / 1000)
+
+        executor.shutdown()
+        store.close()
+    return metrics
+
+
+def bench_memory(quick: bool) -> Metrics:
+    sizes = [0, 10_000] if quick else [0, 10_000, 100_000]
+    inserts = 200 if quick else 1000
+    metrics = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = MemoryStore(db_path=os.path.join(tmpdir, "bench.db"))
+            # Fill with 100-message conversations in bulk
+            for start in range(0, size, 100):
+                conversation_id = store.create_conversation()
+                store.add_messages([
+                    {"conversation_id": conversation_id, "role": "user", "content": f"filler {n} " + "lorem " * 20}
+                    for n in range(start, min(size, start + 100))
+                ])
+
+            conversation_id = store.create_conversation()
+            with Timer() as t:
+                for n in range(inserts):
+                    store.add_message(conversation_id, "user", f"message {n} " + "lorem ipsum " * 20)
+            metrics[f"insert_{size}_msgs_per_s"] = inserts / (t.ms / 1000)
+
+            reads = []
+            for _ in range(20 if quick else 100):
+                with Timer() as read:
+                    store.get_messages(conversation_id)
+                reads.append(read.ms)
+            metrics[f"read_{inserts}_at_{size}_p50_ms"] = percentile(reads, 50)
+            store.close()
+    return metrics
+
+
+async def bench_tools(quick: bool) -> Metrics:
+    calls = 1000 if quick else 10_000
+    tool_registry = _noop_registry()
+    handler = tool_registry.get_handler("noop")
+
+    async def async_noop(**kwargs):
+        return ToolResult(success=True, output="ok")
+
+    tool_registry.register(
+        Tool(name="async_noop", description="Does nothing", parameters={}, requires_confirmation=False),
+        async_noop,
+    )
+    executor = ToolExecutor(tool_registry, max_workers=2)
+
+    with Timer() as direct:
+        for _ in range(calls):
+            handler()
+    metrics = {"direct_call_us": direct.ms * 1000 / calls}
+    for name in ("noop", "async_noop"):
+        with Timer() as t:
+            for _ in range(calls):
+                await executor.execute(name, {})
+        metrics[f"execute_{name}_us"] = t.ms * 1000 / calls
+    executor.shutdown()
+    return metrics
+
+
+def bench_startup(quick: bool) -> Metrics:
+    runs = 3 if quick else 7
+    commands = {
+        "help": ["-m", "urpe.cli", "--help"],
+        "import_agent": ["-c", "import urpe.cli, urpe.agent"],
+    }
+    env = {k: v for k, v in os.environ.items() if not k.startswith("URPE_")}
+    metrics = {}
+
+    def measure(name, args, cwd, env):
+        samples = []
+        for _ in range(runs + 1):  # The first run warms bytecode caches
+            with Timer() as t:
+                subprocess.run([sys.executable, *args], cwd=cwd, env=env, capture_output=True, check=True)
+            samples.append(t.ms)
+        metrics[f"{name}_ms"] = statistics.median(samples[1:])
+
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, args in commands.items():
+            measure(name, args, cwd, env)
+    with tempfile.TemporaryDirectory() as cwd:
+        tools_dir = write_plugin_tools(cwd, 50)
+        plugin_env = {**env, "PYTHONPATH": os.pathsep.join(filter(None, [tools_dir, env.get("PYTHONPATH")]))}
+        measure("tools_50_plugins", ["-m", "urpe.cli", "tools"], cwd, plugin_env)
+    return metrics
+
+
+BENCHMARKS: Dict[str, Callable[[bool], object]] = {
+    "turn": bench_turn,
+    "memory": bench_memory,
+    "tools": bench_tools,
+    "startup": bench_startup,
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(__file__), capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_s")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Print each metric's change from `baseline`; return those that regressed."""
+    regressions = []
+    print(f"\n{'metric':<40} {baseline['commit']:>12} {current['commit']:>12} {'change':>9}")
+    for group, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            before = baseline["results"].get(group, {}).get(metric)
+            if not before:
+                continue
+            change = (value - before) / before
+            worse = -change if higher_is_better(metric) else change
+            flag = "  REGRESSION" if worse > threshold else ""
+            if flag:
+                regressions.append(f"{group}.{metric}")
+            print(f"{group + '.' + metric:<40} {before:>12.3f} {value:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations and smaller databases")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="Comma-separated benchmarks to run")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    # Replies must come from the fake provider, not the response cache
+    settings.llm_cache_enabled = False
+
+    commit = git_commit()
+    results = {}
+    for name in args.only.split(","):
+        started = time.perf_counter()
+        outcome = BENCHMARKS[name](args.quick)
+        if asyncio.iscoroutine(outcome):
+            outcome = asyncio.run(outcome)
+        results[name] = outcome
+        print(f"{name} ({time.perf_counter() - started:.1f} s)")
+        for metric, value in outcome.items():
+            print(f"  {metric:<38} {value:>12.3f}")
+
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
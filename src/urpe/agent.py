@@ -1,18 +1,40 @@
 """Core agent loop with tool calling support."""
 
+import asyncio
+import inspect
 import json
-from typing import List, Dict, Any, Optional, AsyncGenerator
+import time
+from contextlib import aclosing, asynccontextmanager
+from typing import List, Dict, Any, Optional, AsyncGenerator, AsyncIterator, Callable, Tuple, Union
 
 from rich.console import Console
 
-from urpe.llm import get_llm_response
-from urpe.tools import registry, ToolResult
-from urpe.memory import memory
+from urpe.context import ContextWindow, ContextSummary, get_tokenizer, llm_summarizer
+from urpe.llm import LLMLimiter, PRIORITY_BATCH, get_llm_response
+from urpe.streaming import ChunkCoalescer, StreamAccumulator, paced
+from urpe.tools import executor, ToolExecutor
+from urpe.memory import memory, MemoryStore, AsyncMemoryStore
+from urpe.prompt_cache import PromptPrefix, supports_prompt_caching, usage_tokens
 from urpe.config import settings
+from urpe.tracing import tracer
 
 console = Console()
 
 
+async def _call(method: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Call a memory store method without blocking the event loop: an async
+    store's coroutines are awaited, a sync store's methods run in a worker
+    thread.
+    """
+    if inspect.iscoroutinefunction(method):
+        return await method(*args, **kwargs)
+    value = await asyncio.to_thread(method, *args, **kwargs)
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
 class Agent:
     """AI Agent with tool calling and memory."""
     
@@ -20,140 +42,325 @@ class Agent:
         self,
         model: Optional[str] = None,
         enable_tools: bool = True,
+        context: Optional[ContextWindow] = None,
+        memory_store: Optional[Union[MemoryStore, AsyncMemoryStore]] = None,
+        tool_executor: Optional[ToolExecutor] = None,
+        llm_limiter: Optional[LLMLimiter] = None,
+        priority: int = PRIORITY_BATCH,
     ):
         self.model = model or settings.default_model
         self.enable_tools = enable_tools
+        self.context = context or self._default_context()
+        self.summary: Optional[ContextSummary] = None
+        self._memory = memory_store
+        self.executor = tool_executor or executor
+        self.llm_limiter = llm_limiter
+        # Scheduling priority of this agent's LLM requests (interactive first)
+        self.priority = priority
+        # Streamed text is merged into chunks of at most one per interval
+        self.coalesce_interval = settings.stream_coalesce_interval
+        self.coalesce_max_chars = settings.stream_coalesce_max_chars
         self.conversation_id: Optional[str] = None
+        # In-memory LLM context for the current conversation, kept in sync
+        # with MemoryStore so each turn doesn't re-read the full history.
+        self.messages: List[Dict[str, Any]] = []
+        # Prompt prefix the provider has cached for this conversation
+        self.prompt_prefix = PromptPrefix()
+        # Input tokens of the last turn, as reported by the provider
+        self.usage = {"prompt_tokens": 0, "cached_tokens": 0}
+        # ((registry, version), tokens) of the last tool schemas counted
+        self._tools_token_count: Optional[Tuple[Tuple[int, int], int]] = None
+    
+    @property
+    def memory(self) -> Union[MemoryStore, AsyncMemoryStore]:
+        """The memory store in use (the global store unless one was given)."""
+        return self._memory if self._memory is not None else memory
+    
+    def _default_context(self) -> ContextWindow:
+        """Build the context window configured in settings."""
+        summarizer = None
+        if settings.context_strategy == "summarize":
+            summarizer = llm_summarizer(self.model)
+        return ContextWindow(
+            max_tokens=settings.context_max_tokens,
+            strategy=settings.context_strategy,
+            pinned=settings.context_pinned_messages,
+            tokenizer=get_tokenizer(settings.context_tokenizer, self.model),
+            summarizer=summarizer,
+        )
+    
+    def _reset(self, conversation_id: str) -> str:
+        self.conversation_id = conversation_id
+        self.messages = []
+        self.summary = None
+        self.prompt_prefix = PromptPrefix()
+        return conversation_id
     
     def start_conversation(self) -> str:
         """Start a new conversation and return its ID."""
-        self.conversation_id = memory.create_conversation(model=self.model)
-        return self.conversation_id
+        conversation_id = self.memory.create_conversation(model=self.model)
+        if inspect.iscoroutine(conversation_id):
+            conversation_id.close()
+            raise TypeError("Use 'await agent.astart_conversation()' with an async memory store")
+        return self._reset(conversation_id)
+    
+    async def astart_conversation(self) -> str:
+        """Start a new conversation with either a sync or an async memory store."""
+        return self._reset(await _call(self.memory.create_conversation, model=self.model))
+    
+    async def resume_conversation(self, conversation_id: str) -> None:
+        """Resume an existing conversation, loading its history once."""
+        self._reset(conversation_id)
+        # Stored ready to send, tool calls and their ids included
+        self.messages = await _call(self.memory.get_llm_messages, conversation_id)
+        summary = await _call(self.memory.get_summary, conversation_id)
+        self.summary = ContextSummary(**summary) if summary else None
+    
+    async def _add_message(
+        self,
+        message: Dict[str, Any],
+        tool_calls: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """Append a message to the context and write it through to memory."""
+        self.messages.append(message)
+        await _call(
+            self.memory.add_message,
+            self.conversation_id,
+            message["role"],
+            message["content"],
+            tool_calls=tool_calls,
+            tool_call_id=message.get("tool_call_id"),
+        )
     
     def _get_tools_schema(self) -> Optional[List[Dict[str, Any]]]:
         """Get tool schemas if tools are enabled."""
         if not self.enable_tools:
             return None
-        return registry.get_schemas()
-    
-    def _execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> ToolResult:
-        """Execute a tool and return its result."""
-        handler = registry.get_handler(tool_name)
-        if not handler:
-            return ToolResult(
-                success=False,
-                output="",
-                error=f"Unknown tool: {tool_name}"
+        return self.executor.registry.get_schemas()
+    
+    def _tools_tokens(self, tools: Optional[List[Dict[str, Any]]]) -> int:
+        """Tokens taken by the tool schemas, which are sent with every call."""
+        if not tools:
+            return 0
+        key = (id(self.executor.registry), self.executor.registry.version)
+        if self._tools_token_count is None or self._tools_token_count[0] != key:
+            self._tools_token_count = (key, self.context.tokenizer.count(json.dumps(tools)))
+        return self._tools_token_count[1]
+    
+    async def _build_prompt(self, reserved_tokens: int) -> List[Dict[str, Any]]:
+        """Fit the conversation into the context window, persisting new summaries."""
+        result = await self.context.build(self.messages, self.summary, reserved_tokens)
+        if result.summary is not None and result.summary != self.summary:
+            self.summary = result.summary
+            await _call(
+                self.memory.save_summary,
+                self.conversation_id,
+                self.summary.content,
+                self.summary.covered_until,
             )
+        return result.messages
+    
+    @asynccontextmanager
+    async def _llm_stream(self, **kwargs) -> AsyncIterator[Any]:
+        """Call the LLM, through the limiter if there is one."""
+        if self.llm_limiter is None:
+            yield await get_llm_response(**kwargs)
+            return
+        async with self.llm_limiter.stream(get_llm_response, **kwargs) as response:
+            yield response
+    
+    async def abandon_turn(self) -> None:
+        """
+        Close out a turn that was interrupted.
         
-        try:
-            # Handle both sync and async handlers
-            result = handler(**arguments)
-            return result
-        except Exception as e:
-            return ToolResult(
-                success=False,
-                output="",
-                error=str(e)
-            )
+        Tool calls the model made but that never got a result are answered
+        with an error, so the history stays valid for the next turn.
+        """
+        answered = set()
+        pending = []
+        for message in reversed(self.messages):
+            if message["role"] == "tool":
+                answered.add(message["tool_call_id"])
+                continue
+            if message["role"] == "assistant":
+                pending = [tc for tc in message.get("tool_calls", []) if tc["id"] not in answered]
+            break
+        
+        for tc in pending:
+            await self._add_message({
+                "role": "tool",
+                "tool_call_id": tc["id"],
+                "content": "Error: cancelled",
+            })
+        
+        await self._flush_memory()
     
-    async def process_message(
-        self,
-        user_message: str,
-        stream: bool = True,
-    ) -> AsyncGenerator[str, None]:
+    async def _flush_memory(self):
+        """Write out what a write-behind store has queued."""
+        flush = getattr(self.memory, "aflush", None) or getattr(self.memory, "flush", None)
+        if flush:
+            await _call(flush)
+    
+    async def process_message(self, user_message: str) -> AsyncGenerator[str, None]:
         """
         Process a user message and yield response chunks.
         
         Handles tool calls in a loop until the model produces a final response.
         """
+        turn = tracer.span("agent.turn", model=self.model)
+        try:
+            async for text in self._process_message(user_message):
+                yield text
+        except BaseException as e:
+            turn.end(e)
+            raise
+        turn.end()
+    
+    async def _process_message(self, user_message: str) -> AsyncGenerator[str, None]:
         if not self.conversation_id:
-            self.start_conversation()
+            await self.astart_conversation()
         
         # Save user message
-        memory.add_message(self.conversation_id, "user", user_message)
-        
-        # Get conversation history
-        messages = memory.get_messages(self.conversation_id)
-        
-        # Convert to LiteLLM format
-        llm_messages = [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in messages
-        ]
+        await self._add_message({"role": "user", "content": user_message})
         
         tools = self._get_tools_schema()
+        reserved_tokens = self._tools_tokens(tools)
+        prompt_cache = supports_prompt_caching(self.model)
+        self.usage = {"prompt_tokens": 0, "cached_tokens": 0}
         
         while True:
-            # Call LLM
-            response = await get_llm_response(
-                model=self.model,
-                messages=llm_messages,
-                tools=tools,
-            )
-            
-            full_content = ""
-            tool_calls = []
+            with tracer.span("agent.build_prompt"):
+                messages = await self._build_prompt(reserved_tokens)
+            request_tools = tools
+            extra = {}
+            if prompt_cache:
+                messages, request_tools = self.prompt_prefix.prepare(messages, tools)
+                # Usage, with cached token counts, comes in the last chunk
+                extra["stream_options"] = {"include_usage": True}
+            accumulator = StreamAccumulator()
+            coalescer = ChunkCoalescer(self.coalesce_interval, self.coalesce_max_chars)
             
-            # Process streaming response
-            async for chunk in response:
-                if chunk.choices and chunk.choices[0].delta:
-                    delta = chunk.choices[0].delta
-                    
-                    # Accumulate content
-                    if delta.content:
-                        full_content += delta.content
-                        yield delta.content
-                    
-                    # Accumulate tool calls
-                    if delta.tool_calls:
-                        for tc in delta.tool_calls:
-                            if tc.index >= len(tool_calls):
-                                tool_calls.append({
-                                    "id": tc.id,
-                                    "name": tc.function.name if tc.function else "",
-                                    "arguments": ""
-                                })
-                            if tc.function and tc.function.arguments:
-                                tool_calls[tc.index]["arguments"] += tc.function.arguments
+            # Call LLM and process the streaming response. Time spent handling
+            # chunks is summed separately from time waiting for them.
+            timed = tracer.enabled
+            processing_ns = 0
+            chunks = 0
+            request = tracer.span("llm.request", model=self.model)
+            first_token = tracer.span("llm.first_token", activate=False, model=self.model)
+            async with request, self._llm_stream(
+                model=self.model,
+                messages=messages,
+                tools=request_tools,
+                priority=self.priority,
+                **extra,
+            ) as response, aclosing(paced(response, coalescer.due_in)) as stream:
+                async for chunk in stream:
+                    if chunk is None:
+                        # No chunk came before the buffered text was due
+                        if text := coalescer.flush():
+                            yield text
+                        continue
+                    if first_token is not None:
+                        first_token.end()
+                        first_token = None
+                    if timed:
+                        chunks += 1
+                        started_ns = time.perf_counter_ns()
+                    if prompt_cache and (usage := usage_tokens(chunk)):
+                        request.set(prompt_tokens=usage[0], cached_tokens=usage[1])
+                        self.usage["prompt_tokens"] += usage[0]
+                        self.usage["cached_tokens"] += usage[1]
+                    if chunk.choices and chunk.choices[0].delta:
+                        content = accumulator.add(chunk.choices[0].delta)
+                        if content and (text := coalescer.push(content)):
+                            if timed:
+                                processing_ns += time.perf_counter_ns() - started_ns
+                            yield text
+                            if timed:
+                                started_ns = time.perf_counter_ns()
+                    if timed:
+                        processing_ns += time.perf_counter_ns() - started_ns
+            tracer.record("agent.chunks", processing_ns, chunks=chunks)
+            if text := coalescer.flush():
+                yield text
+            full_content = accumulator.content
+            tool_calls = accumulator.tool_calls
             
             # If no tool calls, we're done
             if not tool_calls:
                 # Save assistant response
-                memory.add_message(self.conversation_id, "assistant", full_content)
+                await self._add_message({"role": "assistant", "content": full_content})
                 break
             
             # Process tool calls
-            memory.add_message(
-                self.conversation_id,
-                "assistant",
-                full_content,
-                tool_calls=tool_calls
+            await self._add_message(
+                {
+                    "role": "assistant",
+                    "content": full_content,
+                    "tool_calls": [
+                        {
+                            "id": tc["id"],
+                            "type": "function",
+                            "function": {"name": tc["name"], "arguments": tc["arguments"]},
+                        }
+                        for tc in tool_calls
+                    ],
+                },
+                tool_calls=tool_calls,
             )
             
+            # Arguments go as sent; the executor decodes and validates them,
+            # so a malformed call gets an error the model can act on
+            calls = []
             for tc in tool_calls:
-                try:
-                    args = json.loads(tc["arguments"])
-                except json.JSONDecodeError:
-                    args = {}
-                
+                calls.append((tc["name"], tc["arguments"]))
                 yield f"\n[Tool: {tc['name']}]\n"
-                
-                result = self._execute_tool(tc["name"], args)
-                
+            
+            # Independent calls run concurrently; results keep call order.
+            # Output from tools that stream it is yielded as it arrives.
+            output: asyncio.Queue = asyncio.Queue()
+            streamed = set()
+            
+            def on_output(index: int, text: str):
+                streamed.add(index)
+                output.put_nowait(text)
+            
+            with tracer.span("agent.tools", count=len(calls)):
+                # Created inside the span so tool spans become its children
+                execution = asyncio.ensure_future(self.executor.execute_many(
+                    calls, on_output=on_output, scope=self.conversation_id
+                ))
+                execution.add_done_callback(lambda _: output.put_nowait(None))
+                try:
+                    while (text := await output.get()) is not None:
+                        yield text
+                    results = execution.result()
+                finally:
+                    if not execution.done():
+                        # The turn was cancelled or abandoned; stop its tools
+                        # too (run_command kills the process group)
+                        execution.cancel()
+                        await asyncio.gather(execution, return_exceptions=True)
+            
+            for index, (tc, result) in enumerate(zip(tool_calls, results)):
                 # Add tool result to messages
                 tool_message = {
                     "role": "tool",
                     "tool_call_id": tc["id"],
                     "content": result.output if result.success else f"Error: {result.error}"
                 }
-                llm_messages.append(tool_message)
-                memory.add_message(
-                    self.conversation_id,
-                    "tool",
-                    tool_message["content"]
-                )
+                await self._add_message(tool_message)
                 
-                yield f"{tool_message['content']}\n"
+                if index not in streamed:
+                    yield f"{tool_message['content']}\n"
+                elif not result.success:
+                    yield f"\nError: {result.error}\n"
+                if result.cached:
+                    yield "[cached result of an identical earlier call]\n"
+                if result.truncated:
+                    yield f"[output truncated: {result.omitted_lines} lines, {result.omitted_bytes} bytes omitted]\n"
             
             # Continue loop to get model's response to tool results
+        
+        # Write-behind stores commit the whole turn in one transaction
+        await self._flush_memory()
@@ -0,0 +1,178 @@
+"""Run many prompts from a JSONL file with bounded parallelism."""
+
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO
+
+from urpe.sessions import SessionManager
+from urpe.tracing import percentile
+
+
+@dataclass
+class BatchItem:
+    """One prompt from the input file."""
+    id: str
+    prompt: Optional[str]
+    model: Optional[str] = None
+    error: Optional[str] = None  # Set when the input line couldn't be used
+
+
+@dataclass
+class BatchReport:
+    """Counts and per-item latencies of a batch run."""
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list)
+
+    @property
+    def processed(self) -> int:
+        return self.succeeded + self.failed
+
+    @property
+    def throughput(self) -> float:
+        """Items processed per second."""
+        return self.processed / self.seconds if self.seconds else 0.0
+
+    def percentile(self, pct: float) -> float:
+        """Nearest-rank percentile of item latency in milliseconds."""
+        return percentile(self.latencies_ms, pct)
+
+
+def read_items(lines: Iterable[str]) -> Iterator[BatchItem]:
+    """
+    Parse JSONL prompts lazily, one line at a time.
+
+    A line is either a JSON string (the prompt) or an object with "prompt"
+    and optional "id" and "model". Items without an id are numbered by line.
+    Lines that can't be parsed become items with `error` set.
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield BatchItem(id=str(number), prompt=None, error=f"Invalid JSON on line {number}: {e}")
+            continue
+        if isinstance(data, str):
+            data = {"prompt": data}
+        if not isinstance(data, dict) or not isinstance(data.get("prompt"), str):
+            yield BatchItem(id=str(number), prompt=None, error=f"No prompt on line {number}")
+            continue
+        yield BatchItem(id=str(data.get("id", number)), prompt=data["prompt"], model=data.get("model"))
+
+
+def completed_ids(path: str) -> Set[str]:
+    """
+    Ids that already have a successful result in an output file.
+
+    A line cut short by a crash is removed, so results can be appended
+    after it.
+    """
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size:
+            # Walk back to the last newline and drop anything after it
+            position = size
+            while position > 0:
+                step = min(4096, position)
+                f.seek(position - step)
+                block = f.read(step)
+                newline = block.rfind(b"\n")
+                if newline != -1:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position != size:
+                f.truncate(position)
+
+    done = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(result, dict) and "error" not in result:
+                done.add(str(result.get("id")))
+    return done
+
+
+async def run_batch(
+    items: Iterable[BatchItem],
+    output: TextIO,
+    manager: SessionManager,
+    concurrency: int = 8,
+    skip: Optional[Set[str]] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> BatchReport:
+    """
+    Run each item in a new conversation, `concurrency` at a time.
+
+    Items are pulled from `items` as workers free up, so the input is never
+    loaded whole. Each result is written to `output` as a JSON line as soon
+    as it is ready (in completion order, not input order):
+    {"id", "response", "conversation_id", "latency_ms"} or
+    {"id", "error", "latency_ms"}.
+
+    Args:
+        items: Prompts to run
+        output: Open text file results are appended to
+        manager: Hosts the conversations
+        concurrency: Items in flight at once
+        skip: Ids to leave out, e.g. those done before a crash
+        on_result: Called with each result after it is written
+    """
+    report = BatchReport()
+    skip = skip or set()
+    pending = iter(items)
+
+    async def run_item(item: BatchItem) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"id": item.id}
+        if item.error:
+            result["error"] = item.error
+        else:
+            try:
+                session = await manager.open(model=item.model)
+                try:
+                    chunks = [chunk async for chunk in session.send(item.prompt)]
+                finally:
+                    manager.drop(session.id)
+                result["response"] = "".join(chunks)
+                result["conversation_id"] = session.id
+            except Exception as e:
+                result["error"] = str(e)
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    async def worker():
+        # Workers share one iterator; next() never awaits, so no item is taken twice
+        for item in pending:
+            if item.id in skip:
+                report.skipped += 1
+                continue
+            result = await run_item(item)
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            if "error" in result:
+                report.failed += 1
+            else:
+                report.succeeded += 1
+                report.latencies_ms.append(result["latency_ms"])
+            if on_result:
+                on_result(result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    report.seconds = time.perf_counter() - start
+    return report
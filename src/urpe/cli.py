@@ -1,18 +1,28 @@
-"""Urpe Agent CLI - Typer commands."""
+"""Urpe Agent CLI - Typer commands.
+
+The agent, LiteLLM and SQLAlchemy are slow to import, so they are imported
+inside the commands that use them; `urpe --help` and `urpe tools` don't pay
+for them.
+"""
 
 import asyncio
+import contextlib
+import functools
 import os
+from typing import Optional
 
 import typer
 from rich.console import Console
-from rich.markdown import Markdown
+from rich.markup import escape
 from rich.prompt import Prompt
+from rich.table import Table
 from typing_extensions import Annotated
 
-from urpe.config import load_settings
-from urpe.agent import Agent
-from urpe.memory import memory
+from urpe.client import DaemonClient, DaemonError
+from urpe.config import load_settings, Settings
+from urpe.llm import PRIORITY_BATCH, PRIORITY_INTERACTIVE
 from urpe.tools import registry
+from urpe.tools.shell import ask_confirmation, confirm_command
 
 console = Console()
 app = typer.Typer(help="Urpe AI Agent CLI")
@@ -23,25 +33,127 @@ def run_async(coro):
     return asyncio.get_event_loop().run_until_complete(coro)
 
 
+def open_memory(settings: Settings):
+    """
+    Return the memory store for agent sessions: one that batches writes
+    on a background thread if enabled, else the async store, so neither
+    blocks the event loop.
+    """
+    from urpe.memory import memory, AsyncMemoryStore, WriteBehindStore
+    
+    if not settings.memory_write_behind:
+        return AsyncMemoryStore()
+    store = WriteBehindStore(
+        memory,
+        batch_size=settings.memory_batch_size,
+        flush_interval=settings.memory_flush_interval,
+    )
+    store.install_signal_handlers()
+    return store
+
+
+def start_tracing(settings: Settings):
+    """Record spans to the trace file if tracing is enabled."""
+    if settings.trace_enabled:
+        from urpe.tracing import tracer
+        
+        tracer.configure(settings.trace_path)
+
+
+async def confirm(command: str) -> bool:
+    """Ask whether a command may run, through the prompt the current reply set up, if any."""
+    return await (confirm_command.get() or ask_confirmation)(command)
+
+
+@contextlib.contextmanager
+def confirming_over(stream):
+    """Pause `stream`'s live region while command confirmations are asked."""
+    token = confirm_command.set(stream.pausing(ask_confirmation))
+    try:
+        yield stream
+    finally:
+        confirm_command.reset(token)
+
+
+def open_session(
+    settings: Settings,
+    model: str,
+    enable_tools: bool,
+    use_daemon: bool = True,
+    priority: int = PRIORITY_BATCH,
+    conversation_id: Optional[str] = None,
+):
+    """
+    Return a function that streams the agent's reply to a message.
+    
+    Goes through the daemon (`urpe serve`) when one is running, otherwise
+    runs an agent in this process. With `conversation_id`, that
+    conversation is continued instead of starting a new one.
+    """
+    if use_daemon:
+        client = run_async(DaemonClient.connect(settings.server_socket))
+        if client is not None:
+            if conversation_id:
+                try:
+                    run_async(client.resume(conversation_id))
+                except DaemonError as e:
+                    console.print(f"[bold red]Error:[/bold red] {escape(str(e))}")
+                    raise typer.Exit(1)
+            return functools.partial(
+                client.send_message,
+                model=model,
+                enable_tools=enable_tools,
+                confirm=confirm,
+                priority=priority,
+            )
+    
+    if not settings.gemini_api_key:
+        console.print("[bold red]Error:[/bold red] GEMINI_API_KEY environment variable not set.")
+        raise typer.Exit(1)
+    
+    from urpe.agent import Agent
+    
+    start_tracing(settings)
+    agent = Agent(
+        model=model,
+        enable_tools=enable_tools,
+        memory_store=open_memory(settings),
+        priority=priority,
+    )
+    if conversation_id:
+        run_async(agent.resume_conversation(conversation_id))
+        if not agent.messages:
+            console.print(f"[bold red]Error:[/bold red] no conversation {escape(conversation_id)} to resume.")
+            raise typer.Exit(1)
+    return agent.process_message
+
+
 @app.command()
 def chat(
     model: Annotated[str, typer.Option(help="LLM model to use")] = None,
     no_tools: Annotated[bool, typer.Option("--no-tools", help="Disable tool usage")] = False,
+    no_daemon: Annotated[bool, typer.Option("--no-daemon", help="Don't use a running daemon")] = False,
+    resume: Annotated[str, typer.Option("--resume", help="Continue the conversation with this ID")] = None,
 ):
     """
     Start an interactive chat session with the Urpe agent.
     """
-    settings = load_settings(os.getenv("URPE_CONFIG_PATH"))
-    
-    if not settings.gemini_api_key:
-        console.print("[bold red]Error:[/bold red] GEMINI_API_KEY environment variable not set.")
-        raise typer.Exit(1)
+    from urpe.render import MarkdownStream
     
+    settings = load_settings(os.getenv("URPE_CONFIG_PATH"))
     model = model or settings.default_model
-    agent = Agent(model=model, enable_tools=not no_tools)
-    agent.start_conversation()
+    send_message = open_session(
+        settings,
+        model,
+        enable_tools=not no_tools,
+        use_daemon=not no_daemon,
+        priority=PRIORITY_INTERACTIVE,
+        conversation_id=resume,
+    )
     
     console.print(f"[bold green]Urpe Agent[/bold green] - Model: [cyan]{model}[/cyan]")
+    if resume:
+        console.print(f"Resuming conversation [cyan]{escape(resume)}[/cyan]")
     console.print(f"Tools: {'[red]disabled[/red]' if no_tools else '[green]enabled[/green]'}")
     console.print("[dim]Type 'exit' or 'quit' to end the session.[/dim]\n")
     
@@ -56,18 +168,18 @@ def chat(
             if not user_input.strip():
                 continue
             
-            console.print("[bold green]Agent[/bold green]: ", end="")
+            console.print("[bold green]Agent[/bold green]:")
             
             async def stream_response():
-                full_response = ""
-                async for chunk in agent.process_message(user_input):
-                    console.print(chunk, end="")
-                    full_response += chunk
-                return full_response
+                with MarkdownStream(console) as stream, confirming_over(stream):
+                    async for chunk in send_message(user_input):
+                        stream.feed(chunk)
             
             run_async(stream_response())
-            console.print("\n")
+            console.print()
             
+        except DaemonError as e:
+            console.print(f"\n[red]Daemon error: {escape(str(e))}[/red]\n")
         except KeyboardInterrupt:
             console.print("\n[dim]Interrupted. Type 'exit' to quit.[/dim]")
 
@@ -77,39 +189,141 @@ def ask(
     question: Annotated[str, typer.Argument(help="Question to ask the Urpe agent")],
     model: Annotated[str, typer.Option(help="LLM model to use")] = None,
     no_tools: Annotated[bool, typer.Option("--no-tools", help="Disable tool usage")] = False,
+    no_daemon: Annotated[bool, typer.Option("--no-daemon", help="Don't use a running daemon")] = False,
 ):
     """
     Ask the Urpe agent a one-shot question.
     """
+    from rich.spinner import Spinner
+    from urpe.render import MarkdownStream
+    
     settings = load_settings(os.getenv("URPE_CONFIG_PATH"))
+    model = model or settings.default_model
+    send_message = open_session(settings, model, enable_tools=not no_tools, use_daemon=not no_daemon)
     
+    async def stream_response():
+        # The spinner shows until the first text arrives
+        thinking = Spinner("dots", text="[bold green]Thinking...[/bold green]", style="green")
+        with MarkdownStream(console, placeholder=thinking) as stream, confirming_over(stream):
+            async for chunk in send_message(question):
+                stream.feed(chunk)
+    
+    try:
+        run_async(stream_response())
+    except DaemonError as e:
+        console.print(f"[bold red]Daemon error:[/bold red] {escape(str(e))}")
+        raise typer.Exit(1)
+
+
+@app.command()
+def batch(
+    input_path: Annotated[str, typer.Argument(help="JSONL file of prompts (strings or {\"id\", \"prompt\", \"model\"})")],
+    output: Annotated[str, typer.Option("--output", "-o", help="JSONL file results are written to")] = "results.jsonl",
+    concurrency: Annotated[int, typer.Option(help="Prompts to run at once")] = 8,
+    model: Annotated[str, typer.Option(help="LLM model to use")] = None,
+    tools: Annotated[bool, typer.Option("--tools", help="Let the agent use tools")] = False,
+    resume: Annotated[bool, typer.Option("--resume", help="Skip prompts that already have a result in the output")] = False,
+):
+    """
+    Run every prompt in a JSONL file, writing results as they finish.
+    """
+    from urpe.batch import completed_ids, read_items, run_batch
+    from urpe.sessions import SessionManager
+    
+    settings = load_settings(os.getenv("URPE_CONFIG_PATH"))
     if not settings.gemini_api_key:
         console.print("[bold red]Error:[/bold red] GEMINI_API_KEY environment variable not set.")
         raise typer.Exit(1)
+    if os.path.exists(output) and os.path.getsize(output) and not resume:
+        console.print(f"[bold red]Error:[/bold red] {output} already has results; use --resume to continue it.")
+        raise typer.Exit(1)
     
-    model = model or settings.default_model
-    agent = Agent(model=model, enable_tools=not no_tools)
-    
-    with console.status("[bold green]Thinking...[/bold green]", spinner="dots"):
-        async def get_response():
-            full_response = ""
-            async for chunk in agent.process_message(question):
-                full_response += chunk
-            return full_response
+    start_tracing(settings)
+    done = completed_ids(output) if resume else set()
+    manager = SessionManager(
+        memory_store=open_memory(settings),
+        model=model or settings.default_model,
+        enable_tools=tools,
+        max_sessions=max(concurrency, settings.server_max_conversations),
+        max_llm_calls=concurrency,
+        max_tool_calls=settings.session_max_tool_calls,
+    )
+    counts = {"ok": 0, "failed": 0}
+    
+    with open(input_path, encoding="utf-8") as lines, open(output, "a", encoding="utf-8") as results, \
+            console.status("[bold green]Running batch...[/bold green]", spinner="dots") as status:
+        def on_result(result):
+            counts["failed" if "error" in result else "ok"] += 1
+            status.update(f"[bold green]Running batch...[/bold green] {counts['ok']} done, {counts['failed']} failed")
         
-        response = run_async(get_response())
+        async def run():
+            try:
+                return await run_batch(
+                    read_items(lines), results, manager,
+                    concurrency=concurrency, skip=done, on_result=on_result,
+                )
+            finally:
+                await manager.close()
+        
+        report = run_async(run())
+    
+    console.print(f"[bold]Batch finished[/bold] in {report.seconds:.1f}s -> [cyan]{output}[/cyan]")
+    console.print(f"  Succeeded: {report.succeeded}  Failed: {report.failed}  Skipped: {report.skipped}")
+    console.print(f"  Throughput: {report.throughput:.2f} prompts/s")
+    console.print(
+        f"  Latency: p50 {report.percentile(50):.0f} ms | p95 {report.percentile(95):.0f} ms | "
+        f"p99 {report.percentile(99):.0f} ms"
+    )
+    if report.failed:
+        raise typer.Exit(1)
+
+
+@app.command()
+def serve(
+    socket: Annotated[str, typer.Option(help="Unix socket to listen on")] = None,
+):
+    """
+    Run the agent as a daemon that `urpe ask` and `urpe chat` connect to.
+    """
+    from urpe.server import serve as serve_forever
+    
+    settings = load_settings(os.getenv("URPE_CONFIG_PATH"))
+    socket = socket or settings.server_socket
+    
+    if not hasattr(asyncio, "start_unix_server"):
+        console.print("[bold red]Error:[/bold red] the daemon needs Unix domain sockets.")
+        raise typer.Exit(1)
+    if not settings.gemini_api_key:
+        console.print("[bold red]Error:[/bold red] GEMINI_API_KEY environment variable not set.")
+        raise typer.Exit(1)
     
-    console.print(Markdown(response))
+    start_tracing(settings)
+    console.print(f"[bold green]Urpe daemon[/bold green] listening on [cyan]{socket}[/cyan] (Ctrl+C to stop)")
+    try:
+        asyncio.run(serve_forever(
+            socket,
+            memory_store=open_memory(settings),
+            max_conversations=settings.server_max_conversations,
+            max_llm_calls=settings.session_max_llm_calls,
+            max_tool_calls=settings.session_max_tool_calls,
+            max_queued_turns=settings.session_max_queued_turns,
+        ))
+    except RuntimeError as e:
+        console.print(f"[bold red]Error:[/bold red] {e}")
+        raise typer.Exit(1)
 
 
 @app.command()
 def history(
     limit: Annotated[int, typer.Option(help="Number of conversations to show")] = 10,
     conversation_id: Annotated[str, typer.Option("--id", help="Show messages for a specific conversation ID")] = None,
+    before: Annotated[str, typer.Option(help="Cursor printed at the end of the previous page")] = None,
 ):
     """
     View past conversations.
     """
+    from urpe.memory import memory
+    
     if conversation_id:
         conv = memory.get_conversation(conversation_id)
         if not conv:
@@ -123,7 +337,11 @@ def history(
             role_color = {"user": "blue", "assistant": "green", "tool": "yellow"}.get(msg["role"], "white")
             console.print(f"[bold {role_color}]{msg['role'].upper()}[/bold {role_color}]: {msg['content']}\n")
     else:
-        conversations = memory.get_conversations(limit=limit)
+        try:
+            conversations = memory.get_conversations(limit=limit, before=before)
+        except ValueError as e:
+            console.print(f"[red]{e}[/red]")
+            raise typer.Exit(1)
         
         if not conversations:
             console.print("[dim]No conversations found.[/dim]")
@@ -133,6 +351,123 @@ def history(
         
         for conv in conversations:
             console.print(f"  [cyan]{conv['id'][:8]}...[/cyan] | {conv['created_at'][:10]} | {conv['message_count']} messages | {conv['model'] or 'default'}")
+        
+        if len(conversations) == limit:
+            console.print(f"\n[dim]Next page: urpe history --limit {limit} --before '{conversations[-1]['cursor']}'[/dim]")
+
+
+@app.command()
+def search(
+    query: Annotated[str, typer.Argument(help="Words to search for in past messages")],
+    limit: Annotated[int, typer.Option(help="Maximum number of results")] = 20,
+    raw: Annotated[bool, typer.Option("--raw", help="Use FTS5 query syntax (AND/OR/NEAR, prefix*)")] = False,
+):
+    """
+    Search past conversations.
+    """
+    from sqlalchemy.exc import OperationalError
+    from urpe.memory import memory
+    
+    try:
+        results = memory.search(query, limit=limit, raw=raw, start_mark="\x01", end_mark="\x02")
+    except OperationalError as e:
+        console.print(f"[red]Invalid search query: {e.orig}[/red]")
+        raise typer.Exit(1)
+    
+    if not results:
+        console.print("[dim]No matches found.[/dim]")
+        return
+    
+    for result in results:
+        role_color = {"user": "blue", "assistant": "green", "tool": "yellow"}.get(result["role"], "white")
+        snippet = escape(" ".join(result["snippet"].split())).replace("\x01", "[bold yellow]").replace("\x02", "[/bold yellow]")
+        console.print(
+            f"  [cyan]{result['conversation_id']}[/cyan] | {result['created_at'][:10]} | "
+            f"[{role_color}]{result['role']}[/{role_color}]: {snippet}"
+        )
+
+
+@app.command()
+def reindex():
+    """
+    Rebuild the search index from stored messages.
+    """
+    from urpe.memory import memory
+    
+    with console.status("[bold green]Rebuilding search index...[/bold green]", spinner="dots"):
+        memory.rebuild_search_index()
+    console.print("[green]Search index rebuilt.[/green]")
+
+
+@app.command()
+def cache(
+    clear: Annotated[bool, typer.Option("--clear", help="Delete all cached responses")] = False,
+):
+    """
+    Show LLM response cache statistics.
+    """
+    from urpe.llm_cache import ResponseCache
+    
+    settings = load_settings(os.getenv("URPE_CONFIG_PATH"))
+    response_cache = ResponseCache(
+        db_path=settings.llm_cache_path,
+        ttl=settings.llm_cache_ttl,
+        max_disk_entries=settings.llm_cache_max_disk_entries,
+    )
+    if clear:
+        response_cache.clear()
+        console.print("[green]Response cache cleared.[/green]")
+        return
+
+    stats = response_cache.disk_stats()
+    status = "[green]enabled[/green]" if settings.llm_cache_enabled else "[red]disabled[/red]"
+    console.print(f"[bold]Response cache:[/bold] {status} ({settings.llm_cache_path})")
+    console.print(f"  Entries: {stats['entries']} / {settings.llm_cache_max_disk_entries}")
+    console.print(f"  Hits: {stats['hits']}")
+
+
+@app.command()
+def stats(
+    path: Annotated[str, typer.Option(help="Trace file to summarize")] = None,
+):
+    """
+    Show per-phase latency percentiles from recorded traces.
+    """
+    from urpe.tracing import summarize
+    
+    settings = load_settings(os.getenv("URPE_CONFIG_PATH"))
+    path = path or settings.trace_path
+    if not os.path.exists(path):
+        console.print(f"[dim]No traces at {path}. Set URPE_TRACE=1 to record them.[/dim]")
+        return
+    
+    summary = summarize(path)
+    if not summary:
+        console.print(f"[dim]No spans in {path}.[/dim]")
+        return
+    
+    table = Table(title=f"Spans in {path}")
+    table.add_column("Phase", style="cyan")
+    for column in ("Count", "Total ms", "p50 ms", "p95 ms", "p99 ms"):
+        table.add_column(column, justify="right")
+    for name, phase in sorted(summary.items(), key=lambda item: -item[1]["total_ms"]):
+        table.add_row(
+            name,
+            str(phase["count"]),
+            f"{phase['total_ms']:.1f}",
+            f"{phase['p50_ms']:.2f}",
+            f"{phase['p95_ms']:.2f}",
+            f"{phase['p99_ms']:.2f}",
+        )
+    console.print(table)
+    
+    prompt_tokens = sum(phase.get("prompt_tokens", 0) for phase in summary.values())
+    if prompt_tokens:
+        cached_tokens = sum(phase.get("cached_tokens", 0) for phase in summary.values())
+        console.print(
+            f"Input tokens: {prompt_tokens} ({cached_tokens} cached, "
+            f"{prompt_tokens - cached_tokens} uncached, {cached_tokens / prompt_tokens:.0%} from cache)"
+        )
 
 
 @app.command()
@@ -0,0 +1,155 @@
+"""Client for the agent daemon started with `urpe serve`.
+
+The daemon speaks JSON lines over a Unix domain socket. A request is
+
+    {"op": "message", "message": ..., "model": ..., "tools": true,
+     "conversation_id": null, "cwd": "/path", "priority": 0}
+
+and the reply is a sequence of `{"chunk": text}` lines ending with
+`{"done": true, "conversation_id": ...}` or `{"error": ...}`. When a tool
+needs confirmation the daemon sends `{"confirm": command}` and waits for
+`{"allow": bool}`. `{"op": "ping"}` is answered with `{"ok": true, "pid": ...}`.
+`{"op": "resume", "conversation_id": ...}` loads a stored conversation,
+answering `{"ok": true, ...}` or `{"error": ...}` if there is none.
+`{"op": "cancel", "conversation_id": ...}` stops that conversation's running
+turn (its reply ends with `{"error": "Cancelled"}`), and `{"op": "stats"}`
+reports how many sessions and LLM calls are active and, per model, the
+request queue depth, wait times and time to first token.
+
+This module only needs asyncio, so the CLI can check for a daemon without
+importing the agent.
+"""
+
+import asyncio
+import json
+import os
+import sys
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional
+
+# Lines carry whole tool outputs, so allow more than asyncio's 64 KiB default
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+class DaemonError(Exception):
+    """The daemon reported an error or went away mid-request."""
+
+
+async def read_json(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    """Read one JSON line, or return None at end of stream."""
+    line = await reader.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+async def write_json(writer: asyncio.StreamWriter, payload: Dict[str, Any]):
+    """Write one JSON line and wait until it is sent."""
+    writer.write(json.dumps(payload).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+class DaemonClient:
+    """Connection to a running daemon; keeps track of the conversation."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self.conversation_id: Optional[str] = None
+
+    @classmethod
+    async def connect(cls, socket_path: str) -> Optional["DaemonClient"]:
+        """Connect to the daemon, or return None if none is running."""
+        if sys.platform == "win32" or not os.path.exists(socket_path):
+            return None
+        try:
+            reader, writer = await asyncio.open_unix_connection(socket_path, limit=STREAM_LIMIT)
+        except OSError:
+            return None
+        return cls(reader, writer)
+
+    async def ping(self) -> Dict[str, Any]:
+        """Check that the daemon is responsive."""
+        await write_json(self._writer, {"op": "ping"})
+        reply = await read_json(self._reader)
+        if reply is None:
+            raise DaemonError("Daemon closed the connection")
+        return reply
+
+    async def resume(self, conversation_id: str):
+        """Continue a stored conversation; raises DaemonError if the daemon has no such conversation."""
+        await write_json(self._writer, {"op": "resume", "conversation_id": conversation_id})
+        reply = await read_json(self._reader)
+        if reply is None:
+            raise DaemonError("Daemon closed the connection")
+        if "error" in reply:
+            raise DaemonError(reply["error"])
+        self.conversation_id = reply["conversation_id"]
+
+    async def cancel(self, conversation_id: str) -> bool:
+        """Cancel a conversation's running turn; returns False if there was none."""
+        await write_json(self._writer, {"op": "cancel", "conversation_id": conversation_id})
+        reply = await read_json(self._reader)
+        if reply is None:
+            raise DaemonError("Daemon closed the connection")
+        return reply.get("cancelled", False)
+
+    async def send_message(
+        self,
+        message: str,
+        model: Optional[str] = None,
+        enable_tools: bool = True,
+        confirm: Optional[Callable[[str], Awaitable[bool]]] = None,
+        priority: Optional[int] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Send a message in the current conversation and yield response chunks.
+
+        Args:
+            message: The user message
+            model: Model to use (default: the daemon's)
+            enable_tools: Whether the agent may call tools
+            confirm: Asks the user whether a command may run; without it
+                commands that need confirmation are denied
+            priority: Scheduling priority of the turn's LLM requests
+                (urpe.llm.PRIORITY_INTERACTIVE or PRIORITY_BATCH)
+        """
+        await write_json(self._writer, {
+            "op": "message",
+            "message": message,
+            "model": model,
+            "tools": enable_tools,
+            "conversation_id": self.conversation_id,
+            "cwd": os.getcwd(),
+            "priority": priority,
+        })
+        finished = False
+        try:
+            while True:
+                reply = await read_json(self._reader)
+                if reply is None:
+                    raise DaemonError("Daemon closed the connection")
+                if "chunk" in reply:
+                    yield reply["chunk"]
+                elif "confirm" in reply:
+                    allowed = await confirm(reply["confirm"]) if confirm else False
+                    await write_json(self._writer, {"allow": allowed})
+                elif "error" in reply:
+                    finished = True
+                    raise DaemonError(reply["error"])
+                elif reply.get("done"):
+                    finished = True
+                    self.conversation_id = reply["conversation_id"]
+                    return
+        finally:
+            if not finished:
+                # The rest of the reply is still in flight, so the
+                # connection can't be reused
+                self._writer.close()
+
+    async def close(self):
+        """Close the connection."""
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
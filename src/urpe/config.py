@@ -2,11 +2,13 @@
 
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
 import yaml
 from pydantic import BaseModel, Field
 
+from urpe.lazy import LazyObject
+
 
 class Settings(BaseModel):
     """Application settings."""
@@ -14,13 +16,62 @@ class Settings(BaseModel):
     # LLM settings
     default_model: str = Field(default="gemini/gemini-2.0-flash")
     gemini_api_key: Optional[str] = None
+    llm_cache_enabled: bool = Field(default=False)
+    llm_cache_path: str = Field(default="data/llm_cache.db")
+    llm_cache_ttl: float = Field(default=86_400)  # seconds
+    llm_cache_max_memory_entries: int = Field(default=256)
+    llm_cache_max_disk_entries: int = Field(default=10_000)
+    llm_rpm: Optional[float] = None  # Requests per minute per model, None for no limit
+    llm_tpm: Optional[float] = None  # Prompt tokens per minute per model
+    llm_rate_limits: Dict[str, Dict[str, float]] = Field(default_factory=dict)  # model -> {rpm, tpm}
+    llm_max_retries: int = Field(default=4)
+    llm_backoff: float = Field(default=1.0)  # seconds, doubled per retry
+    llm_max_backoff: float = Field(default=60.0)
+    llm_coalesce: bool = Field(default=True)
+    llm_fallbacks: List[str] = Field(default_factory=list)  # Tried in order when a model fails or stalls
+    llm_ttft_timeout: Optional[float] = None  # seconds to first token before falling back
+    llm_hedge: bool = Field(default=False)
+    llm_hedge_percentile: float = Field(default=95)
+    llm_hedge_delay: float = Field(default=2.0)  # seconds, until enough latencies are recorded
+    llm_prompt_cache: Optional[bool] = None  # Mark prompt prefixes for provider caching; None asks LiteLLM per model
+    stream_coalesce_interval: float = Field(default=0.03)  # seconds between streamed chunks, 0 to pass each through
+    stream_coalesce_max_chars: int = Field(default=4096)
     
     # Memory settings  
     db_path: str = Field(default="data/urpe.db")
+    memory_write_behind: bool = Field(default=True)
+    memory_batch_size: int = Field(default=64)
+    memory_flush_interval: float = Field(default=1.0)  # seconds
+    
+    # Context window settings
+    context_max_tokens: int = Field(default=100_000)
+    context_strategy: str = Field(default="sliding_window")  # or "summarize"
+    context_pinned_messages: int = Field(default=1)
+    context_tokenizer: str = Field(default="approx")  # or "litellm"
     
     # Tool settings
     tools_require_confirmation: bool = Field(default=True)
     command_timeout: int = Field(default=30)
+    command_max_output_bytes: int = Field(default=64_000)
+    command_max_output_lines: int = Field(default=2_000)
+    tool_plugins: bool = Field(default=True)  # Load tools from "urpe.tools" entry points and tool_dirs
+    tool_dirs: List[str] = Field(default_factory=list)  # Directories of tool manifests (*.yaml, *.json)
+    tool_cache_enabled: bool = Field(default=True)  # Reuse results of idempotent tools within a conversation
+    tool_cache_ttl: float = Field(default=300)  # seconds
+    tool_cache_max_entries: int = Field(default=256)  # per conversation
+    
+    # Daemon settings
+    server_socket: str = Field(default="data/urpe.sock")
+    server_max_conversations: int = Field(default=256)
+    
+    # Concurrent session limits (shared by all conversations in a process)
+    session_max_llm_calls: int = Field(default=8)
+    session_max_tool_calls: int = Field(default=8)
+    session_max_queued_turns: int = Field(default=1024)
+    
+    # Tracing (spans written as JSON lines, summarized by `urpe stats`)
+    trace_enabled: bool = Field(default=False)
+    trace_path: str = Field(default="data/traces.jsonl")
 
 
 def load_settings(config_path: Optional[str] = None) -> Settings:
@@ -49,6 +100,10 @@ def load_settings(config_path: Optional[str] = None) -> Settings:
     env_mapping = {
         "URPE_MODEL": "default_model",
         "URPE_DB_PATH": "db_path",
+        "URPE_CONTEXT_MAX_TOKENS": "context_max_tokens",
+        "URPE_LLM_CACHE": "llm_cache_enabled",
+        "URPE_SOCKET": "server_socket",
+        "URPE_TRACE": "trace_enabled",
         "GEMINI_API_KEY": "gemini_api_key",
     }
     
@@ -60,5 +115,5 @@ def load_settings(config_path: Optional[str] = None) -> Settings:
     return Settings(**settings_dict)
 
 
-# Default settings instance
-settings = load_settings()
+# Default settings instance, loaded on first use
+settings = LazyObject(load_settings)
@@ -0,0 +1,248 @@
+"""Token-budgeted context window management."""
+
+import json
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Protocol, Callable, Awaitable
+
+from pydantic import BaseModel
+
+# Fixed per-message overhead (role, separators) added by chat templates
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below so it can replace the original messages "
+    "as context. Keep facts, decisions, file names, commands and open questions. "
+    "Be concise."
+)
+
+
+class Tokenizer(Protocol):
+    """Anything that can count tokens in a piece of text."""
+
+    def count(self, text: str) -> int:
+        ...
+
+
+class ApproxTokenizer:
+    """Cheap tokenizer assuming ~4 characters per token."""
+
+    def count(self, text: str) -> int:
+        return (len(text) + 3) // 4
+
+
+class LiteLLMTokenizer:
+    """Model-aware tokenizer backed by litellm.token_counter."""
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def count(self, text: str) -> int:
+        from litellm import token_counter
+
+        return token_counter(model=self.model, text=text)
+
+
+class CachedTokenizer:
+    """Memoizes token counts, since the same messages are counted every turn."""
+
+    def __init__(self, tokenizer: Tokenizer, maxsize: int = 4096):
+        self.tokenizer = tokenizer
+        self.count = lru_cache(maxsize=maxsize)(tokenizer.count)
+
+
+def get_tokenizer(name: str, model: str) -> CachedTokenizer:
+    """Build a cached tokenizer by name ("approx" or "litellm")."""
+    if name == "approx":
+        return CachedTokenizer(ApproxTokenizer())
+    if name == "litellm":
+        return CachedTokenizer(LiteLLMTokenizer(model))
+    raise ValueError(f"Unknown tokenizer: {name}")
+
+
+class ContextSummary(BaseModel):
+    """Rolling summary of messages evicted from the context window."""
+    content: str
+    covered_until: int  # Messages before this index are covered by the summary
+
+
+class ContextResult(BaseModel):
+    """Prompt messages produced by ContextWindow.build."""
+    messages: List[Dict[str, Any]]
+    tokens: int
+    summary: Optional[ContextSummary] = None
+
+
+Summarizer = Callable[[Optional[str], List[Dict[str, Any]]], Awaitable[str]]
+
+
+class ContextWindow:
+    """
+    Fits conversation history into a token budget.
+
+    System messages and the first `pinned` messages are always kept.
+    Strategies for the rest:
+    - "sliding_window": keep the most recent messages that fit.
+    - "summarize": like sliding_window, but evicted messages are folded into
+      a rolling summary that is kept as a system message.
+    """
+
+    STRATEGIES = ("sliding_window", "summarize")
+
+    def __init__(
+        self,
+        max_tokens: int,
+        strategy: str = "sliding_window",
+        pinned: int = 1,
+        tokenizer: Optional[CachedTokenizer] = None,
+        summarizer: Optional[Summarizer] = None,
+        target_ratio: float = 0.75,
+    ):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown context strategy: {strategy}")
+        if strategy == "summarize" and summarizer is None:
+            raise ValueError("The summarize strategy requires a summarizer")
+
+        self.max_tokens = max_tokens
+        self.strategy = strategy
+        self.pinned = pinned
+        self.tokenizer = tokenizer or CachedTokenizer(ApproxTokenizer())
+        self.summarizer = summarizer
+        # When summarizing, trim to this fraction of the budget so the
+        # summary is not recomputed on every subsequent turn.
+        self.target_ratio = target_ratio
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        """Count tokens in a single message."""
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.tokenizer.count(message.get("content") or "")
+        if message.get("tool_calls"):
+            tokens += self.tokenizer.count(json.dumps(message["tool_calls"]))
+        return tokens
+
+    def count_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Count tokens in a list of messages."""
+        return sum(self.count_message(msg) for msg in messages)
+
+    def _window_start(self, messages: List[Dict[str, Any]], counts: List[int], start: int, budget: int) -> int:
+        """Find the earliest index >= start whose suffix fits in the budget."""
+        total = 0
+        index = len(messages)
+        while index > start and total + counts[index - 1] <= budget:
+            index -= 1
+            total += counts[index]
+        # Never open the window on tool results orphaned from their tool call
+        while index < len(messages) and messages[index]["role"] == "tool":
+            index += 1
+        return index
+
+    async def build(
+        self,
+        messages: List[Dict[str, Any]],
+        summary: Optional[ContextSummary] = None,
+        reserved_tokens: int = 0,
+    ) -> ContextResult:
+        """
+        Build the prompt messages for the next LLM call.
+
+        Args:
+            messages: Full conversation history
+            summary: Previously stored summary, if any
+            reserved_tokens: Budget taken by other prompt parts (e.g. tools)
+
+        Returns:
+            ContextResult with the prompt and the (possibly updated) summary
+        """
+        counts = [self.count_message(msg) for msg in messages]
+        total = sum(counts)
+        budget = self.max_tokens - reserved_tokens
+
+        if total <= budget and summary is None:
+            return ContextResult(messages=list(messages), tokens=total)
+
+        pinned_end = min(self.pinned, len(messages))
+        pinned = list(messages[:pinned_end])
+        # System messages are pinned wherever they are
+        pinned += [msg for msg in messages[pinned_end:] if msg["role"] == "system"]
+        pinned_tokens = self.count_tokens(pinned)
+
+        if self.strategy != "summarize":
+            summary = None
+
+        rest_start = pinned_end
+        remaining = budget - pinned_tokens
+        if summary is not None:
+            rest_start = max(rest_start, summary.covered_until)
+            remaining -= self.count_message(self._summary_message(summary))
+
+        if self.strategy == "summarize":
+            rest_tokens = sum(counts[rest_start:])
+            if rest_tokens > remaining:
+                target = int(budget * self.target_ratio) - pinned_tokens
+                start = self._window_start(messages, counts, rest_start, target)
+                evicted = [
+                    msg for msg in messages[rest_start:start]
+                    if msg["role"] != "system"
+                ]
+                if evicted:
+                    content = await self.summarizer(summary.content if summary else None, evicted)
+                    summary = ContextSummary(content=content, covered_until=start)
+                    remaining = budget - pinned_tokens - self.count_message(self._summary_message(summary))
+            if summary is not None:
+                rest_start = max(rest_start, summary.covered_until)
+            start = self._window_start(messages, counts, rest_start, remaining)
+        else:
+            start = self._window_start(messages, counts, rest_start, remaining)
+
+        window = [msg for msg in messages[start:] if msg["role"] != "system"]
+        prompt = pinned[:pinned_end]
+        if summary is not None:
+            prompt.append(self._summary_message(summary))
+        prompt += pinned[pinned_end:] + window
+
+        return ContextResult(
+            messages=prompt,
+            tokens=self.count_tokens(prompt),
+            summary=summary,
+        )
+
+    @staticmethod
+    def _summary_message(summary: ContextSummary) -> Dict[str, Any]:
+        return {
+            "role": "system",
+            "content": f"Summary of earlier conversation:\n{summary.content}",
+        }
+
+
+def format_transcript(messages: List[Dict[str, Any]]) -> str:
+    """Render messages as plain text for summarization."""
+    lines = []
+    for msg in messages:
+        content = msg.get("content") or ""
+        if msg.get("tool_calls"):
+            content += f" [tool calls: {json.dumps(msg['tool_calls'])}]"
+        lines.append(f"{msg['role'].upper()}: {content}")
+    return "\n".join(lines)
+
+
+def llm_summarizer(model: str) -> Summarizer:
+    """Create a summarizer that asks the LLM to fold messages into a summary."""
+    async def summarize(previous: Optional[str], messages: List[Dict[str, Any]]) -> str:
+        from urpe.llm import get_llm_response
+
+        transcript = format_transcript(messages)
+        if previous:
+            transcript = f"Previous summary:\n{previous}\n\nNew messages:\n{transcript}"
+
+        response = await get_llm_response(
+            model=model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": transcript},
+            ],
+        )
+        parts = []
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+        return "".join(parts)
+
+    return summarize
@@ -0,0 +1,73 @@
+"""Deferred construction of module-level singletons and per-event-loop state."""
+
+import asyncio
+import threading
+import weakref
+from typing import Any, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class LazyObject:
+    """
+    Stand-in for a module-level singleton that is built on first use.
+
+    Attribute access is forwarded to the object returned by `factory`, which
+    is called once, the first time an attribute is needed. This keeps
+    importing a module cheap (no config parsing, no database setup) while
+    `from module import name` keeps working.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _resolve(self) -> Any:
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    instance = self._factory()
+                    object.__setattr__(self, "_instance", instance)
+        return instance
+
+    @property
+    def is_resolved(self) -> bool:
+        """Whether the underlying object has been built."""
+        return self._instance is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._resolve(), name, value)
+
+    def __repr__(self) -> str:
+        if self._instance is None:
+            return f"<LazyObject {getattr(self._factory, '__name__', self._factory)!r} (not built)>"
+        return repr(self._instance)
+
+
+class PerLoop(Generic[T]):
+    """
+    State built on first use in each event loop.
+
+    asyncio primitives (locks, semaphores, futures) belong to the loop that
+    created them, while the objects holding them (the tool executor, the
+    request scheduler) outlive loops: the CLI runs one per command and the
+    tests one per test. `get()` returns the running loop's state, built by
+    `factory`; it is dropped with the loop.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, T]" = weakref.WeakKeyDictionary()
+
+    def get(self) -> T:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = self._factory()
+        return state
@@ -1,24 +1,130 @@
 """LiteLLM wrapper for LLM interactions."""
 
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
 import os
-from typing import List, Dict, Any, Optional, AsyncGenerator
+from contextlib import asynccontextmanager
+from typing import (
+    List, Dict, Any, Optional, AsyncGenerator, AsyncIterator, Callable, Awaitable, Tuple, TYPE_CHECKING,
+)
 
-from litellm import acompletion
+from urpe.config import settings
+
+if TYPE_CHECKING:
+    from urpe.llm_cache import ResponseCache
+    from urpe.llm_fallback import ModelRouter
+    from urpe.llm_scheduler import RequestScheduler
+
+_response_cache: Optional["ResponseCache"] = None
+_scheduler: Optional["RequestScheduler"] = None
+_router: Optional["ModelRouter"] = None
+
+# Request priorities; lower values are sent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+async def acompletion(**kwargs):
+    """Call litellm.acompletion; litellm is slow to import, so only on first use."""
+    from litellm import acompletion as litellm_acompletion
+    return await litellm_acompletion(**kwargs)
+
+
+def get_response_cache() -> Optional["ResponseCache"]:
+    """Return the shared response cache, or None if caching is disabled."""
+    global _response_cache
+    if not settings.llm_cache_enabled:
+        return None
+    if _response_cache is None:
+        from urpe.llm_cache import ResponseCache
+        _response_cache = ResponseCache(
+            db_path=settings.llm_cache_path,
+            ttl=settings.llm_cache_ttl,
+            max_memory_entries=settings.llm_cache_max_memory_entries,
+            max_disk_entries=settings.llm_cache_max_disk_entries,
+        )
+    return _response_cache
+
+
+def get_scheduler() -> "RequestScheduler":
+    """Return the shared request scheduler, configured from settings."""
+    global _scheduler
+    if _scheduler is None:
+        from urpe.llm_scheduler import ModelLimits, RequestScheduler
+        _scheduler = RequestScheduler(
+            limits={model: ModelLimits(**limits) for model, limits in settings.llm_rate_limits.items()},
+            default_limits=ModelLimits(rpm=settings.llm_rpm, tpm=settings.llm_tpm),
+            max_retries=settings.llm_max_retries,
+            backoff=settings.llm_backoff,
+            max_backoff=settings.llm_max_backoff,
+            coalesce=settings.llm_coalesce,
+        )
+    return _scheduler
+
+
+def get_router() -> "ModelRouter":
+    """Return the shared model router, configured from settings."""
+    global _router
+    if _router is None:
+        from urpe.llm_fallback import ModelRouter
+        _router = ModelRouter(
+            ttft_timeout=settings.llm_ttft_timeout,
+            hedge=settings.llm_hedge,
+            hedge_percentile=settings.llm_hedge_percentile,
+            hedge_delay=settings.llm_hedge_delay,
+        )
+    return _router
+
+
+def fallback_chain(model: str) -> List[str]:
+    """The model followed by the configured fallback models."""
+    return [model] + [fallback for fallback in settings.llm_fallbacks if fallback != model]
+
+
+def request_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    tools: Optional[List[Dict[str, Any]]] = None,
+    **params,
+) -> str:
+    """Stable hash of everything that determines a response."""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "tools": tools or None, "params": params},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
 async def get_llm_response(
     model: str,
     messages: List[Dict[str, str]],
     tools: Optional[List[Dict[str, Any]]] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_BATCH,
     **kwargs
 ) -> AsyncGenerator:
     """
     Get a streaming response from the LLM.
     
+    Identical requests are answered from the response cache when it is
+    enabled; cached responses are replayed as a stream of chunks. Requests
+    to the provider go through the request scheduler, which keeps them
+    within rate limits, retries transient errors and shares one response
+    between identical requests in flight. When fallback models are
+    configured, the model router moves on to the next one if a model fails
+    or is slow to start streaming (see urpe.llm_fallback).
+    
     Args:
         model: Model identifier (e.g., "gemini/gemini-2.0-flash")
         messages: List of message dicts with role and content
         tools: Optional list of tool schemas
+        use_cache: Set to False to always call the provider
+        priority: PRIORITY_INTERACTIVE requests are sent before PRIORITY_BATCH ones
         **kwargs: Additional args passed to litellm
     
     Returns:
@@ -29,6 +135,32 @@ async def get_llm_response(
     if api_key:
         os.environ["GEMINI_API_KEY"] = api_key
     
+    models = fallback_chain(model)
+    if len(models) == 1:
+        return await _request(model, messages, tools, use_cache, priority, **kwargs)
+    return await get_router().open(
+        models,
+        lambda model: _request(model, messages, tools, use_cache, priority, **kwargs),
+    )
+
+
+async def _request(
+    model: str,
+    messages: List[Dict[str, str]],
+    tools: Optional[List[Dict[str, Any]]],
+    use_cache: bool,
+    priority: int,
+    **kwargs
+) -> AsyncGenerator:
+    """Stream a response from one model, through the cache and scheduler."""
+    key = request_key(model, messages, tools, **kwargs)
+    cache = get_response_cache() if use_cache else None
+    if cache is not None:
+        from urpe.llm_cache import replay
+        deltas = await cache.aget(key)
+        if deltas is not None:
+            return replay(deltas)
+    
     call_kwargs = {
         "model": model,
         "messages": messages,
@@ -39,5 +171,64 @@ async def get_llm_response(
     if tools:
         call_kwargs["tools"] = tools
     
-    response = await acompletion(**call_kwargs)
-    return response
+    async def send(**call_kwargs):
+        response = await acompletion(**call_kwargs)
+        if cache is not None:
+            return cache.record(key, model, response)
+        return response
+    
+    return await get_scheduler().submit(send, key=key, priority=priority, **call_kwargs)
+
+
+class LLMLimiter:
+    """
+    Bounds how many LLM streams are read at once.
+    
+    A stream holds a slot from the time its request is sent until it has been
+    read to the end. Free slots go to the waiting stream with the lowest
+    `priority` value, then in arrival order, so interactive turns don't queue
+    behind batch ones. Provider rate limits and retries are handled by the
+    request scheduler in get_llm_response.
+    """
+    
+    def __init__(self, max_concurrency: int = 8):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.waiting = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+    
+    async def _acquire(self, priority: int):
+        if self.active < self.max_concurrency:
+            self.active += 1
+            return
+        slot = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), slot))
+        self.waiting += 1
+        try:
+            await slot
+        except asyncio.CancelledError:
+            if slot.done() and not slot.cancelled():
+                # Handed the slot just as the wait was cancelled; pass it on
+                self._release()
+            raise
+        finally:
+            self.waiting -= 1
+    
+    def _release(self):
+        # The slot goes straight to the next waiter, so `active` is unchanged
+        while self._waiters:
+            _, _, slot = heapq.heappop(self._waiters)
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self.active -= 1
+    
+    @asynccontextmanager
+    async def stream(self, llm: Callable[..., Awaitable[Any]], **kwargs) -> AsyncIterator[Any]:
+        """Wait for a slot, then call `llm(**kwargs)` and hold the slot while its stream is read."""
+        await self._acquire(kwargs.get("priority", PRIORITY_BATCH))
+        try:
+            yield await llm(**kwargs)
+        finally:
+            self._release()
@@ -0,0 +1,295 @@
+"""Response cache for LLM calls, replayed as streams."""
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Any, Optional, AsyncGenerator
+
+from sqlalchemy import (
+    create_engine, event, delete, func, select, update,
+    Column, Float, Integer, MetaData, String, Table, Text,
+)
+
+from urpe.memory.sqlite import _set_sqlite_pragmas
+
+Delta = Dict[str, Any]  # {"content": str | None, "tool_calls": list | None}
+
+_metadata = MetaData()
+
+cache_table = Table(
+    "llm_cache",
+    _metadata,
+    Column("key", String, primary_key=True),
+    Column("model", String, nullable=False),
+    Column("deltas", Text, nullable=False),  # JSON list of recorded deltas
+    Column("created_at", Float, nullable=False),
+    Column("expires_at", Float, nullable=False, index=True),
+    Column("last_used_at", Float, nullable=False, index=True),
+    Column("hits", Integer, nullable=False, default=0),
+)
+
+
+# Minimal stand-ins for LiteLLM's streaming chunk objects
+
+
+@dataclass
+class _Function:
+    name: Optional[str]
+    arguments: Optional[str]
+
+
+@dataclass
+class _ToolCallDelta:
+    index: int
+    id: Optional[str]
+    function: _Function
+    type: str = "function"
+
+
+@dataclass
+class _Delta:
+    content: Optional[str]
+    tool_calls: Optional[List[_ToolCallDelta]]
+    role: str = "assistant"
+
+
+@dataclass
+class _Choice:
+    delta: _Delta
+    index: int = 0
+
+
+@dataclass
+class CachedChunk:
+    """Replayed streaming chunk with the attributes the agent reads."""
+    choices: List[_Choice] = field(default_factory=list)
+
+
+def _record_delta(chunk) -> Optional[Delta]:
+    """Extract the parts of a streaming chunk needed to replay it."""
+    if not chunk.choices or not chunk.choices[0].delta:
+        return None
+    delta = chunk.choices[0].delta
+    tool_calls = None
+    if delta.tool_calls:
+        tool_calls = [
+            {
+                "index": tc.index,
+                "id": tc.id,
+                "name": tc.function.name if tc.function else None,
+                "arguments": tc.function.arguments if tc.function else None,
+            }
+            for tc in delta.tool_calls
+        ]
+    if not delta.content and not tool_calls:
+        return None
+    return {"content": delta.content, "tool_calls": tool_calls}
+
+
+def _replay_chunk(delta: Delta) -> CachedChunk:
+    tool_calls = None
+    if delta.get("tool_calls"):
+        tool_calls = [
+            _ToolCallDelta(
+                index=tc["index"],
+                id=tc["id"],
+                function=_Function(name=tc["name"], arguments=tc["arguments"]),
+            )
+            for tc in delta["tool_calls"]
+        ]
+    return CachedChunk(choices=[_Choice(delta=_Delta(content=delta.get("content"), tool_calls=tool_calls))])
+
+
+async def replay(deltas: List[Delta]) -> AsyncGenerator[CachedChunk, None]:
+    """Replay recorded deltas as a stream of chunks."""
+    for delta in deltas:
+        yield _replay_chunk(delta)
+
+
+class ResponseCache:
+    """
+    Two-tier LLM response cache.
+
+    Lookups hit an in-process LRU first and a persistent SQLite table
+    second. Entries expire after `ttl` seconds; each tier evicts its least
+    recently used entries beyond its size limit.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = "data/llm_cache.db",
+        ttl: float = 86_400,
+        max_memory_entries: int = 256,
+        max_disk_entries: int = 10_000,
+    ):
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.stores = 0
+
+        self.engine = None
+        if db_path:
+            path = Path(db_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.engine = create_engine(f"sqlite:///{path}")
+            event.listen(self.engine, "connect", _set_sqlite_pragmas)
+            _metadata.create_all(self.engine)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process."""
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def _remember(self, key: str, expires_at: float, deltas: List[Delta]):
+        with self._lock:
+            self._memory[key] = (expires_at, deltas)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[List[Delta]]:
+        """Return the recorded deltas for a key, or None on a miss."""
+        deltas = self._from_memory(key)
+        if deltas is None:
+            deltas = self._from_disk(key)
+        return deltas
+
+    async def aget(self, key: str) -> Optional[List[Delta]]:
+        """get() for use on the event loop; the disk tier is read in a worker thread."""
+        deltas = self._from_memory(key)
+        if deltas is None:
+            if self.engine is None:
+                deltas = self._from_disk(key)
+            else:
+                deltas = await asyncio.to_thread(self._from_disk, key)
+        return deltas
+
+    def _from_memory(self, key: str) -> Optional[List[Delta]]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return entry[1]
+            if entry:
+                del self._memory[key]
+        return None
+
+    def _from_disk(self, key: str) -> Optional[List[Delta]]:
+        row = None
+        if self.engine is not None:
+            now = time.time()
+            with self.engine.begin() as conn:
+                row = conn.execute(
+                    select(cache_table.c.deltas, cache_table.c.expires_at)
+                    .where(cache_table.c.key == key, cache_table.c.expires_at > now)
+                ).first()
+                if row:
+                    conn.execute(
+                        update(cache_table)
+                        .where(cache_table.c.key == key)
+                        .values(last_used_at=now, hits=cache_table.c.hits + 1)
+                    )
+        if row:
+            deltas = json.loads(row.deltas)
+            self._remember(key, row.expires_at, deltas)
+            with self._lock:
+                self.hits_disk += 1
+            return deltas
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, model: str, deltas: List[Delta]):
+        """Store a complete response."""
+        expires_at = self._put_memory(key, deltas)
+        if self.engine is not None:
+            self._put_disk(key, model, deltas, expires_at)
+
+    async def aput(self, key: str, model: str, deltas: List[Delta]):
+        """put() for use on the event loop; the disk tier is written in a worker thread."""
+        expires_at = self._put_memory(key, deltas)
+        if self.engine is not None:
+            await asyncio.to_thread(self._put_disk, key, model, deltas, expires_at)
+
+    def _put_memory(self, key: str, deltas: List[Delta]) -> float:
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, deltas)
+        self.stores += 1
+        return expires_at
+
+    def _put_disk(self, key: str, model: str, deltas: List[Delta], expires_at: float):
+        now = time.time()
+        with self.engine.begin() as conn:
+            conn.execute(
+                cache_table.insert().prefix_with("OR REPLACE").values(
+                    key=key,
+                    model=model,
+                    deltas=json.dumps(deltas),
+                    created_at=now,
+                    expires_at=expires_at,
+                    last_used_at=now,
+                    hits=0,
+                )
+            )
+            conn.execute(delete(cache_table).where(cache_table.c.expires_at <= now))
+            conn.execute(
+                delete(cache_table).where(cache_table.c.key.in_(
+                    select(cache_table.c.key)
+                    .order_by(cache_table.c.last_used_at.desc())
+                    .offset(self.max_disk_entries)
+                    .limit(-1)
+                ))
+            )
+
+    async def record(self, key: str, model: str, stream) -> AsyncGenerator:
+        """Pass a response stream through, storing it once fully consumed."""
+        deltas = []
+        async for chunk in stream:
+            delta = _record_delta(chunk)
+            if delta:
+                deltas.append(delta)
+            yield chunk
+        await self.aput(key, model, deltas)
+
+    def disk_stats(self) -> Dict[str, Any]:
+        """Entry and hit totals of the persistent tier."""
+        if self.engine is None:
+            return {"entries": 0, "hits": 0}
+        with self.engine.connect() as conn:
+            entries, hits = conn.execute(
+                select(func.count(), func.coalesce(func.sum(cache_table.c.hits), 0))
+                .where(cache_table.c.expires_at > time.time())
+            ).one()
+        return {"entries": entries, "hits": hits}
+
+    def clear(self):
+        """Drop every cached response."""
+        with self._lock:
+            self._memory.clear()
+        if self.engine is not None:
+            with self.engine.begin() as conn:
+                conn.execute(delete(cache_table))
+
+    def close(self):
+        """Dispose of the database engine."""
+        if self.engine is not None:
+            self.engine.dispose()
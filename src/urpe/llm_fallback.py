@@ -0,0 +1,234 @@
+"""Model fallback chains and hedged requests."""
+
+import asyncio
+import bisect
+import math
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+Opener = Callable[[str], Awaitable[AsyncIterator[Any]]]
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram.
+
+    Buckets grow by `growth` from `low` to `high` seconds, so percentiles
+    are accurate to within that factor while memory stays constant.
+    """
+
+    def __init__(self, low: float = 0.01, high: float = 120.0, growth: float = 1.25):
+        count = math.ceil(math.log(high / low, growth)) + 1
+        self.bounds = [low * growth ** n for n in range(count)]
+        self.counts = [0] * (count + 1)  # The last bucket holds everything above `high`
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Upper bound of the bucket holding the `pct` percentile, or None if empty."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[min(index, len(self.bounds) - 1)]
+        return self.bounds[-1]
+
+
+def _has_token(chunk: Any) -> bool:
+    """Whether a streamed chunk carries content or a tool call (not just a role)."""
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return False
+    delta = getattr(choices[0], "delta", None)
+    return bool(delta and (getattr(delta, "content", None) or getattr(delta, "tool_calls", None)))
+
+
+async def _close(iterator: AsyncIterator[Any]):
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def _resume(buffered: List[Any], iterator: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """Yield the chunks read while waiting for the first token, then the rest."""
+    try:
+        for chunk in buffered:
+            yield chunk
+        async for chunk in iterator:
+            yield chunk
+    finally:
+        await _close(iterator)
+
+
+class ModelRouter:
+    """
+    Opens a response stream from the first model in a chain that delivers.
+
+    The first model is tried first. If it fails, or produces no token within
+    `ttft_timeout` seconds, it is dropped and the next model is tried. With
+    `hedge` on, the next model is also started, without dropping the first,
+    once the first has been waiting longer than its usual time to first
+    token (the `hedge_percentile` of its recorded latencies, or
+    `hedge_delay` until `min_samples` have been recorded); whichever stream
+    produces a token first is used and the other is cancelled. The last
+    model in the chain has no deadline.
+
+    Only first tokens that arrived go into the latency histograms that set
+    the hedge delay. A stream dropped while still waiting (it lost, timed
+    out or the caller gave up) only tells us its first token would have
+    come later than that; such waits are counted as `censored` instead, so
+    they can't drag the percentiles towards the current threshold.
+    """
+
+    def __init__(
+        self,
+        ttft_timeout: Optional[float] = None,
+        hedge: bool = False,
+        hedge_percentile: float = 95,
+        hedge_delay: float = 2.0,
+        min_samples: int = 20,
+    ):
+        self.ttft_timeout = ttft_timeout
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.min_samples = min_samples
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, model: str, event: str):
+        counts = self.counts.setdefault(
+            model, {"wins": 0, "errors": 0, "timeouts": 0, "hedged": 0, "censored": 0}
+        )
+        counts[event] += 1
+
+    def observe(self, model: str, seconds: float):
+        """Record a time to first token."""
+        self.latency.setdefault(model, LatencyHistogram()).observe(seconds)
+
+    def hedge_after(self, model: str) -> float:
+        """Seconds to wait for `model`'s first token before hedging."""
+        histogram = self.latency.get(model)
+        if histogram is None or histogram.count < self.min_samples:
+            return self.hedge_delay
+        return histogram.percentile(self.hedge_percentile)
+
+    async def _first_token(self, model: str, opener: Opener) -> Tuple[List[Any], AsyncIterator[Any]]:
+        """Open a stream and read it up to its first token."""
+        iterator = (await opener(model)).__aiter__()
+        buffered = []
+        try:
+            while True:
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                buffered.append(chunk)
+                if _has_token(chunk):
+                    break
+        except BaseException:
+            await _close(iterator)
+            raise
+        return buffered, iterator
+
+    async def open(self, models: List[str], opener: Opener) -> AsyncIterator[Any]:
+        """
+        Return the stream of the first model in `models` to produce a token.
+
+        Args:
+            models: Models to try, in order
+            opener: Starts a request to a model and returns its stream
+
+        Raises:
+            The last model's error if every model failed
+        """
+        loop = asyncio.get_running_loop()
+        pending: Dict[asyncio.Task, Tuple[str, float]] = {}
+        next_model = 0
+        last_started = 0.0
+        error: Optional[BaseException] = None
+
+        def launch():
+            nonlocal next_model, last_started
+            model = models[next_model]
+            next_model += 1
+            last_started = loop.time()
+            pending[asyncio.ensure_future(self._first_token(model, opener))] = (model, last_started)
+
+        try:
+            launch()
+            while pending:
+                deadlines = []
+                if next_model < len(models):
+                    if self.ttft_timeout is not None:
+                        deadlines += [started + self.ttft_timeout for _, started in pending.values()]
+                    if self.hedge:
+                        deadlines.append(last_started + self.hedge_after(models[next_model - 1]))
+                timeout = max(0.0, min(deadlines) - loop.time()) if deadlines else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    model, started = pending.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        self._count(model, "errors")
+                        continue
+                    buffered, iterator = task.result()
+                    self.observe(model, loop.time() - started)
+                    self._count(model, "wins")
+                    return _resume(buffered, iterator)
+
+                if next_model >= len(models):
+                    continue
+                now = loop.time()
+                expired = [
+                    task for task, (_, started) in pending.items()
+                    if self.ttft_timeout is not None and now >= started + self.ttft_timeout
+                ]
+                for task in expired:
+                    model, started = pending.pop(task)
+                    self._count(model, "timeouts")
+                    self._count(model, "censored")
+                    task.cancel()
+                if not pending or expired:
+                    launch()
+                elif self.hedge and now >= last_started + self.hedge_after(models[next_model - 1]):
+                    self._count(models[next_model - 1], "hedged")
+                    launch()
+        finally:
+            # The losers: still waiting, or done in the same round as the winner
+            now = loop.time()
+            finished = []
+            for task, (model, started) in pending.items():
+                if not task.done():
+                    self._count(model, "censored")
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    # Its first token did arrive, just not first
+                    self.observe(model, now - started)
+                    finished.append(task.result()[1])
+            for iterator in finished:
+                await _close(iterator)
+
+        raise error
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per model: wins, errors, timeouts, hedges, censored waits and
+        percentiles of the first tokens that arrived.
+        """
+        stats = {}
+        for model in sorted(set(self.counts) | set(self.latency)):
+            histogram = self.latency.get(model, LatencyHistogram())
+            stats[model] = {
+                **self.counts.get(model, {}),
+                "ttft_p50_ms": (histogram.percentile(50) or 0.0) * 1000,
+                "ttft_p95_ms": (histogram.percentile(95) or 0.0) * 1000,
+                "ttft_p99_ms": (histogram.percentile(99) or 0.0) * 1000,
+            }
+        return stats
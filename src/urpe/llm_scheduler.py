@@ -0,0 +1,372 @@
+"""Rate-limit aware scheduling of LLM requests."""
+
+import asyncio
+import heapq
+import itertools
+import json
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncGenerator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from urpe.lazy import PerLoop
+from urpe.llm import PRIORITY_BATCH
+from urpe.tracing import percentile
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {
+    "RateLimitError",
+    "ServiceUnavailableError",
+    "InternalServerError",
+    "APIConnectionError",
+    "Timeout",
+}
+WAIT_SAMPLES = 1024
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether a provider error means requests are being rate limited (HTTP 429)."""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a provider error is worth retrying (rate limits, overload, timeouts)."""
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_ERRORS
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait, from Retry-After(-Ms) headers."""
+    candidates = (
+        getattr(getattr(error, "response", None), "headers", None),
+        getattr(error, "litellm_response_headers", None),
+    )
+    for headers in candidates:
+        if not headers:
+            continue
+        try:
+            value = headers.get("retry-after-ms")
+            if value is not None:
+                return max(0.0, float(value) / 1000)
+            value = headers.get("retry-after")
+            if value is None:
+                continue
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                when = parsedate_to_datetime(value)
+                return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError, AttributeError):
+            continue
+    return None
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> int:
+    """Rough prompt size (~4 characters per token) for tokens-per-minute limits."""
+    size = len(json.dumps(messages, default=str))
+    if tools:
+        size += len(json.dumps(tools, default=str))
+    return (size + 3) // 4
+
+
+class TokenBucket:
+    """
+    Allows `per_minute` units a minute, refilled continuously.
+
+    The bucket holds at most a minute's worth, so a quiet period allows a
+    burst of that size and no more.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+
+@dataclass
+class ModelLimits:
+    """Request and token budgets for one model; None means unlimited."""
+    rpm: Optional[float] = None
+    tpm: Optional[float] = None
+
+
+@dataclass
+class _Lane:
+    """Queue, budgets and counters for one model."""
+    requests: Optional[TokenBucket]
+    tokens: Optional[TokenBucket]
+    queue: List[Tuple[int, int, int, asyncio.Future]] = field(default_factory=list)
+    paused_until: float = 0.0
+    dispatcher: Optional[asyncio.Task] = None
+    sent: int = 0
+    retries: int = 0
+    coalesced: int = 0
+    waits: Deque[float] = field(default_factory=lambda: deque(maxlen=WAIT_SAMPLES))
+
+    def delay(self, tokens: int, now: float) -> float:
+        delay = self.paused_until - now
+        if self.requests:
+            delay = max(delay, self.requests.delay(1, now))
+        if self.tokens:
+            delay = max(delay, self.tokens.delay(tokens, now))
+        return delay
+
+
+class SharedStream:
+    """
+    Fans one response stream out to every caller that asked for it.
+
+    Chunks are read from the source in a background task and kept, so
+    callers that join late still see the whole response. The source is
+    abandoned if every reader goes away before it ends.
+    """
+
+    def __init__(self, source):
+        self._source = source
+        self._chunks: List[Any] = []
+        self._error: Optional[BaseException] = None
+        self._done = False
+        self._changed = asyncio.Event()
+        self._readers = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _pump(self):
+        try:
+            async for chunk in self._source:
+                self._chunks.append(chunk)
+                self._changed.set()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done = True
+            self._changed.set()
+
+    async def subscribe(self) -> AsyncGenerator[Any, None]:
+        """Yield every chunk of the response from the start."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._pump())
+        self._readers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(self._chunks):
+                    yield self._chunks[position]
+                    position += 1
+                if self._done:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                self._changed.clear()
+                await self._changed.wait()
+        finally:
+            self._readers -= 1
+            if self._readers == 0 and not self._done:
+                self._task.cancel()
+
+
+class RequestScheduler:
+    """
+    Queues LLM requests per model so they stay within provider rate limits.
+
+    Each model has token buckets for requests and prompt tokens per minute
+    (from `limits`, falling back to `default_limits`). Waiting requests are
+    served lowest priority value first, then in arrival order. Failed
+    requests that are worth retrying are retried with jittered exponential
+    backoff, or after the provider's Retry-After; a rate-limit error holds
+    back every request for that model until then. Identical requests that
+    are in flight at the same time are sent once and their stream shared.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, ModelLimits]] = None,
+        default_limits: Optional[ModelLimits] = None,
+        max_retries: int = 4,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        coalesce: bool = True,
+    ):
+        self.limits = limits or {}
+        self.default_limits = default_limits or ModelLimits()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.coalesce = coalesce
+        self._seq = itertools.count()
+        self._lanes: PerLoop[Dict[str, _Lane]] = PerLoop(dict)
+        self._in_flight: PerLoop[Dict[str, SharedStream]] = PerLoop(dict)
+
+    def _lane(self, model: str) -> _Lane:
+        lanes = self._lanes.get()
+        if model not in lanes:
+            limits = self.limits.get(model, self.default_limits)
+            lanes[model] = _Lane(
+                requests=TokenBucket(limits.rpm) if limits.rpm else None,
+                tokens=TokenBucket(limits.tpm) if limits.tpm else None,
+            )
+        return lanes[model]
+
+    async def _dispatch(self, lane: _Lane):
+        """Release queued requests as the model's budgets allow."""
+        try:
+            while lane.queue:
+                _, _, tokens, future = lane.queue[0]
+                if future.done():
+                    heapq.heappop(lane.queue)
+                    continue
+                delay = lane.delay(tokens, time.monotonic())
+                if delay > 0:
+                    # Re-check the head afterwards: a more urgent request may have arrived
+                    await asyncio.sleep(delay)
+                    continue
+                heapq.heappop(lane.queue)
+                now = time.monotonic()
+                if lane.requests:
+                    lane.requests.take(1, now)
+                if lane.tokens:
+                    lane.tokens.take(tokens, now)
+                future.set_result(None)
+        finally:
+            lane.dispatcher = None
+
+    async def _admit(self, lane: _Lane, tokens: int, priority: int, seq: int):
+        """Wait until the request may be sent."""
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(lane.queue, (priority, seq, tokens, future))
+        if lane.dispatcher is None:
+            lane.dispatcher = asyncio.ensure_future(self._dispatch(lane))
+        await future
+        lane.waits.append(time.monotonic() - started)
+
+    def _backoff(self, error: BaseException, attempt: int) -> float:
+        requested = retry_after(error)
+        if requested is not None:
+            return min(requested, self.max_backoff)
+        # Full jitter: spread retries so callers don't come back in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def _send(
+        self,
+        call: Callable[..., Awaitable[Any]],
+        kwargs: Dict[str, Any],
+        lane: _Lane,
+        tokens: int,
+        priority: int,
+    ) -> Any:
+        attempt = 0
+        # Retries keep their place in line
+        seq = next(self._seq)
+        while True:
+            await self._admit(lane, tokens, priority, seq)
+            lane.sent += 1
+            try:
+                return await call(**kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(e, attempt)
+                attempt += 1
+                lane.retries += 1
+                if is_rate_limit_error(e):
+                    lane.paused_until = max(lane.paused_until, time.monotonic() + delay)
+                else:
+                    await asyncio.sleep(delay)
+
+    async def submit(
+        self,
+        call: Callable[..., Awaitable[Any]],
+        key: Optional[str] = None,
+        priority: int = PRIORITY_BATCH,
+        **kwargs,
+    ) -> Any:
+        """
+        Send `call(**kwargs)` when the model's budgets allow, retrying on
+        transient errors, and return its response stream.
+
+        Args:
+            call: Coroutine function that starts the request (acompletion)
+            key: Identifies the request for coalescing; None to never share
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH (lower goes first)
+            **kwargs: Request arguments; must include model and messages
+        """
+        lane = self._lane(kwargs["model"])
+        tokens = estimate_tokens(kwargs["messages"], kwargs.get("tools"))
+        if not self.coalesce or key is None:
+            return await self._send(call, kwargs, lane, tokens, priority)
+
+        in_flight = self._in_flight.get()
+        pending = in_flight.get(key)
+        if pending is not None:
+            try:
+                shared = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if pending.cancelled() and not asyncio.current_task().cancelling():
+                    # The first caller gave up before sending; take its place
+                    return await self.submit(call, key=key, priority=priority, **kwargs)
+                raise
+            lane.coalesced += 1
+            return shared.subscribe()
+
+        pending = asyncio.get_running_loop().create_future()
+        in_flight[key] = pending
+        try:
+            response = await self._send(call, kwargs, lane, tokens, priority)
+        except BaseException as e:
+            del in_flight[key]
+            if isinstance(e, asyncio.CancelledError):
+                pending.cancel()
+            else:
+                pending.set_exception(e)
+                # Followers see the error; don't warn if there are none
+                pending.exception()
+            raise
+
+        shared = SharedStream(response)
+        pending.set_result(shared)
+        stream = shared.subscribe()
+
+        async def lead():
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+                if in_flight.get(key) is pending:
+                    del in_flight[key]
+
+        return lead()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per model: queue depth, requests sent, retries, coalesced requests and queue wait times."""
+        lanes = self._lanes.get()
+        stats = {}
+        for model, lane in lanes.items():
+            waits = list(lane.waits)
+            stats[model] = {
+                "queued": sum(not future.done() for *_, future in lane.queue),
+                "sent": lane.sent,
+                "retries": lane.retries,
+                "coalesced": lane.coalesced,
+                "wait_p50_ms": percentile(waits, 50) * 1000,
+                "wait_p95_ms": percentile(waits, 95) * 1000,
+                "wait_max_ms": max(waits, default=0.0) * 1000,
+            }
+        return stats
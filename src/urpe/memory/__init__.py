@@ -1,5 +1,15 @@
 """Memory module - conversation persistence."""
 
-from urpe.memory.sqlite import MemoryStore, Conversation, Message, memory
+from urpe.memory.sqlite import MemoryStore, Conversation, Message, Summary, memory
+from urpe.memory.async_sqlite import AsyncMemoryStore
+from urpe.memory.write_behind import WriteBehindStore
 
-__all__ = ["MemoryStore", "Conversation", "Message", "memory"]
+__all__ = [
+    "MemoryStore",
+    "AsyncMemoryStore",
+    "WriteBehindStore",
+    "Conversation",
+    "Message",
+    "Summary",
+    "memory",
+]
@@ -0,0 +1,216 @@
+"""Async SQLite conversation memory, for use inside the event loop."""
+
+import asyncio
+from pathlib import Path
+from typing import Optional, List
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from urpe.memory.sqlite import (
+    Base,
+    Conversation,
+    Message,
+    Summary,
+    LLM_MESSAGES_SQL,
+    REBUILD_SEARCH_INDEX_SQL,
+    SEARCH_SQL,
+    STATS_SQL,
+    _assign_seq,
+    _conversation_to_dict,
+    _message_to_dict,
+    _new_message,
+    _parse_payloads,
+    _search_params,
+    _search_result_to_dict,
+    _select_conversations,
+    _set_sqlite_pragmas,
+    _stats_updates,
+)
+from urpe.memory.migrations import migrate
+from urpe.tracing import traced
+
+
+class AsyncMemoryStore:
+    """
+    Async counterpart of MemoryStore backed by aiosqlite.
+    
+    Exposes the same methods as coroutines, so database I/O never blocks
+    the event loop while responses are being streamed.
+    """
+    
+    def __init__(self, db_path: str = "data/urpe.db"):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{self.db_path}")
+        event.listen(self.engine.sync_engine, "connect", _set_sqlite_pragmas)
+        self.Session = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        
+        self._initialized = False
+        self._init_lock = asyncio.Lock()
+    
+    async def _ensure_schema(self):
+        """Create tables on first use (can't be done from __init__)."""
+        if self._initialized:
+            return
+        async with self._init_lock:
+            if not self._initialized:
+                async with self.engine.begin() as conn:
+                    await conn.run_sync(migrate, Base.metadata)
+                self._initialized = True
+    
+    @traced("memory.create_conversation")
+    async def create_conversation(self, model: Optional[str] = None) -> str:
+        """Create a new conversation and return its ID."""
+        await self._ensure_schema()
+        async with self.Session() as session:
+            conv = Conversation(model=model)
+            session.add(conv)
+            await session.commit()
+            return conv.id
+    
+    @traced("memory.add_message")
+    async def add_message(
+        self,
+        conversation_id: str,
+        role: str,
+        content: str,
+        tool_calls: Optional[list] = None,
+        tool_call_id: Optional[str] = None,
+    ) -> str:
+        """Add a message to a conversation."""
+        await self._ensure_schema()
+        async with self.Session() as session:
+            msg = _new_message(conversation_id, role, content, tool_calls, tool_call_id)
+            for stmt, rows in _stats_updates([msg]):
+                _assign_seq(rows, (await session.execute(stmt)).scalar())
+            session.add(msg)
+            await session.commit()
+            return msg.id
+    
+    @traced("memory.add_messages")
+    async def add_messages(self, messages: List[dict]) -> List[str]:
+        """Add several messages in a single transaction."""
+        await self._ensure_schema()
+        async with self.Session() as session:
+            rows = [_new_message(**msg) for msg in messages]
+            for stmt, group in _stats_updates(rows):
+                _assign_seq(group, (await session.execute(stmt)).scalar())
+            session.add_all(rows)
+            await session.commit()
+            return [row.id for row in rows]
+    
+    @traced("memory.get_messages")
+    async def get_messages(self, conversation_id: str) -> List[dict]:
+        """Get all messages for a conversation."""
+        await self._ensure_schema()
+        async with self.Session() as session:
+            result = await session.scalars(
+                select(Message)
+                .where(Message.conversation_id == conversation_id)
+                .order_by(Message.seq)
+            )
+            return [_message_to_dict(msg) for msg in result]
+    
+    @traced("memory.get_llm_messages")
+    async def get_llm_messages(self, conversation_id: str) -> List[dict]:
+        """Get a conversation's messages ready to send to the LLM."""
+        await self._ensure_schema()
+        async with self.engine.connect() as conn:
+            result = await conn.execute(LLM_MESSAGES_SQL, {"conversation_id": conversation_id})
+            return _parse_payloads(result.scalars())
+    
+    @traced("memory.get_conversations")
+    async def get_conversations(self, limit: int = 10, before: Optional[str] = None) -> List[dict]:
+        """Get recent conversations, newest first, after an optional cursor."""
+        await self._ensure_schema()
+        async with self.Session() as session:
+            convs = await session.scalars(_select_conversations(limit, before))
+            return [_conversation_to_dict(conv) for conv in convs]
+    
+    @traced("memory.get_conversation")
+    async def get_conversation(self, conversation_id: str) -> Optional[dict]:
+        """Get a conversation by ID."""
+        await self._ensure_schema()
+        async with self.Session() as session:
+            conv = await session.get(Conversation, conversation_id)
+            if not conv:
+                return None
+            
+            result = await session.scalars(
+                select(Message)
+                .where(Message.conversation_id == conversation_id)
+                .order_by(Message.seq)
+            )
+            return {
+                "id": conv.id,
+                "created_at": conv.created_at.isoformat(),
+                "model": conv.model,
+                "messages": [_message_to_dict(msg) for msg in result],
+            }
+    
+    @traced("memory.get_summary")
+    async def get_summary(self, conversation_id: str) -> Optional[dict]:
+        """Get the stored context summary for a conversation."""
+        await self._ensure_schema()
+        async with self.Session() as session:
+            summary = await session.get(Summary, conversation_id)
+            if not summary:
+                return None
+            
+            return {
+                "content": summary.content,
+                "covered_until": summary.covered_until,
+            }
+    
+    @traced("memory.save_summary")
+    async def save_summary(self, conversation_id: str, content: str, covered_until: int):
+        """Create or replace the context summary for a conversation."""
+        await self._ensure_schema()
+        async with self.Session() as session:
+            await session.merge(Summary(
+                conversation_id=conversation_id,
+                content=content,
+                covered_until=covered_until,
+            ))
+            await session.commit()
+    
+    @traced("memory.search")
+    async def search(
+        self,
+        query: str,
+        limit: int = 20,
+        raw: bool = False,
+        start_mark: str = "[",
+        end_mark: str = "]",
+    ) -> List[dict]:
+        """Full-text search over message content, best matches first."""
+        if not query.strip():
+            return []
+        
+        await self._ensure_schema()
+        params = _search_params(query, limit, raw, start_mark, end_mark)
+        async with self.engine.connect() as conn:
+            result = await conn.execute(SEARCH_SQL, params)
+            return [_search_result_to_dict(row) for row in result]
+    
+    @traced("memory.rebuild_search_index")
+    async def rebuild_search_index(self):
+        """Rebuild the full-text index from the messages table (e.g. after VACUUM)."""
+        await self._ensure_schema()
+        async with self.engine.begin() as conn:
+            for statement in REBUILD_SEARCH_INDEX_SQL:
+                await conn.exec_driver_sql(statement)
+    
+    @traced("memory.stats")
+    async def stats(self) -> dict:
+        """Number of conversations and of messages stored."""
+        await self._ensure_schema()
+        async with self.engine.connect() as conn:
+            conversations, messages = (await conn.execute(STATS_SQL)).one()
+        return {"conversations": conversations, "messages": messages}
+    
+    async def close(self):
+        """Dispose of the async engine."""
+        await self.engine.dispose()
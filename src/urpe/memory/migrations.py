@@ -0,0 +1,172 @@
+"""Versioned schema migrations for the SQLite memory database.
+
+The schema version is stored in SQLite's `PRAGMA user_version`. Tables
+are first created from the current models, then every migration newer than
+the stored version runs. Migrations are written in raw SQL so they don't
+depend on the current models, and must be idempotent: a fresh database
+already has the model columns but still runs them, e.g. to create objects
+the models can't express (FTS tables, triggers).
+"""
+
+import json
+from typing import Callable, List
+
+from sqlalchemy import inspect, MetaData
+from sqlalchemy.engine import Connection
+
+MIGRATIONS: List[Callable[[Connection], None]] = []
+
+
+def migration(func: Callable[[Connection], None]) -> Callable[[Connection], None]:
+    """Register a migration; its version is its position in MIGRATIONS."""
+    MIGRATIONS.append(func)
+    return func
+
+
+def _columns(conn: Connection, table: str) -> set:
+    return {col["name"] for col in inspect(conn).get_columns(table)}
+
+
+@migration
+def add_conversation_stats(conn: Connection):
+    """Denormalized message_count / last_message_at on conversations."""
+    if "message_count" in _columns(conn, "conversations"):
+        return
+    conn.exec_driver_sql(
+        "ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0"
+    )
+    conn.exec_driver_sql("ALTER TABLE conversations ADD COLUMN last_message_at DATETIME")
+    conn.exec_driver_sql(
+        "UPDATE conversations SET "
+        "message_count = (SELECT COUNT(*) FROM messages "
+        "WHERE messages.conversation_id = conversations.id), "
+        "last_message_at = (SELECT MAX(created_at) FROM messages "
+        "WHERE messages.conversation_id = conversations.id)"
+    )
+
+
+@migration
+def add_message_seq(conn: Connection):
+    """Per-conversation message sequence numbers and ordering indexes."""
+    if "seq" not in _columns(conn, "messages"):
+        conn.exec_driver_sql("ALTER TABLE messages ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        # Number existing messages in their previous (timestamp) order
+        conn.exec_driver_sql(
+            "WITH ordered AS ("
+            " SELECT rowid AS rid, ROW_NUMBER() OVER ("
+            "  PARTITION BY conversation_id ORDER BY created_at, rowid) AS n"
+            " FROM messages)"
+            " UPDATE messages SET seq = ordered.n FROM ordered"
+            " WHERE ordered.rid = messages.rowid"
+        )
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_messages_conversation_seq "
+        "ON messages (conversation_id, seq)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_conversations_created_at "
+        "ON conversations (created_at, id)"
+    )
+
+
+@migration
+def add_message_search(conn: Connection):
+    """FTS5 full-text index over message content, kept in sync by triggers."""
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+        "content, content='messages', content_rowid='rowid', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+        "INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content); "
+        "END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+        "INSERT INTO messages_fts (messages_fts, rowid, content) "
+        "VALUES ('delete', old.rowid, old.content); "
+        "END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+        "INSERT INTO messages_fts (messages_fts, rowid, content) "
+        "VALUES ('delete', old.rowid, old.content); "
+        "INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content); "
+        "END"
+    )
+    # Index messages written before the triggers existed
+    conn.exec_driver_sql("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+
+def _llm_tool_call(tc: dict) -> dict:
+    # A copy of urpe.memory.sqlite's, so this migration never changes with it
+    arguments = tc.get("arguments", "")
+    return {
+        "id": tc.get("id"),
+        "type": "function",
+        "function": {
+            "name": tc.get("name", ""),
+            "arguments": arguments if isinstance(arguments, str) else json.dumps(arguments),
+        },
+    }
+
+
+@migration
+def add_message_payload(conn: Connection):
+    """
+    Provider-ready JSON of each message, so histories load without rebuilding.
+
+    Tool results written before this had no tool_call_id; they are paired,
+    in order, with the calls of the assistant message they follow.
+    """
+    if "payload" not in _columns(conn, "messages"):
+        conn.exec_driver_sql("ALTER TABLE messages ADD COLUMN payload TEXT")
+
+    rows = conn.exec_driver_sql(
+        "SELECT rowid, conversation_id, role, content, tool_calls FROM messages "
+        "WHERE payload IS NULL ORDER BY conversation_id, seq"
+    )
+    updates = []
+    conversation_id = None
+    call_ids: List[str] = []
+    for rowid, conv_id, role, content, tool_calls in rows:
+        if conv_id != conversation_id:
+            conversation_id, call_ids = conv_id, []
+        payload = {"role": role, "content": content}
+        if role == "assistant" and tool_calls:
+            calls = json.loads(tool_calls)
+            payload["tool_calls"] = [_llm_tool_call(tc) for tc in calls]
+            call_ids = [tc.get("id") for tc in calls]
+        elif role == "tool" and call_ids:
+            payload["tool_call_id"] = call_ids.pop(0)
+        updates.append((json.dumps(payload), rowid))
+
+    if updates:
+        conn.exec_driver_sql("UPDATE messages SET payload = ? WHERE rowid = ?", updates)
+
+
+def get_version(conn: Connection) -> int:
+    """Return the schema version of the database."""
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def _set_version(conn: Connection, version: int):
+    conn.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+
+
+def migrate(conn: Connection, metadata: MetaData):
+    """
+    Bring the database schema up to date.
+
+    Args:
+        conn: Connection inside a transaction
+        metadata: Metadata of the current models, used to create new tables
+    """
+    # Creates new databases, and tables added since an old one was created
+    metadata.create_all(conn)
+
+    version = get_version(conn)
+    for number, func in enumerate(MIGRATIONS[version:], start=version + 1):
+        func(conn)
+        _set_version(conn, number)
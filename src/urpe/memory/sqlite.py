@@ -6,19 +6,52 @@ from datetime import datetime
 from pathlib import Path
 from typing import Optional, List
 
-from sqlalchemy import create_engine, Column, String, Text, DateTime, ForeignKey
+from sqlalchemy import (
+    create_engine, event, select, update, tuple_, text,
+    Column, String, Text, DateTime, ForeignKey, Integer, Index,
+)
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 
+from urpe.lazy import LazyObject
+from urpe.tracing import traced
+from urpe.memory.migrations import migrate
+
 Base = declarative_base()
 
+# Applied to every new SQLite connection. WAL lets readers proceed during
+# writes and, with synchronous=NORMAL, only fsyncs at checkpoints instead
+# of on every commit.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -16000,  # 16 MB
+}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Engine "connect" listener applying SQLITE_PRAGMAS."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
 
 class Conversation(Base):
     """Conversation model."""
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_created_at", "created_at", "id"),
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     created_at = Column(DateTime, default=datetime.utcnow)
     model = Column(String, nullable=True)
+    # Denormalized stats, maintained on insert so listings never touch messages
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_at = Column(DateTime, nullable=True)
     
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
 
@@ -26,17 +59,225 @@ class Conversation(Base):
 class Message(Base):
     """Message model."""
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_conversation_seq", "conversation_id", "seq", unique=True),
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     conversation_id = Column(String, ForeignKey("conversations.id"), nullable=False)
     role = Column(String, nullable=False)  # user, assistant, tool
     content = Column(Text, nullable=False)
     tool_calls = Column(Text, nullable=True)  # JSON string
+    # The message as sent to the LLM (with tool call ids), JSON
+    payload = Column(Text, nullable=True)
+    # Position in the conversation (1-based); timestamps can tie
+    seq = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     conversation = relationship("Conversation", back_populates="messages")
 
 
+class Summary(Base):
+    """Rolling summary of messages evicted from the context window."""
+    __tablename__ = "summaries"
+    
+    conversation_id = Column(String, ForeignKey("conversations.id"), primary_key=True)
+    content = Column(Text, nullable=False)
+    covered_until = Column(Integer, nullable=False)  # Number of messages summarized
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+def _message_to_dict(msg: Message) -> dict:
+    """Convert a Message row to the dict format returned by the stores."""
+    return {
+        "role": msg.role,
+        "content": msg.content,
+        "tool_calls": json.loads(msg.tool_calls) if msg.tool_calls else None,
+    }
+
+
+def _llm_tool_call(tc: dict) -> dict:
+    arguments = tc.get("arguments", "")
+    return {
+        "id": tc.get("id"),
+        "type": "function",
+        "function": {
+            "name": tc.get("name", ""),
+            "arguments": arguments if isinstance(arguments, str) else json.dumps(arguments),
+        },
+    }
+
+
+def llm_message(
+    role: str,
+    content: str,
+    tool_calls: Optional[list] = None,
+    tool_call_id: Optional[str] = None,
+) -> dict:
+    """
+    Build a message in the format LLM providers accept.
+    
+    Args:
+        tool_calls: Calls an assistant message makes, as {"id", "name", "arguments"}
+        tool_call_id: Call a tool message answers
+    """
+    message = {"role": role, "content": content}
+    if tool_calls:
+        message["tool_calls"] = [_llm_tool_call(tc) for tc in tool_calls]
+    if tool_call_id is not None:
+        message["tool_call_id"] = tool_call_id
+    return message
+
+
+def _new_message(
+    conversation_id: str,
+    role: str,
+    content: str,
+    tool_calls: Optional[list] = None,
+    tool_call_id: Optional[str] = None,
+    **columns,
+) -> Message:
+    """Build a Message row, serializing tool calls and the LLM payload."""
+    # Set here rather than by the column default so stats can use it
+    columns.setdefault("created_at", datetime.utcnow())
+    return Message(
+        conversation_id=conversation_id,
+        role=role,
+        content=content,
+        tool_calls=json.dumps(tool_calls) if tool_calls else None,
+        payload=json.dumps(llm_message(role, content, tool_calls, tool_call_id)),
+        **columns,
+    )
+
+
+# Covered by ix_messages_conversation_seq, in conversation order
+LLM_MESSAGES_SQL = text(
+    "SELECT payload FROM messages WHERE conversation_id = :conversation_id ORDER BY seq"
+)
+
+
+def _parse_payloads(payloads) -> List[dict]:
+    """Decode stored payloads with a single JSON parse."""
+    return json.loads("[" + ",".join(payloads) + "]")
+
+
+def _stats_updates(rows: List[Message]) -> list:
+    """
+    Build UPDATE statements bumping conversation stats for new messages.
+    
+    Returns (statement, rows) pairs. Each statement returns the updated
+    message_count, which _assign_seq uses to number the rows. Running the
+    UPDATE first takes SQLite's write lock, so numbering can't race.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.conversation_id, []).append(row)
+    
+    return [
+        (
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(
+                message_count=Conversation.message_count + len(group),
+                last_message_at=max(row.created_at for row in group),
+            )
+            .returning(Conversation.message_count),
+            group,
+        )
+        for conversation_id, group in groups.items()
+    ]
+
+
+def _assign_seq(rows: List[Message], message_count: Optional[int]):
+    """Number new messages so they end at the conversation's updated count."""
+    if message_count is None:
+        raise ValueError(f"Unknown conversation: {rows[0].conversation_id}")
+    first = message_count - len(rows) + 1
+    for offset, row in enumerate(rows):
+        row.seq = first + offset
+
+
+def _conversation_to_dict(conv: Conversation) -> dict:
+    """Convert a Conversation row to the listing format."""
+    return {
+        "id": conv.id,
+        "created_at": conv.created_at.isoformat(),
+        "model": conv.model,
+        "message_count": conv.message_count,
+        "last_message_at": conv.last_message_at.isoformat() if conv.last_message_at else None,
+        # Opaque keyset cursor: pass as `before` to get the next page
+        "cursor": f"{conv.created_at.isoformat()}|{conv.id}",
+    }
+
+
+def _select_conversations(limit: int, before: Optional[str] = None):
+    """Select a page of conversations, newest first, after a keyset cursor."""
+    stmt = select(Conversation).order_by(
+        Conversation.created_at.desc(), Conversation.id.desc()
+    )
+    if before:
+        created_at, _, conversation_id = before.partition("|")
+        if not conversation_id:
+            raise ValueError(f"Invalid cursor: {before}")
+        stmt = stmt.where(
+            tuple_(Conversation.created_at, Conversation.id)
+            < (datetime.fromisoformat(created_at), conversation_id)
+        )
+    return stmt.limit(limit)
+
+
+# Read from the denormalized stats, so it never scans messages
+STATS_SQL = text("SELECT count(*), coalesce(sum(message_count), 0) FROM conversations")
+
+REBUILD_SEARCH_INDEX_SQL = (
+    "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    "INSERT INTO messages_fts (messages_fts) VALUES ('optimize')",
+)
+
+
+SEARCH_SQL = text(
+    "SELECT m.conversation_id, m.id, m.role, m.seq, m.created_at, "
+    "snippet(messages_fts, 0, :start_mark, :end_mark, '...', :snippet_tokens) AS snippet, "
+    "bm25(messages_fts) AS rank "
+    "FROM messages_fts JOIN messages AS m ON m.rowid = messages_fts.rowid "
+    "WHERE messages_fts MATCH :query "
+    "ORDER BY rank LIMIT :limit"
+)
+
+
+def _fts_query(query: str) -> str:
+    """Quote each word so user input is never parsed as FTS5 syntax."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+def _search_params(
+    query: str,
+    limit: int,
+    raw: bool,
+    start_mark: str,
+    end_mark: str,
+) -> dict:
+    return {
+        "query": query if raw else _fts_query(query),
+        "limit": limit,
+        "start_mark": start_mark,
+        "end_mark": end_mark,
+        "snippet_tokens": 16,
+    }
+
+
+def _search_result_to_dict(row) -> dict:
+    return {
+        "conversation_id": row.conversation_id,
+        "message_id": row.id,
+        "role": row.role,
+        "seq": row.seq,
+        "created_at": str(row.created_at),
+        "snippet": row.snippet,
+        "rank": row.rank,
+    }
+
+
 class MemoryStore:
     """SQLite memory store for conversations."""
     
@@ -45,10 +286,13 @@ class MemoryStore:
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         
         self.engine = create_engine(f"sqlite:///{self.db_path}")
-        Base.metadata.create_all(self.engine)
+        event.listen(self.engine, "connect", _set_sqlite_pragmas)
+        with self.engine.begin() as conn:
+            migrate(conn, Base.metadata)
         
         self.Session = sessionmaker(bind=self.engine)
     
+    @traced("memory.create_conversation")
     def create_conversation(self, model: Optional[str] = None) -> str:
         """Create a new conversation and return its ID."""
         session = self.Session()
@@ -60,67 +304,90 @@ class MemoryStore:
         finally:
             session.close()
     
+    @traced("memory.add_message")
     def add_message(
         self,
         conversation_id: str,
         role: str,
         content: str,
         tool_calls: Optional[list] = None,
+        tool_call_id: Optional[str] = None,
     ) -> str:
         """Add a message to a conversation."""
         session = self.Session()
         try:
-            msg = Message(
-                conversation_id=conversation_id,
-                role=role,
-                content=content,
-                tool_calls=json.dumps(tool_calls) if tool_calls else None,
-            )
+            msg = _new_message(conversation_id, role, content, tool_calls, tool_call_id)
+            for stmt, rows in _stats_updates([msg]):
+                _assign_seq(rows, session.execute(stmt).scalar())
             session.add(msg)
             session.commit()
             return msg.id
         finally:
             session.close()
     
+    @traced("memory.add_messages")
+    def add_messages(self, messages: List[dict]) -> List[str]:
+        """
+        Add several messages in a single transaction.
+        
+        Args:
+            messages: Dicts with the add_message arguments, optionally
+                including pre-generated "id" and "created_at" values
+        
+        Returns:
+            IDs of the inserted messages, in order
+        """
+        session = self.Session()
+        try:
+            rows = [_new_message(**msg) for msg in messages]
+            for stmt, group in _stats_updates(rows):
+                _assign_seq(group, session.execute(stmt).scalar())
+            session.add_all(rows)
+            session.commit()
+            return [row.id for row in rows]
+        finally:
+            session.close()
+    
+    @traced("memory.get_messages")
     def get_messages(self, conversation_id: str) -> List[dict]:
         """Get all messages for a conversation."""
         session = self.Session()
         try:
             messages = session.query(Message).filter(
                 Message.conversation_id == conversation_id
-            ).order_by(Message.created_at).all()
+            ).order_by(Message.seq).all()
             
-            return [
-                {
-                    "role": msg.role,
-                    "content": msg.content,
-                    "tool_calls": json.loads(msg.tool_calls) if msg.tool_calls else None,
-                }
-                for msg in messages
-            ]
+            return [_message_to_dict(msg) for msg in messages]
         finally:
             session.close()
     
-    def get_conversations(self, limit: int = 10) -> List[dict]:
-        """Get recent conversations."""
+    @traced("memory.get_llm_messages")
+    def get_llm_messages(self, conversation_id: str) -> List[dict]:
+        """
+        Get a conversation's messages ready to send to the LLM, including
+        assistant tool calls and the tool_call_id of tool results.
+        """
+        with self.engine.connect() as conn:
+            payloads = conn.execute(LLM_MESSAGES_SQL, {"conversation_id": conversation_id}).scalars()
+            return _parse_payloads(payloads)
+    
+    @traced("memory.get_conversations")
+    def get_conversations(self, limit: int = 10, before: Optional[str] = None) -> List[dict]:
+        """
+        Get recent conversations, newest first.
+        
+        Args:
+            limit: Maximum number of conversations to return
+            before: Cursor of the last conversation of the previous page
+        """
         session = self.Session()
         try:
-            convs = session.query(Conversation).order_by(
-                Conversation.created_at.desc()
-            ).limit(limit).all()
-            
-            return [
-                {
-                    "id": conv.id,
-                    "created_at": conv.created_at.isoformat(),
-                    "model": conv.model,
-                    "message_count": len(conv.messages),
-                }
-                for conv in convs
-            ]
+            convs = session.scalars(_select_conversations(limit, before))
+            return [_conversation_to_dict(conv) for conv in convs]
         finally:
             session.close()
     
+    @traced("memory.get_conversation")
     def get_conversation(self, conversation_id: str) -> Optional[dict]:
         """Get a conversation by ID."""
         session = self.Session()
@@ -132,19 +399,97 @@ class MemoryStore:
             if not conv:
                 return None
             
+            messages = session.query(Message).filter(
+                Message.conversation_id == conversation_id
+            ).order_by(Message.seq).all()
+            
             return {
                 "id": conv.id,
                 "created_at": conv.created_at.isoformat(),
                 "model": conv.model,
-                "messages": self.get_messages(conversation_id),
+                "messages": [_message_to_dict(msg) for msg in messages],
+            }
+        finally:
+            session.close()
+    
+    @traced("memory.get_summary")
+    def get_summary(self, conversation_id: str) -> Optional[dict]:
+        """Get the stored context summary for a conversation."""
+        session = self.Session()
+        try:
+            summary = session.get(Summary, conversation_id)
+            if not summary:
+                return None
+            
+            return {
+                "content": summary.content,
+                "covered_until": summary.covered_until,
             }
         finally:
             session.close()
     
+    @traced("memory.save_summary")
+    def save_summary(self, conversation_id: str, content: str, covered_until: int):
+        """Create or replace the context summary for a conversation."""
+        session = self.Session()
+        try:
+            session.merge(Summary(
+                conversation_id=conversation_id,
+                content=content,
+                covered_until=covered_until,
+            ))
+            session.commit()
+        finally:
+            session.close()
+    
+    @traced("memory.search")
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        raw: bool = False,
+        start_mark: str = "[",
+        end_mark: str = "]",
+    ) -> List[dict]:
+        """
+        Full-text search over message content, best matches first.
+        
+        Args:
+            query: Words to search for (all must match)
+            limit: Maximum number of results
+            raw: Pass the query to FTS5 as-is (enables AND/OR/NEAR, prefix*)
+            start_mark: Inserted before each match in the snippet
+            end_mark: Inserted after each match in the snippet
+        
+        Returns:
+            List of dicts with conversation_id, message_id, role, seq,
+            created_at, snippet and rank
+        """
+        if not query.strip():
+            return []
+        
+        params = _search_params(query, limit, raw, start_mark, end_mark)
+        with self.engine.connect() as conn:
+            return [_search_result_to_dict(row) for row in conn.execute(SEARCH_SQL, params)]
+    
+    @traced("memory.rebuild_search_index")
+    def rebuild_search_index(self):
+        """Rebuild the full-text index from the messages table (e.g. after VACUUM)."""
+        with self.engine.begin() as conn:
+            for statement in REBUILD_SEARCH_INDEX_SQL:
+                conn.exec_driver_sql(statement)
+    
+    @traced("memory.stats")
+    def stats(self) -> dict:
+        """Number of conversations and of messages stored."""
+        with self.engine.connect() as conn:
+            conversations, messages = conn.execute(STATS_SQL).one()
+        return {"conversations": conversations, "messages": messages}
+    
     def close(self):
         """Close the database engine connection (important for Windows)."""
         self.engine.dispose()
 
 
-# Default memory store instance
-memory = MemoryStore()
+# Default memory store instance, opened on first use
+memory = LazyObject(MemoryStore)
@@ -0,0 +1,223 @@
+"""Write-behind message persistence with group commit."""
+
+import asyncio
+import atexit
+import logging
+import signal
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Optional, List
+
+from sqlalchemy.exc import OperationalError
+
+from urpe.memory.sqlite import MemoryStore
+
+logger = logging.getLogger(__name__)
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a failed write is worth retrying: the database was busy, not the data bad."""
+    message = str(error).lower()
+    return isinstance(error, OperationalError) and ("locked" in message or "busy" in message)
+
+
+class WriteBehindStore:
+    """
+    Queues messages in memory and writes them to a MemoryStore in batches.
+
+    A batch is committed in a single transaction when `batch_size` messages
+    are pending, when `flush_interval` seconds have passed, or when `flush()`
+    is called. The first two happen on a background writer thread; from the
+    event loop, `aflush()` (which the agent awaits at the end of every turn)
+    does the same. Reads flush first, so they always see queued messages.
+
+    A batch that fails because the database is busy is queued again for the
+    next flush. Any other failure (e.g. a message for an unknown
+    conversation) fails the whole transaction, so the batch is then written
+    one conversation at a time and only the failing conversation's messages
+    are dropped and logged.
+    """
+
+    def __init__(
+        self,
+        store: MemoryStore,
+        batch_size: int = 64,
+        flush_interval: float = 1.0,
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._pending: List[dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._full = threading.Event()
+
+        self._thread = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _flush_periodically(self):
+        while True:
+            self._full.wait(self.flush_interval)
+            self._full.clear()
+            if self._closed.is_set():
+                return
+            try:
+                self.flush()
+            except Exception:
+                # Transient; the messages were queued again for the next round
+                logger.warning("Background flush failed, retrying", exc_info=True)
+
+    def install_signal_handlers(self):
+        """Flush pending messages before the process dies on SIGTERM/SIGHUP."""
+        for signum in (signal.SIGTERM, getattr(signal, "SIGHUP", None)):
+            if signum is None:
+                continue
+            previous = signal.getsignal(signum)
+
+            def handler(received, frame, previous=previous):
+                self.flush()
+                if callable(previous):
+                    previous(received, frame)
+                else:
+                    raise SystemExit(128 + received)
+
+            signal.signal(signum, handler)
+
+    @property
+    def pending(self) -> int:
+        """Number of queued messages not yet written."""
+        return len(self._pending)
+
+    def add_message(
+        self,
+        conversation_id: str,
+        role: str,
+        content: str,
+        tool_calls: Optional[list] = None,
+        tool_call_id: Optional[str] = None,
+    ) -> str:
+        """Queue a message for writing and return its ID."""
+        message_id = str(uuid.uuid4())
+        with self._lock:
+            self._pending.append({
+                "id": message_id,
+                "conversation_id": conversation_id,
+                "role": role,
+                "content": content,
+                "tool_calls": tool_calls,
+                "tool_call_id": tool_call_id,
+                # Stamped now so queued messages keep their order
+                "created_at": datetime.utcnow(),
+            })
+            full = len(self._pending) >= self.batch_size
+
+        if full:
+            # Written by the writer thread, so the caller never waits on the database
+            self._full.set()
+        return message_id
+
+    def flush(self):
+        """
+        Write all queued messages in one transaction.
+
+        Raises:
+            OperationalError: The database was busy; the messages stay queued
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                self.store.add_messages(batch)
+            except Exception as e:
+                if _is_transient(e):
+                    self._requeue(batch)
+                    raise
+                self._write_by_conversation(batch)
+
+    async def aflush(self):
+        """
+        Write all queued messages from a worker thread, for callers on the
+        event loop. If the database is busy the messages stay queued for
+        the next flush and the error is only logged.
+        """
+        try:
+            await asyncio.to_thread(self.flush)
+        except OperationalError:
+            logger.warning("Flush failed, retrying in the background", exc_info=True)
+
+    def _requeue(self, messages: List[dict]):
+        """Put messages back at the front of the queue for the next flush."""
+        with self._lock:
+            self._pending = messages + self._pending
+
+    def _write_by_conversation(self, batch: List[dict]):
+        """Write each conversation's messages separately, dropping those that can't be written."""
+        groups: Dict[str, List[dict]] = {}
+        for message in batch:
+            groups.setdefault(message["conversation_id"], []).append(message)
+        remaining = list(groups.values())
+        while remaining:
+            group = remaining.pop(0)
+            try:
+                self.store.add_messages(group)
+            except Exception as e:
+                if _is_transient(e):
+                    self._requeue([m for g in [group, *remaining] for m in g])
+                    raise
+                logger.error(
+                    "Dropping %d message(s) for conversation %s: %s",
+                    len(group), group[0]["conversation_id"], e,
+                )
+
+    def create_conversation(self, model: Optional[str] = None) -> str:
+        """Create a new conversation and return its ID."""
+        return self.store.create_conversation(model=model)
+
+    def get_messages(self, conversation_id: str) -> List[dict]:
+        """Get all messages for a conversation."""
+        self.flush()
+        return self.store.get_messages(conversation_id)
+
+    def get_llm_messages(self, conversation_id: str) -> List[dict]:
+        """Get a conversation's messages ready to send to the LLM."""
+        self.flush()
+        return self.store.get_llm_messages(conversation_id)
+
+    def get_conversations(self, limit: int = 10, before: Optional[str] = None) -> List[dict]:
+        """Get recent conversations, newest first, after an optional cursor."""
+        self.flush()
+        return self.store.get_conversations(limit=limit, before=before)
+
+    def get_conversation(self, conversation_id: str) -> Optional[dict]:
+        """Get a conversation by ID."""
+        self.flush()
+        return self.store.get_conversation(conversation_id)
+
+    def search(self, query: str, limit: int = 20, **kwargs) -> List[dict]:
+        """Full-text search over message content, best matches first."""
+        self.flush()
+        return self.store.search(query, limit=limit, **kwargs)
+
+    def get_summary(self, conversation_id: str) -> Optional[dict]:
+        """Get the stored context summary for a conversation."""
+        return self.store.get_summary(conversation_id)
+
+    def save_summary(self, conversation_id: str, content: str, covered_until: int):
+        """Create or replace the context summary for a conversation."""
+        self.store.save_summary(conversation_id, content, covered_until)
+
+    def close(self):
+        """Stop the background flusher and write anything still queued."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._full.set()
+        self._thread.join()
+        self.flush()
+        atexit.unregister(self.close)
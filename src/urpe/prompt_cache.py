@@ -0,0 +1,115 @@
+"""Provider-side prompt caching of stable prompt prefixes.
+
+Providers that cache prompts (Anthropic, Gemini and others through LiteLLM)
+reuse the processed prefix of a request up to a message or tool marked with
+`cache_control`. Every turn of a conversation resends the same tool
+definitions, system messages and earlier turns, so marking where those end
+lets the provider skip re-reading them.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from urpe.config import settings
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+_supported: Dict[str, bool] = {}
+
+
+def supports_prompt_caching(model: str) -> bool:
+    """Whether to mark prompts for `model`: the llm_prompt_cache setting, or LiteLLM's model info."""
+    if settings.llm_prompt_cache is not None:
+        return settings.llm_prompt_cache
+    if model not in _supported:
+        try:
+            from litellm import supports_prompt_caching as litellm_supports
+            _supported[model] = bool(litellm_supports(model=model))
+        except Exception:
+            _supported[model] = False
+    return _supported[model]
+
+
+def _marked_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a message whose content carries a cache marker."""
+    content = message["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    else:
+        content = [dict(block) for block in content]
+    content[-1]["cache_control"] = CACHE_CONTROL
+    return {**message, "content": content}
+
+
+def _markable(message: Dict[str, Any]) -> bool:
+    # Providers reject cache markers on empty text blocks
+    return bool(message.get("content"))
+
+
+def usage_tokens(chunk: Any) -> Optional[Tuple[int, int]]:
+    """(prompt tokens, cached prompt tokens) from a chunk carrying usage, else None."""
+    usage = getattr(chunk, "usage", None)
+    if usage is None or getattr(usage, "prompt_tokens", None) is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or getattr(usage, "cache_read_input_tokens", None) or 0
+    return usage.prompt_tokens, cached
+
+
+class PromptPrefix:
+    """
+    Marks cache breakpoints in a conversation's prompts and tracks the
+    prefix the provider should have cached.
+
+    Each request is marked at the end of the tool definitions, the end of
+    the leading system messages, the end of the previous request's prompt
+    if it is still a prefix of this one (to read the cache) and its own last
+    message (to write it for the next turn): four breakpoints, the most
+    providers allow. When the context window drops or summarizes old
+    messages the previous prompt is no longer a prefix and caching starts
+    over from the system messages.
+    """
+
+    def __init__(self):
+        self.length = 0  # Messages in the last prompt sent
+        self.digest: Optional[str] = None
+        self.reused = 0  # Messages of this prompt expected to be cached
+        self.resets = 0
+
+    def prepare(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+        """Return copies of `messages` and `tools` with cache markers, and remember the prompt."""
+        digest = hashlib.sha256(json.dumps(tools, sort_keys=True).encode())
+        previous_digest = None
+        for index, message in enumerate(messages):
+            digest.update(json.dumps(message, sort_keys=True).encode())
+            if index + 1 == self.length:
+                previous_digest = digest.hexdigest()
+
+        reusable = self.length if self.digest is not None and previous_digest == self.digest else 0
+        if self.digest is not None and not reusable:
+            self.resets += 1
+        self.reused = reusable
+        self.length, self.digest = len(messages), digest.hexdigest()
+
+        system_end = 0
+        while system_end < len(messages) and messages[system_end]["role"] == "system":
+            system_end += 1
+        breakpoints = set()
+        for end in (system_end, reusable, len(messages)):
+            # The last markable message at or before the end of each prefix
+            index = end - 1
+            while index >= 0 and not _markable(messages[index]):
+                index -= 1
+            if index >= 0:
+                breakpoints.add(index)
+
+        marked = [_marked_message(m) if i in breakpoints else m for i, m in enumerate(messages)]
+        if tools:
+            tools = tools[:-1] + [{**tools[-1], "cache_control": CACHE_CONTROL}]
+        return marked, tools
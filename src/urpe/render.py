@@ -0,0 +1,171 @@
+"""Incremental Markdown rendering of streamed responses."""
+
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, List, Optional
+
+from rich.console import Console, RenderableType
+from rich.live import Live
+from rich.markdown import Markdown
+
+FENCES = ("```", "~~~")
+
+
+class MarkdownStream:
+    """
+    Renders streamed Markdown as it arrives.
+
+    Text is split into blocks at blank lines outside code fences. Once a
+    block is complete (the next line starts a new block) it is printed once
+    and never touched again; only the trailing, still-growing block is kept
+    in a `rich.live.Live` region and re-rendered. The tail is re-parsed and
+    redrawn at most `max_fps` times per second, so rendering costs the same
+    however fast tokens come in, and `feed` only scans the new text.
+
+    Use as a context manager:
+
+        with MarkdownStream(console) as stream:
+            async for chunk in response:
+                stream.feed(chunk)
+
+    Anything else that writes to the terminal or reads from it mid-stream,
+    like a confirmation prompt, must run inside `paused()`.
+    """
+
+    def __init__(
+        self,
+        console: Console,
+        max_fps: float = 10,
+        placeholder: Optional[RenderableType] = None,
+    ):
+        self.console = console
+        self.interval = 1 / max_fps
+        self.placeholder = placeholder
+        self.text: List[str] = []  # Everything fed, for the caller
+        self._tail: List[str] = []  # Pieces of the block still being written
+        self._tail_size = 0
+        self._line: List[str] = []  # Pieces of the unfinished last line
+        self._line_size = 0
+        self._in_fence = False
+        self._boundary = 0  # Offset in the tail after a blank line that may end the block
+        self._last_frame = float("-inf")
+        # Redraws happen on Live's own timer, so a spinner placeholder
+        # animates; feed() only swaps in a new renderable when a frame is due
+        self._live = Live(placeholder or "", console=console, refresh_per_second=max_fps)
+
+    def __enter__(self):
+        self._live.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def feed(self, text: str):
+        """Add streamed text, redrawing if a frame is due."""
+        if not text:
+            return
+        self.text.append(text)
+        finished = self._scan(text)
+        self._tail.append(text)
+        self._tail_size += len(text)
+        if finished:
+            self._print_block(finished)
+        now = time.monotonic()
+        if now - self._last_frame >= self.interval:
+            self._last_frame = now
+            self._live.update(self._render_tail())
+
+    @contextmanager
+    def paused(self):
+        """
+        Stop the live region, e.g. while the user answers a prompt, and
+        restart it afterwards. Text written so far is printed first: a
+        prompt comes between model turns, so it ends the current block.
+        """
+        tail = "".join(self._tail)
+        if tail.strip():
+            self._print_block(len(tail))
+        self._tail, self._tail_size = [], 0
+        self._line, self._line_size = [], 0
+        self._in_fence = False
+        self._boundary = 0
+        self._live.update("", refresh=True)
+        overflow = self._live.vertical_overflow
+        self._live.stop()
+        try:
+            yield
+        finally:
+            self._live.vertical_overflow = overflow
+            self._live.start()
+            self._live.update(self._render_tail(), refresh=True)
+
+    def pausing(self, ask: Callable[[str], Awaitable[bool]]) -> Callable[[str], Awaitable[bool]]:
+        """Wrap a confirmation prompt so the live region is paused while it's shown."""
+        async def confirm(command: str) -> bool:
+            with self.paused():
+                return await ask(command)
+        return confirm
+
+    def close(self):
+        """Render whatever is left and stop the live region."""
+        self._live.update(self._render_tail(), refresh=True)
+        self._live.stop()
+
+    def _render_tail(self) -> RenderableType:
+        tail = "".join(self._tail)
+        self._tail = [tail]
+        if not tail.strip():
+            # The placeholder only stands in until the first text arrives
+            return "" if self.text else self.placeholder or ""
+        return Markdown(tail)
+
+    def _scan(self, text: str) -> int:
+        """
+        Scan the lines completed by `text`; returns the tail offset where the
+        last finished block ends, or 0.
+
+        A blank line outside a code fence ends a block once the next line
+        turns out not to be indented (indented lines continue a list item
+        or code block).
+        """
+        if "\n" not in text:
+            self._line.append(text)
+            self._line_size += len(text)
+            return self._check_boundary("".join(self._line)) if self._boundary else 0
+        finished = 0
+        # The unfinished line from last time starts this many chars into the tail
+        offset = self._tail_size - self._line_size
+        lines = "".join([*self._line, text]).split("\n")
+        last = lines.pop()
+        self._line = [last]
+        self._line_size = len(last)
+        for line in lines:
+            offset += len(line) + 1
+            stripped = line.strip()
+            if self._boundary:
+                finished = self._check_boundary(line) or finished
+            if stripped.startswith(FENCES):
+                self._in_fence = not self._in_fence
+            elif not stripped and not self._in_fence:
+                self._boundary = offset
+        if self._boundary:
+            finished = self._check_boundary(last) or finished
+        return finished
+
+    def _check_boundary(self, line: str) -> int:
+        """Once `line` has text, settle whether the pending blank line ended a block."""
+        if not line.strip():
+            return 0
+        boundary, self._boundary = self._boundary, 0
+        return 0 if line[:1].isspace() else boundary
+
+    def _print_block(self, end: int):
+        tail = "".join(self._tail)
+        block, rest = tail[:end], tail[end:]
+        self._tail = [rest]
+        self._tail_size = len(rest)
+        self._boundary = max(0, self._boundary - end)
+        # Printed above the live region, which from now on holds only the rest
+        self._live.update(self._render_tail())
+        self._live.console.print(Markdown(block))
+        self._last_frame = time.monotonic()
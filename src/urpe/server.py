@@ -0,0 +1,175 @@
+"""Long-lived agent daemon serving CLI requests over a Unix socket."""
+
+import asyncio
+import functools
+import importlib
+import os
+import signal
+from contextlib import aclosing
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from urpe.client import DaemonClient, STREAM_LIMIT, read_json, write_json
+from urpe.llm import get_router, get_scheduler
+from urpe.sessions import SessionManager, TurnCancelled
+from urpe.tools.shell import command_cwd, confirm_command
+
+
+class AgentServer:
+    """
+    Serves agent turns to CLI processes over a Unix domain socket.
+
+    A single process keeps the agent code, the memory store and LiteLLM's
+    HTTP clients warm, so `urpe ask` doesn't pay for imports, engine setup
+    and new provider connections on every run. Conversations are hosted by
+    a SessionManager, which runs them concurrently under shared LLM and
+    tool limits; turns within a conversation run one at a time.
+    Confirmation prompts are forwarded to the client, and commands run in
+    the client's working directory. See urpe.client for the protocol.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        memory_store=None,
+        max_conversations: int = 256,
+        sessions: Optional[SessionManager] = None,
+    ):
+        self.socket_path = socket_path
+        self.memory_store = memory_store
+        self.sessions = sessions or SessionManager(memory_store=memory_store, max_sessions=max_conversations)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        """Start listening, replacing a stale socket file."""
+        if os.path.exists(self.socket_path):
+            client = await DaemonClient.connect(self.socket_path)
+            if client is not None:
+                await client.close()
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            os.unlink(self.socket_path)
+        Path(self.socket_path).parent.mkdir(parents=True, exist_ok=True)
+
+        # Created owner-only: chmod after binding would leave a window in
+        # which other local users could connect
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection, path=self.socket_path, limit=STREAM_LIMIT
+            )
+        finally:
+            os.umask(umask)
+
+    async def close(self):
+        """Stop listening, cancel running turns and flush the memory store."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.sessions.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        if hasattr(self.memory_store, "aflush"):
+            await self.memory_store.aflush()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await read_json(reader)
+                if request is None:
+                    break
+                op = request.get("op")
+                if op == "ping":
+                    await write_json(writer, {"ok": True, "pid": os.getpid()})
+                elif op == "message":
+                    await self._handle_message(request, reader, writer)
+                elif op == "resume":
+                    await self._handle_resume(request, writer)
+                elif op == "cancel":
+                    cancelled = self.sessions.cancel(request.get("conversation_id"))
+                    await write_json(writer, {"ok": True, "cancelled": cancelled})
+                elif op == "stats":
+                    await write_json(writer, {
+                        "ok": True,
+                        **self.sessions.stats(),
+                        "llm": get_scheduler().stats(),
+                        "models": get_router().stats(),
+                    })
+                else:
+                    await write_json(writer, {"error": f"Unknown op: {op}"})
+        except (ConnectionError, ValueError):
+            # Client went away or sent garbage; drop the connection
+            pass
+        finally:
+            writer.close()
+
+    async def _confirm(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, command: str) -> bool:
+        """Ask the client whether a command may run."""
+        await write_json(writer, {"confirm": command})
+        reply = await read_json(reader)
+        return bool(reply and reply.get("allow"))
+
+    async def _handle_resume(self, request: Dict[str, Any], writer: asyncio.StreamWriter):
+        try:
+            session = await self.sessions.open(request.get("conversation_id"), model=request.get("model"))
+        except Exception as e:
+            await write_json(writer, {"error": str(e)})
+            return
+        await write_json(writer, {"ok": True, "conversation_id": session.id})
+
+    async def _handle_message(self, request: Dict[str, Any], reader, writer):
+        try:
+            session = await self.sessions.open(request.get("conversation_id"), model=request.get("model"))
+        except Exception as e:
+            await write_json(writer, {"error": str(e)})
+            return
+
+        confirm_token = confirm_command.set(functools.partial(self._confirm, reader, writer))
+        cwd_token = command_cwd.set(request.get("cwd"))
+        try:
+            turn = session.send(
+                request["message"],
+                model=request.get("model"),
+                enable_tools=request.get("tools", True),
+                priority=request.get("priority"),
+            )
+            async with aclosing(turn):
+                async for chunk in turn:
+                    await write_json(writer, {"chunk": chunk})
+        except ConnectionError:
+            raise
+        except TurnCancelled:
+            await write_json(writer, {"error": "Cancelled", "conversation_id": session.id})
+            return
+        except Exception as e:
+            await write_json(writer, {"error": str(e)})
+            return
+        finally:
+            confirm_command.reset(confirm_token)
+            command_cwd.reset(cwd_token)
+
+        await write_json(writer, {"done": True, "conversation_id": session.id})
+
+
+async def serve(socket_path: str, memory_store=None, max_conversations: int = 256, **limits):
+    """
+    Run the daemon until SIGINT or SIGTERM.
+
+    Extra keyword arguments (max_llm_calls, max_tool_calls, max_queued_turns)
+    are passed to the SessionManager.
+    """
+    # Pay for the slow import before the first request
+    importlib.import_module("litellm")
+
+    sessions = SessionManager(memory_store=memory_store, max_sessions=max_conversations, **limits)
+    server = AgentServer(socket_path, memory_store=memory_store, sessions=sessions)
+    await server.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
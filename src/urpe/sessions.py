@@ -0,0 +1,242 @@
+"""Many concurrent agent conversations on one event loop."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import AsyncGenerator, Dict, Optional, Union
+
+from urpe.agent import Agent
+from urpe.llm import LLMLimiter
+from urpe.memory import MemoryStore, AsyncMemoryStore
+from urpe.tools import ToolExecutor, ToolRegistry, registry
+
+_DONE = object()
+
+
+class SessionError(Exception):
+    """A session request could not be served."""
+
+
+class SessionBusy(SessionError):
+    """Too many sessions or queued turns; try again later."""
+
+
+class TurnCancelled(SessionError):
+    """The turn was cancelled with `Session.cancel`."""
+
+
+class Session:
+    """
+    One conversation hosted by a SessionManager.
+
+    Turns run one at a time in a task of their own, so `cancel` can stop a
+    turn from anywhere without touching the task that reads its output.
+    """
+
+    def __init__(self, agent: Agent):
+        self.agent = agent
+        self.last_used = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def id(self) -> str:
+        return self.agent.conversation_id
+
+    @property
+    def busy(self) -> bool:
+        """Whether a turn is running or waiting to run."""
+        return self._lock.locked()
+
+    async def _run(self, message: str, output: asyncio.Queue):
+        try:
+            async for chunk in self.agent.process_message(message):
+                output.put_nowait(chunk)
+        except asyncio.CancelledError:
+            await self.agent.abandon_turn()
+            raise
+        finally:
+            output.put_nowait(_DONE)
+
+    async def send(
+        self,
+        message: str,
+        model: Optional[str] = None,
+        enable_tools: Optional[bool] = None,
+        priority: Optional[int] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Run a turn and yield its response chunks.
+
+        Args:
+            message: The user message
+            model: Model to use from this turn on
+            enable_tools: Whether the agent may call tools from this turn on
+            priority: Scheduling priority of LLM requests from this turn on
+
+        Raises:
+            TurnCancelled: `cancel` was called while the turn was running
+        """
+        async with self._lock:
+            if model:
+                self.agent.model = model
+            if enable_tools is not None:
+                self.agent.enable_tools = enable_tools
+            if priority is not None:
+                self.agent.priority = priority
+            self.last_used = time.monotonic()
+            output: asyncio.Queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run(message, output))
+            try:
+                while (chunk := await output.get()) is not _DONE:
+                    yield chunk
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    if self._task.cancelled() and not asyncio.current_task().cancelling():
+                        raise TurnCancelled(f"Turn cancelled in conversation {self.id}") from None
+                    raise
+            finally:
+                if not self._task.done():
+                    # The reader went away; don't leave the turn running
+                    self._task.cancel()
+                    await asyncio.gather(self._task, return_exceptions=True)
+                self._task = None
+                self.last_used = time.monotonic()
+
+    def cancel(self) -> bool:
+        """Cancel the running turn; returns False if there was none."""
+        if self._task is None or self._task.done():
+            return False
+        return self._task.cancel()
+
+
+class SessionManager:
+    """
+    Hosts many independent conversations in one process.
+
+    Each session has its own Agent and context; the memory store, the tool
+    registry and the limits are shared. LLM streams go through one
+    LLMLimiter, which bounds how many run at once and hands out slots by
+    turn priority, then in arrival order; provider rate limits are handled
+    by the request scheduler behind get_llm_response. Tool calls from all
+    sessions share `max_tool_calls` slots. New turns are refused with
+    SessionBusy once `max_queued_turns` are waiting for the LLM, and idle
+    sessions are dropped, least recently used first, beyond `max_sessions`.
+    """
+
+    def __init__(
+        self,
+        memory_store: Optional[Union[MemoryStore, AsyncMemoryStore]] = None,
+        model: Optional[str] = None,
+        enable_tools: bool = True,
+        max_sessions: int = 256,
+        max_llm_calls: int = 8,
+        max_tool_calls: int = 8,
+        max_queued_turns: int = 1024,
+        tool_registry: Optional[ToolRegistry] = None,
+        llm_limiter: Optional[LLMLimiter] = None,
+    ):
+        self.memory_store = memory_store
+        self.model = model
+        self.enable_tools = enable_tools
+        self.max_sessions = max_sessions
+        self.max_queued_turns = max_queued_turns
+        self.llm_limiter = llm_limiter or LLMLimiter(max_concurrency=max_llm_calls)
+        self.executor = ToolExecutor(
+            tool_registry or registry,
+            max_workers=max_tool_calls,
+            max_concurrency=max_tool_calls,
+        )
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, conversation_id: str) -> Optional[Session]:
+        """Return a hosted session, or None."""
+        return self._sessions.get(conversation_id)
+
+    async def open(self, conversation_id: Optional[str] = None, model: Optional[str] = None) -> Session:
+        """
+        Return the session for a conversation, resuming it from memory if it
+        isn't hosted yet, or start a new conversation.
+
+        Raises:
+            SessionBusy: too many turns are waiting for the model, or every
+                session slot is taken by a busy session
+            SessionError: there is no conversation `conversation_id` to resume
+        """
+        if self.llm_limiter.waiting >= self.max_queued_turns:
+            raise SessionBusy(f"{self.llm_limiter.waiting} turns are already waiting for the model")
+        if conversation_id in self._sessions:
+            self._sessions.move_to_end(conversation_id)
+            return self._sessions[conversation_id]
+
+        agent = Agent(
+            model=model or self.model,
+            enable_tools=self.enable_tools,
+            memory_store=self.memory_store,
+            tool_executor=self.executor,
+            llm_limiter=self.llm_limiter,
+        )
+        if conversation_id:
+            await agent.resume_conversation(conversation_id)
+            if not agent.messages:
+                raise SessionError(f"No conversation {conversation_id} to resume")
+        else:
+            await agent.astart_conversation()
+
+        self._make_room()
+        session = Session(agent)
+        self._sessions[session.id] = session
+        return session
+
+    def _make_room(self):
+        """Drop idle sessions until a new one fits."""
+        for conversation_id in list(self._sessions):
+            if len(self._sessions) < self.max_sessions:
+                return
+            if not self._sessions[conversation_id].busy:
+                del self._sessions[conversation_id]
+        if len(self._sessions) >= self.max_sessions:
+            raise SessionBusy(f"All {self.max_sessions} sessions are busy")
+
+    async def send(self, conversation_id: Optional[str], message: str) -> AsyncGenerator[str, None]:
+        """Run a turn in a conversation (a new one if None) and yield response chunks."""
+        session = await self.open(conversation_id)
+        async for chunk in session.send(message):
+            yield chunk
+
+    def drop(self, conversation_id: str):
+        """Stop hosting a conversation; it stays in memory and can be opened again."""
+        session = self._sessions.pop(conversation_id, None)
+        if session is not None:
+            session.cancel()
+
+    def cancel(self, conversation_id: str) -> bool:
+        """Cancel the running turn of a conversation; returns False if there was none."""
+        session = self._sessions.get(conversation_id)
+        return session.cancel() if session else False
+
+    def stats(self) -> Dict[str, int]:
+        """Current load: sessions hosted and busy, LLM streams running and waiting."""
+        return {
+            "sessions": len(self._sessions),
+            "busy": sum(session.busy for session in self._sessions.values()),
+            "llm_active": self.llm_limiter.active,
+            "llm_waiting": self.llm_limiter.waiting,
+        }
+
+    async def close(self):
+        """Cancel running turns, drop all sessions and stop the tool workers."""
+        sessions = list(self._sessions.values())
+        for session in sessions:
+            session.cancel()
+        # Wait for cancelled turns to close out their history
+        await asyncio.gather(
+            *(session._task for session in sessions if session._task is not None),
+            return_exceptions=True,
+        )
+        self._sessions.clear()
+        self.executor.shutdown()
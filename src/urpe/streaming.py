@@ -0,0 +1,161 @@
+"""Accumulating and coalescing streamed LLM responses."""
+
+import asyncio
+import time
+from typing import Any, AsyncGenerator, AsyncIterable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class StreamAccumulator:
+    """
+    Collects the text and tool calls of a streamed response.
+
+    Pieces are kept in lists and joined once, so a long response costs
+    linear time however finely it is split. Tool call deltas are grouped by
+    their `index`, which may arrive out of order or with gaps when a model
+    makes parallel calls; deltas without an index continue the call with the
+    same id, or else the call seen last.
+    """
+
+    def __init__(self):
+        self._content: List[str] = []
+        self._calls: Dict[int, Dict[str, Any]] = {}
+        self._last_index: Optional[int] = None
+
+    def add(self, delta: Any) -> Optional[str]:
+        """Add a chunk's delta; returns its text, if any."""
+        for tc in getattr(delta, "tool_calls", None) or ():
+            self._add_tool_call(tc)
+        content = getattr(delta, "content", None)
+        if content:
+            self._content.append(content)
+            return content
+        return None
+
+    def _index_of(self, tc: Any) -> int:
+        index = getattr(tc, "index", None)
+        if index is not None:
+            return index
+        tc_id = getattr(tc, "id", None)
+        if tc_id:
+            for index, call in self._calls.items():
+                if call["id"] == tc_id:
+                    return index
+            return max(self._calls, default=-1) + 1
+        if self._last_index is not None:
+            return self._last_index
+        return 0
+
+    def _add_tool_call(self, tc: Any):
+        index = self._index_of(tc)
+        self._last_index = index
+        call = self._calls.get(index)
+        if call is None:
+            call = self._calls[index] = {"id": None, "name": "", "arguments": []}
+        if getattr(tc, "id", None):
+            call["id"] = tc.id
+        function = getattr(tc, "function", None)
+        if function is None:
+            return
+        if function.name and not call["name"]:
+            call["name"] = function.name
+        if function.arguments:
+            call["arguments"].append(function.arguments)
+
+    @property
+    def content(self) -> str:
+        return "".join(self._content)
+
+    @property
+    def tool_calls(self) -> List[Dict[str, str]]:
+        """Tool calls in index order, as {"id", "name", "arguments"} dicts."""
+        return [
+            {
+                "id": call["id"] or f"call_{index}",
+                "name": call["name"],
+                "arguments": "".join(call["arguments"]),
+            }
+            for index, call in sorted(self._calls.items())
+        ]
+
+
+class ChunkCoalescer:
+    """
+    Merges small text chunks so consumers write to the terminal or socket
+    less often.
+
+    Text is passed on at most once per `interval` seconds, or sooner once
+    `max_chars` have built up. The first chunk, and any chunk arriving after
+    a pause longer than `interval`, goes out immediately, so coalescing only
+    kicks in while the stream is fast. An interval of 0 turns it off.
+
+    Buffered text is due `due_in()` seconds from now even if no further
+    chunk comes; `paced` lets the code reading the stream flush it then.
+    """
+
+    def __init__(self, interval: float = 0.03, max_chars: int = 4096):
+        self.interval = interval
+        self.max_chars = max_chars
+        self._buffer: List[str] = []
+        self._size = 0
+        self._last = float("-inf")
+
+    def push(self, text: str) -> Optional[str]:
+        """Buffer `text`; returns the text due for output, if any."""
+        if not self.interval:
+            return text
+        self._buffer.append(text)
+        self._size += len(text)
+        if self._size >= self.max_chars or time.monotonic() - self._last >= self.interval:
+            return self.flush()
+        return None
+
+    def due_in(self) -> Optional[float]:
+        """Seconds until the buffered text is due, or None if nothing is buffered."""
+        if not self._buffer:
+            return None
+        return max(0.0, self._last + self.interval - time.monotonic())
+
+    def flush(self) -> Optional[str]:
+        """Return everything still buffered, if any."""
+        if not self._buffer:
+            return None
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        self._last = time.monotonic()
+        return text
+
+
+async def paced(
+    items: AsyncIterable[T], due_in: Callable[[], Optional[float]]
+) -> AsyncGenerator[Optional[T], None]:
+    """
+    Yield the items of `items`, and None whenever `due_in()` seconds pass
+    without one. A `due_in()` of None waits for the next item however long
+    it takes.
+
+    Each item is read in a task that a timeout leaves running, so the
+    stream isn't cancelled partway through a read.
+    """
+    iterator = items.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(anext(iterator))
+            done, _ = await asyncio.wait({pending}, timeout=due_in())
+            if not done:
+                yield None
+                continue
+            read, pending = pending, None
+            try:
+                item = read.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.wait({pending})
@@ -1,7 +1,31 @@
 """Tools module - executable functions for the agent."""
 
+from typing import Callable, Optional
+
+from urpe.config import settings
 from urpe.tools.base import Tool, ToolCall, ToolRegistry, registry
-from urpe.tools.shell import run_command, SHELL_TOOL_SCHEMA, ToolResult
+from urpe.tools.shell import (
+    run_command, run_command_async, read_only_command_paths, SHELL_TOOL_SCHEMA, ToolResult,
+)
+from urpe.tools.cache import ToolResultCache
+from urpe.tools.executor import ToolExecutor, executor
+from urpe.tools.plugins import load_plugins
+
+
+async def _run_command_tool(
+    command: str,
+    on_output: Optional[Callable[[str], None]] = None,
+) -> ToolResult:
+    """run_command handler using the configured timeout and output caps."""
+    return await run_command_async(
+        command,
+        require_confirmation=settings.tools_require_confirmation,
+        timeout=settings.command_timeout,
+        max_output_bytes=settings.command_max_output_bytes,
+        max_output_lines=settings.command_max_output_lines,
+        on_output=on_output,
+    )
+
 
 # Register built-in tools
 _shell_tool = Tool(
@@ -18,15 +42,26 @@ _shell_tool = Tool(
         "required": ["command"]
     },
     requires_confirmation=True,
+    # Repeated read-only commands (ls, cat, git log) reuse their output
+    cacheable=True,
+    cache_paths=read_only_command_paths,
 )
-registry.register(_shell_tool, run_command)
+registry.register(_shell_tool, _run_command_tool)
+
+# Plugin tools are discovered the first time the registry is used
+registry.add_loader(load_plugins)
 
 __all__ = [
     "Tool",
     "ToolCall", 
     "ToolResult",
     "ToolRegistry",
+    "ToolExecutor",
+    "ToolResultCache",
     "registry",
+    "load_plugins",
+    "executor",
     "run_command",
+    "run_command_async",
     "SHELL_TOOL_SCHEMA",
 ]
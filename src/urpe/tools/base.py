@@ -1,8 +1,14 @@
 """Base tool definitions and registry."""
 
-from typing import Dict, Any, Callable, Optional
+import importlib
+import importlib.util
+import sys
+from pathlib import Path
+from typing import Dict, Any, Callable, List, Optional, Union
 from pydantic import BaseModel
 
+from urpe.tools.schema import compile_schema
+
 
 class Tool(BaseModel):
     """Tool definition for LLM integration."""
@@ -10,7 +16,16 @@ class Tool(BaseModel):
     description: str
     parameters: Dict[str, Any]
     requires_confirmation: bool = True
-    handler: Optional[Callable] = None
+    max_concurrency: Optional[int] = None  # Concurrent calls allowed, None for no limit
+    # Idempotent and side-effect free: repeated calls in a conversation may reuse a result
+    cacheable: bool = False
+    cache_ttl: Optional[float] = None  # seconds, None for the tool_cache_ttl setting
+    # Given a call's arguments, the files its result depends on (a change
+    # to one means running it again), or None if this call can't be cached
+    cache_paths: Optional[Callable[[Dict[str, Any]], Optional[List[str]]]] = None
+    # The handler, or where to import it from on first call: "package.module:function",
+    # or "/path/to/file.py:function"
+    handler: Optional[Union[Callable, str]] = None
     
     class Config:
         arbitrary_types_allowed = True
@@ -22,43 +37,148 @@ class ToolCall(BaseModel):
     arguments: Dict[str, Any]
 
 
+def import_handler(spec: str) -> Callable:
+    """
+    Import a handler from "package.module:function" or "/path/to/file.py:function".
+    
+    Raises:
+        ImportError: If the module can't be imported or has no such function
+    """
+    module_name, _, attribute = spec.rpartition(":")
+    if not module_name or not attribute:
+        raise ImportError(f"Handler {spec!r} is not in the form module:function")
+    if module_name.endswith(".py"):
+        path = Path(module_name).resolve()
+        if not path.is_file():
+            raise ImportError(f"No handler module at {path}")
+        # One module per file, however many tools use it
+        name = "urpe_plugin_" + "".join(c if c.isalnum() else "_" for c in str(path))
+        module = sys.modules.get(name)
+        if module is None:
+            file_spec = importlib.util.spec_from_file_location(name, path)
+            module = importlib.util.module_from_spec(file_spec)
+            sys.modules[name] = module
+            try:
+                file_spec.loader.exec_module(module)
+            except BaseException:
+                del sys.modules[name]
+                raise
+    else:
+        module = importlib.import_module(module_name)
+    try:
+        return getattr(module, attribute)
+    except AttributeError:
+        raise ImportError(f"{module_name} has no handler {attribute!r}") from None
+
+
 class ToolRegistry:
-    """Registry for available tools."""
+    """
+    Registry for available tools.
+
+    The schema list sent to the LLM and each tool's argument validator are
+    built once and reused until the next `register`; `version` changes
+    whenever they are rebuilt.
+
+    Handlers given as import strings are imported on first call, and
+    loaders added with `add_loader` (plugin discovery) run the first time
+    the tools are looked at, so registering many tools costs little at
+    startup.
+    """
     
     def __init__(self):
         self._tools: Dict[str, Tool] = {}
-        self._handlers: Dict[str, Callable] = {}
+        self._handlers: Dict[str, Union[Callable, str]] = {}
+        self._validators: Dict[str, Callable[[Union[str, Dict[str, Any]]], Dict[str, Any]]] = {}
+        self._schemas: Optional[List[Dict[str, Any]]] = None
+        self._loaders: List[Callable[["ToolRegistry"], None]] = []
+        self.version = 0
     
-    def register(self, tool: Tool, handler: Callable):
-        """Register a tool with its handler."""
+    def register(self, tool: Tool, handler: Optional[Union[Callable, str]] = None):
+        """Register a tool with its handler (default: `tool.handler`), a callable or an import string."""
+        handler = handler if handler is not None else tool.handler
+        if handler is None:
+            raise ValueError(f"Tool {tool.name!r} has no handler")
         self._tools[tool.name] = tool
         self._handlers[tool.name] = handler
+        self._validators.pop(tool.name, None)
+        self._schemas = None
+        self.version += 1
+    
+    def add_loader(self, loader: Callable[["ToolRegistry"], None]):
+        """Run `loader(registry)` to register more tools before they're first looked up."""
+        self._loaders.append(loader)
+    
+    def _load(self):
+        if self._loaders:
+            loaders, self._loaders = self._loaders, []
+            for loader in loaders:
+                loader(self)
     
     def get_tool(self, name: str) -> Optional[Tool]:
         """Get a tool by name."""
+        self._load()
         return self._tools.get(name)
     
     def get_handler(self, name: str) -> Optional[Callable]:
-        """Get a tool's handler by name."""
-        return self._handlers.get(name)
+        """
+        Get a tool's handler by name, importing it on first use.
+        
+        Raises:
+            ImportError: If the handler's module can't be imported
+        """
+        self._load()
+        handler = self._handlers.get(name)
+        if isinstance(handler, str):
+            handler = self._handlers[name] = import_handler(handler)
+        return handler
     
     def list_tools(self) -> list[Tool]:
         """List all registered tools."""
+        self._load()
         return list(self._tools.values())
     
     def get_schemas(self) -> list[Dict[str, Any]]:
-        """Get OpenAI-compatible tool schemas for all registered tools."""
-        schemas = []
-        for tool in self._tools.values():
-            schemas.append({
-                "type": "function",
-                "function": {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "parameters": tool.parameters,
+        """
+        Get OpenAI-compatible tool schemas for all registered tools.
+        
+        The list is shared between calls until the next `register`, so
+        callers must copy it rather than modify it.
+        """
+        self._load()
+        if self._schemas is None:
+            self._schemas = [
+                {
+                    "type": "function",
+                    "function": {
+                        "name": tool.name,
+                        "description": tool.description,
+                        "parameters": tool.parameters,
+                    }
                 }
-            })
-        return schemas
+                for tool in self._tools.values()
+            ]
+        return self._schemas
+    
+    def validate(self, name: str, arguments: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Check a call's arguments against the tool's parameter schema.
+        
+        Args:
+            name: Registered tool name
+            arguments: Decoded arguments, or the JSON text the model sent
+        
+        Returns:
+            Keyword arguments for the handler, with coerced values
+        
+        Raises:
+            ArgumentError: If the arguments don't match the schema
+        """
+        self._load()
+        validator = self._validators.get(name)
+        if validator is None:
+            # Compiled on first use, so registering many tools stays cheap
+            validator = self._validators[name] = compile_schema(self._tools[name].parameters)
+        return validator(arguments)
 
 
 # Global registry instance
@@ -0,0 +1,143 @@
+"""Per-conversation cache of results from idempotent tools."""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from urpe.config import settings
+from urpe.tools.base import Tool
+from urpe.tools.shell import ToolResult
+
+
+def fingerprint(paths: Iterable[str]) -> Tuple[Tuple[str, Optional[int], Optional[int]], ...]:
+    """(path, mtime in ns, size) for each path, with None for files that don't exist."""
+    stamps = []
+    for path in sorted(set(paths)):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stamps.append((path, None, None))
+        else:
+            stamps.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+class _Scope:
+    """One conversation's entries, and how many times they were invalidated."""
+
+    __slots__ = ("entries", "generation")
+
+    def __init__(self):
+        self.entries: "OrderedDict[Hashable, Tuple[float, ToolResult]]" = OrderedDict()
+        self.generation = 0
+
+
+class ToolResultCache:
+    """
+    Results of calls to cacheable tools, kept per conversation.
+
+    An entry is keyed by the tool name, its normalized arguments and the
+    modification times of the files the tool says the call depends on, so
+    editing one of them makes the next call run again. Entries expire after
+    the tool's `cache_ttl` (or the tool_cache_ttl setting). Calls to tools
+    that aren't cacheable may change anything, so the executor invalidates
+    the conversation's entries around them.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_conversations: int = 256,
+    ):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self.max_conversations = max_conversations
+        self._scopes: "OrderedDict[str, _Scope]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self) -> float:
+        return self._ttl if self._ttl is not None else settings.tool_cache_ttl
+
+    @property
+    def max_entries(self) -> int:
+        return self._max_entries if self._max_entries is not None else settings.tool_cache_max_entries
+
+    def key(self, tool: Tool, arguments: Dict[str, Any]) -> Optional[Hashable]:
+        """Cache key for a call, or None if its result must not be reused."""
+        if not tool.cacheable:
+            return None
+        paths = tool.cache_paths(arguments) if tool.cache_paths else []
+        if paths is None:
+            return None
+        normalized = json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+        return tool.name, normalized, fingerprint(paths)
+
+    def _scope(self, scope: str) -> _Scope:
+        """A conversation's entries, created if needed, evicting the least recently used conversations."""
+        entry = self._scopes.get(scope)
+        if entry is None:
+            entry = self._scopes[scope] = _Scope()
+            while len(self._scopes) > self.max_conversations:
+                self._scopes.popitem(last=False)
+        self._scopes.move_to_end(scope)
+        return entry
+
+    def generation(self, scope: str) -> int:
+        """Changes whenever `scope` is invalidated; pass it to `put` from before the call ran."""
+        with self._lock:
+            entry = self._scopes.get(scope)
+            return entry.generation if entry else 0
+
+    def get(self, scope: str, key: Hashable) -> Optional[ToolResult]:
+        """A cached result that hasn't expired, else None."""
+        with self._lock:
+            entry = self._scopes.get(scope)
+            if entry is None or key not in entry.entries:
+                return None
+            expires_at, result = entry.entries[key]
+            if expires_at <= time.monotonic():
+                del entry.entries[key]
+                return None
+            entry.entries.move_to_end(key)
+            self._scopes.move_to_end(scope)
+            return result
+
+    def put(
+        self,
+        scope: str,
+        key: Hashable,
+        result: ToolResult,
+        ttl: Optional[float] = None,
+        generation: Optional[int] = None,
+    ):
+        """
+        Store a result, evicting the least recently used entries. Skipped
+        if the conversation was invalidated since `generation`, as the
+        result may predate a side effect.
+        """
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            entry = self._scope(scope)
+            if generation is not None and generation != entry.generation:
+                return
+            entry.entries[key] = (expires_at, result)
+            entry.entries.move_to_end(key)
+            while len(entry.entries) > self.max_entries:
+                entry.entries.popitem(last=False)
+
+    def invalidate(self, scope: str):
+        """Drop every entry of one conversation."""
+        with self._lock:
+            entry = self._scope(scope)
+            entry.entries.clear()
+            entry.generation += 1
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._scopes.clear()
@@ -0,0 +1,210 @@
+"""Async tool execution with bounded concurrency."""
+
+import asyncio
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
+from typing import Dict, Any, List, Tuple, Callable, Optional, Union
+
+from urpe.config import settings
+from urpe.lazy import PerLoop
+from urpe.tools.base import Tool, ToolRegistry, registry
+from urpe.tools.cache import ToolResultCache
+from urpe.tools.schema import ArgumentError
+from urpe.tools.shell import ToolResult
+from urpe.tracing import tracer
+
+
+class ToolExecutor:
+    """
+    Runs tool handlers without blocking the event loop.
+
+    Async handlers are awaited directly; sync handlers run in a bounded
+    thread pool. Each tool's `max_concurrency` caps how many of its calls
+    run at once, and `max_concurrency` caps the calls of all tools
+    together. Handlers that ask for confirmation serialize their own
+    prompts (see run_command_async), so confirmed calls still run
+    concurrently.
+
+    Calls made for a conversation (`scope`) to cacheable tools reuse the
+    result of an identical earlier call from `result_cache`, without
+    running the handler or asking for confirmation again.
+    """
+
+    def __init__(
+        self,
+        tool_registry: ToolRegistry,
+        max_workers: int = 8,
+        max_concurrency: Optional[int] = None,
+        result_cache: Optional[ToolResultCache] = None,
+    ):
+        self.registry = tool_registry
+        self.max_concurrency = max_concurrency
+        self.result_cache = result_cache if result_cache is not None else ToolResultCache()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="urpe-tool")
+        self._limits: PerLoop[Dict[str, asyncio.Semaphore]] = PerLoop(dict)
+
+    def _limit(self, key: str, value: int) -> asyncio.Semaphore:
+        limits = self._limits.get()
+        if key not in limits:
+            limits[key] = asyncio.Semaphore(value)
+        return limits[key]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _accepts_output(handler) -> bool:
+        """Whether a handler can stream output through an on_output callback."""
+        try:
+            return "on_output" in inspect.signature(handler).parameters
+        except (TypeError, ValueError):
+            return False
+
+    async def _call(
+        self,
+        handler,
+        arguments: Dict[str, Any],
+        on_output: Optional[Callable[[str], None]],
+    ) -> ToolResult:
+        loop = asyncio.get_running_loop()
+        if on_output and self._accepts_output(handler):
+            if inspect.iscoroutinefunction(handler):
+                arguments = {**arguments, "on_output": on_output}
+            else:
+                # Sync handlers run in a worker thread; hop back to the loop
+                arguments = {
+                    **arguments,
+                    "on_output": lambda text: loop.call_soon_threadsafe(on_output, text),
+                }
+
+        if inspect.iscoroutinefunction(handler):
+            return await handler(**arguments)
+        result = await loop.run_in_executor(self._pool, functools.partial(handler, **arguments))
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def execute(
+        self,
+        tool_name: str,
+        arguments: Union[str, Dict[str, Any]],
+        on_output: Optional[Callable[[str], None]] = None,
+        scope: Optional[str] = None,
+    ) -> ToolResult:
+        """
+        Execute a tool and return its result.
+
+        Arguments are checked against the tool's parameter schema first;
+        calls that don't match fail without running the handler, with an
+        error naming the bad field.
+
+        Args:
+            tool_name: Registered tool name
+            arguments: Keyword arguments for the handler, or the JSON text the model sent
+            on_output: Receives output chunks from handlers that stream
+            scope: Conversation the call is made for, enabling the result cache
+        """
+        tool = self.registry.get_tool(tool_name)
+        try:
+            handler = self.registry.get_handler(tool_name)
+        except Exception as e:
+            # Plugin handlers are imported on first call, running their module's code
+            return ToolResult(
+                success=False,
+                output="",
+                error=f"Could not load {tool_name}: {e}"
+            )
+        if not tool or not handler:
+            return ToolResult(
+                success=False,
+                output="",
+                error=f"Unknown tool: {tool_name}"
+            )
+        try:
+            arguments = self.registry.validate(tool_name, arguments)
+        except ArgumentError as e:
+            return ToolResult(
+                success=False,
+                output="",
+                error=f"Invalid arguments for {tool_name}: {e}"
+            )
+
+        caching = scope is not None and settings.tool_cache_enabled
+        cache_key = self.result_cache.key(tool, arguments) if caching else None
+        if cache_key is not None:
+            cached = self.result_cache.get(scope, cache_key)
+            if cached is not None:
+                return cached.model_copy(update={"cached": True})
+            generation = self.result_cache.generation(scope)
+        elif caching:
+            # A call that may have side effects can change what cached calls
+            # would return; dropped again once it's done
+            self.result_cache.invalidate(scope)
+
+        result = await self._limited(tool, handler, arguments, on_output)
+        if cache_key is not None and result.success:
+            self.result_cache.put(scope, cache_key, result, tool.cache_ttl, generation=generation)
+        elif caching and cache_key is None:
+            self.result_cache.invalidate(scope)
+        return result
+
+    async def _limited(
+        self,
+        tool: Tool,
+        handler,
+        arguments: Dict[str, Any],
+        on_output: Optional[Callable[[str], None]],
+    ) -> ToolResult:
+        """Run a handler once the tool's concurrency limits allow, turning errors into results."""
+        tool_name = tool.name
+        limits = []
+        if tool.max_concurrency:
+            limits.append(self._limit(f"tool:{tool_name}", tool.max_concurrency))
+        if self.max_concurrency:
+            limits.append(self._limit("all", self.max_concurrency))
+
+        try:
+            async with AsyncExitStack() as stack:
+                for limit in limits:
+                    await stack.enter_async_context(limit)
+                # Timed after the limits are acquired, so queueing isn't counted
+                with tracer.span(f"tool.{tool_name}"):
+                    return await self._call(handler, arguments, on_output)
+        except Exception as e:
+            return ToolResult(
+                success=False,
+                output="",
+                error=str(e)
+            )
+
+    async def execute_many(
+        self,
+        calls: List[Tuple[str, Union[str, Dict[str, Any]]]],
+        on_output: Optional[Callable[[int, str], None]] = None,
+        scope: Optional[str] = None,
+    ) -> List[ToolResult]:
+        """
+        Execute independent tool calls concurrently, returning results in call order.
+
+        Args:
+            calls: (tool name, arguments) pairs
+            on_output: Receives (call index, chunk) for streamed output
+            scope: Conversation the calls are made for, enabling the result cache
+        """
+        def output_for(index: int) -> Optional[Callable[[str], None]]:
+            if on_output is None:
+                return None
+            return functools.partial(on_output, index)
+
+        return list(await asyncio.gather(*(
+            self.execute(name, args, on_output=output_for(index), scope=scope)
+            for index, (name, args) in enumerate(calls)
+        )))
+
+    def shutdown(self):
+        """Stop the worker threads."""
+        self._pool.shutdown(wait=False)
+
+
+# Global executor for the global registry
+executor = ToolExecutor(registry)
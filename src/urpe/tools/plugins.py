@@ -0,0 +1,110 @@
+"""
+Discovery of tools shipped outside this package.
+
+Tools come from two places, both read only for their metadata; a tool's
+handler is imported the first time the tool is called.
+
+Entry points in the "urpe.tools" group name a Tool, a list of them, or
+their definitions as dicts. They should live in a lightweight module, with
+each handler given as an import string:
+
+    # pyproject.toml of a plugin package
+    [project.entry-points."urpe.tools"]
+    git = "urpe_git.tools:TOOLS"
+
+    # urpe_git/tools.py
+    TOOLS = [Tool(name="git_log", ..., handler="urpe_git.handlers:git_log")]
+
+Directories listed in the tool_dirs setting hold one manifest per file
+(*.yaml, *.yml or *.json), describing a tool or a list under `tools:`.
+Handlers may be a "file.py:function" path relative to the manifest:
+
+    name: word_count
+    description: Count the words in a file
+    parameters: {type: object, properties: {path: {type: string}}, required: [path]}
+    requires_confirmation: false
+    handler: word_count.py:count
+"""
+
+import warnings
+from importlib.metadata import entry_points
+from itertools import chain
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional
+
+import yaml
+
+from urpe.config import settings
+from urpe.tools.base import Tool, ToolRegistry
+
+ENTRY_POINT_GROUP = "urpe.tools"
+MANIFEST_SUFFIXES = (".yaml", ".yml", ".json")
+
+
+def _tools_from(value: Any) -> List[Tool]:
+    """Tools from a Tool, a definition dict, or a list of either."""
+    if isinstance(value, (Tool, dict)):
+        value = [value]
+    return [item if isinstance(item, Tool) else Tool(**item) for item in value]
+
+
+def entry_point_tools(group: str = ENTRY_POINT_GROUP) -> Iterator[Tool]:
+    """Tools named by installed packages' entry points."""
+    for entry_point in entry_points(group=group):
+        try:
+            tools = _tools_from(entry_point.load())
+        except Exception as e:
+            warnings.warn(f"Skipping tool plugin {entry_point.name!r}: {e}", RuntimeWarning)
+            continue
+        yield from tools
+
+
+def _manifest_tools(path: Path) -> List[Tool]:
+    with open(path, encoding="utf-8") as f:
+        data = yaml.safe_load(f)  # YAML is a superset of JSON
+    if isinstance(data, dict) and "tools" in data:
+        data = data["tools"]
+    tools = _tools_from(data)
+    for tool in tools:
+        # Handler files are relative to the manifest
+        if isinstance(tool.handler, str):
+            module, _, attribute = tool.handler.rpartition(":")
+            if module.endswith(".py"):
+                tool.handler = f"{(path.parent / module).resolve()}:{attribute}"
+    return tools
+
+
+def directory_tools(directory: str) -> Iterator[Tool]:
+    """Tools described by the manifests in a directory."""
+    root = Path(directory).expanduser()
+    if not root.is_dir():
+        return
+    for path in sorted(root.iterdir()):
+        if path.suffix not in MANIFEST_SUFFIXES:
+            continue
+        try:
+            tools = _manifest_tools(path)
+        except Exception as e:
+            warnings.warn(f"Skipping tool manifest {path}: {e}", RuntimeWarning)
+            continue
+        yield from tools
+
+
+def load_plugins(registry: ToolRegistry, directories: Optional[Iterable[str]] = None):
+    """
+    Register tools from entry points and tool directories.
+
+    Args:
+        registry: Registry to add the tools to
+        directories: Manifest directories (default: the tool_dirs setting)
+    """
+    if not settings.tool_plugins:
+        return
+    directories = settings.tool_dirs if directories is None else directories
+    for tool in chain(entry_point_tools(), *(directory_tools(d) for d in directories)):
+        if registry.get_tool(tool.name):
+            warnings.warn(f"Skipping plugin tool {tool.name!r}: a tool with that name exists", RuntimeWarning)
+        elif tool.handler is None:
+            warnings.warn(f"Skipping plugin tool {tool.name!r}: it has no handler", RuntimeWarning)
+        else:
+            registry.register(tool)
@@ -0,0 +1,251 @@
+"""Validation of tool call arguments against a tool's JSON Schema."""
+
+import json
+import re
+from typing import Any, Callable, Dict, List, Union
+
+# A compiled check: takes a value and its path, returns the (coerced) value
+Check = Callable[[Any, str], Any]
+
+_TYPE_NAMES = {
+    bool: "boolean",
+    int: "integer",
+    float: "number",
+    str: "string",
+    list: "array",
+    dict: "object",
+    type(None): "null",
+}
+
+
+class ArgumentError(ValueError):
+    """Tool call arguments that don't match the tool's parameter schema."""
+
+
+def _describe(value: Any) -> str:
+    text = json.dumps(value, default=str) if not isinstance(value, str) else repr(value)
+    if len(text) > 40:
+        text = text[:37] + "..."
+    return f"{_TYPE_NAMES.get(type(value), type(value).__name__)} {text}"
+
+
+def _where(path: str) -> str:
+    return f"{path}: " if path else ""
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _coerce_integer(value: Any) -> Any:
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            pass
+    return value
+
+
+def _coerce_number(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            try:
+                return float(value.strip())
+            except ValueError:
+                pass
+    return value
+
+
+def _coerce_boolean(value: Any) -> Any:
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    return value
+
+
+# type -> (matches, coerce); coercion fixes what models commonly get wrong,
+# like numbers and booleans sent as strings
+_TYPES: Dict[str, tuple] = {
+    "string": (lambda v: isinstance(v, str), lambda v: v),
+    "integer": (lambda v: isinstance(v, int) and not isinstance(v, bool), _coerce_integer),
+    "number": (_is_number, _coerce_number),
+    "boolean": (lambda v: isinstance(v, bool), _coerce_boolean),
+    "object": (lambda v: isinstance(v, dict), lambda v: v),
+    "array": (lambda v: isinstance(v, list), lambda v: v),
+    "null": (lambda v: v is None, lambda v: v),
+}
+
+
+def _compile_type(types: List[str]) -> Check:
+    known = [_TYPES[name] for name in types if name in _TYPES]
+    expected = " or ".join(types)
+
+    def check(value, path):
+        for matches, _ in known:
+            if matches(value):
+                return value
+        for matches, coerce in known:
+            coerced = coerce(value)
+            if coerced is not value and matches(coerced):
+                return coerced
+        raise ArgumentError(f"{_where(path)}expected {expected}, got {_describe(value)}")
+    return check
+
+
+def _compile_object(schema: Dict[str, Any]) -> Check:
+    properties = {name: _compile(sub) for name, sub in schema.get("properties", {}).items()}
+    required = list(schema.get("required", []))
+    additional = schema.get("additionalProperties", True)
+    extra = _compile(additional) if isinstance(additional, dict) else None
+
+    def check(value, path):
+        if not isinstance(value, dict):
+            return value
+        for name in required:
+            if name not in value:
+                raise ArgumentError(f"{_where(path)}missing required argument '{name}'")
+        result = {}
+        for name, item in value.items():
+            item_path = f"{path}.{name}" if path else name
+            if name in properties:
+                result[name] = properties[name](item, item_path)
+            elif extra is not None:
+                result[name] = extra(item, item_path)
+            elif additional is False:
+                allowed = ", ".join(properties) or "none"
+                raise ArgumentError(f"{_where(path)}unexpected argument '{name}' (allowed: {allowed})")
+            else:
+                result[name] = item
+        return result
+    return check
+
+
+def _compile_array(schema: Dict[str, Any]) -> Check:
+    items = _compile(schema["items"]) if isinstance(schema.get("items"), dict) else None
+
+    def check(value, path):
+        if not isinstance(value, list) or items is None:
+            return value
+        return [items(item, f"{path}[{index}]") for index, item in enumerate(value)]
+    return check
+
+
+def _compile_enum(options: List[Any]) -> Check:
+    def check(value, path):
+        if value not in options:
+            allowed = ", ".join(json.dumps(option) for option in options)
+            raise ArgumentError(f"{_where(path)}must be one of {allowed}, got {_describe(value)}")
+        return value
+    return check
+
+
+# keyword -> (applies to, measure, exceeds limit, message)
+_BOUNDS = {
+    "minimum": (_is_number, None, lambda v, n: v < n, "must be at least {}"),
+    "maximum": (_is_number, None, lambda v, n: v > n, "must be at most {}"),
+    "minLength": (lambda v: isinstance(v, str), len, lambda v, n: v < n, "must be at least {} characters"),
+    "maxLength": (lambda v: isinstance(v, str), len, lambda v, n: v > n, "must be at most {} characters"),
+    "minItems": (lambda v: isinstance(v, list), len, lambda v, n: v < n, "must have at least {} items"),
+    "maxItems": (lambda v: isinstance(v, list), len, lambda v, n: v > n, "must have at most {} items"),
+}
+
+
+def _compile_bound(keyword: str, limit: Any) -> Check:
+    applies, measure, exceeds, message = _BOUNDS[keyword]
+    message = message.format(limit)
+
+    def check(value, path):
+        if applies(value) and exceeds(measure(value) if measure else value, limit):
+            raise ArgumentError(f"{_where(path)}{message}")
+        return value
+    return check
+
+
+def _compile_pattern(pattern: str) -> Check:
+    compiled = re.compile(pattern)
+
+    def check(value, path):
+        if isinstance(value, str) and not compiled.search(value):
+            raise ArgumentError(f"{_where(path)}must match {pattern!r}")
+        return value
+    return check
+
+
+def _compile_any_of(schemas: List[Dict[str, Any]]) -> Check:
+    options = [_compile(sub) for sub in schemas]
+
+    def check(value, path):
+        errors = []
+        for option in options:
+            try:
+                return option(value, path)
+            except ArgumentError as e:
+                errors.append(str(e))
+        raise ArgumentError(" / ".join(errors))
+    return check
+
+
+def _compile(schema: Any) -> Check:
+    """Compile a schema into a chain of checks. Keywords not listed here are ignored."""
+    if not isinstance(schema, dict):
+        return lambda value, path: value
+    checks: List[Check] = []
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        checks.append(_compile_type(types))
+    if "enum" in schema:
+        checks.append(_compile_enum(list(schema["enum"])))
+    if "properties" in schema or "required" in schema or "additionalProperties" in schema:
+        checks.append(_compile_object(schema))
+    if "items" in schema:
+        checks.append(_compile_array(schema))
+    checks.extend(_compile_bound(keyword, schema[keyword]) for keyword in _BOUNDS if keyword in schema)
+    if "pattern" in schema:
+        checks.append(_compile_pattern(schema["pattern"]))
+    for keyword in ("anyOf", "oneOf"):
+        if keyword in schema:
+            checks.append(_compile_any_of(schema[keyword]))
+
+    if not checks:
+        return lambda value, path: value
+    if len(checks) == 1:
+        return checks[0]
+
+    def check(value, path):
+        for step in checks:
+            value = step(value, path)
+        return value
+    return check
+
+
+def compile_schema(schema: Dict[str, Any]) -> Callable[[Union[str, Dict[str, Any]]], Dict[str, Any]]:
+    """
+    Compile a tool's `parameters` schema into a validator.
+
+    The validator takes the arguments of a call, either decoded or as the
+    JSON text the model sent, and returns them as keyword arguments for the
+    handler, with strings coerced where the schema asks for a number or
+    boolean. Arguments that don't fit raise ArgumentError naming the
+    offending field. Supports the JSON Schema keywords tool definitions use
+    (type, properties, required, additionalProperties, items, enum,
+    minimum/maximum, min/maxLength, min/maxItems, pattern, anyOf/oneOf);
+    others are ignored.
+    """
+    check = _compile(schema)
+
+    def validate(arguments: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        if isinstance(arguments, str):
+            if not arguments.strip():
+                arguments = {}
+            else:
+                try:
+                    arguments = json.loads(arguments)
+                except json.JSONDecodeError as e:
+                    raise ArgumentError(f"arguments are not valid JSON ({e})") from None
+        if not isinstance(arguments, dict):
+            raise ArgumentError(f"arguments must be a JSON object, got {_describe(arguments)}")
+        return check(arguments, "")
+    return validate
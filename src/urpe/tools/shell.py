@@ -1,90 +1,418 @@
 """Shell command execution tool with human-in-the-loop confirmation."""
 
-import subprocess
+import asyncio
+import codecs
+import os
+import re
 import shlex
-from typing import Optional
+import signal
+import sys
+import weakref
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Callable, Awaitable, Deque, List
 
 from pydantic import BaseModel, Field
 from rich.console import Console
 from rich.prompt import Confirm
 
+from urpe.lazy import PerLoop
+
 console = Console()
 
+DEFAULT_MAX_OUTPUT_BYTES = 64_000
+DEFAULT_MAX_OUTPUT_LINES = 2_000
+READ_CHUNK_SIZE = 65_536
+
+# Set per request when commands run on behalf of another process (the
+# daemon): who to ask for confirmation, and the directory to run in.
+confirm_command: ContextVar[Optional[Callable[[str], Awaitable[bool]]]] = ContextVar(
+    "confirm_command", default=None
+)
+command_cwd: ContextVar[Optional[str]] = ContextVar("command_cwd", default=None)
+
 
 class ToolResult(BaseModel):
     """Result of a tool execution."""
     success: bool
     output: str
     error: Optional[str] = None
+    # Set when output was cut down to its head and tail
+    truncated: bool = False
+    omitted_bytes: int = 0
+    omitted_lines: int = 0
+    # Set when reused from an earlier identical call instead of running again
+    cached: bool = False
 
 
-def run_command(
+class CappedOutput:
+    """
+    Accumulates streamed text, keeping only its head and tail.
+
+    Half of the byte and line budget goes to the first lines and half to the
+    most recent ones; everything in between is counted and dropped, so memory
+    stays bounded no matter how much a command prints.
+    """
+
+    def __init__(self, max_bytes: int, max_lines: int):
+        self.head_bytes_limit = max_bytes // 2
+        self.tail_bytes_limit = max_bytes - self.head_bytes_limit
+        self.head_lines_limit = max(1, max_lines // 2)
+        self.tail_lines_limit = max(1, max_lines - self.head_lines_limit)
+
+        self.head: List[str] = []
+        self.head_bytes = 0
+        self.tail: Deque[str] = deque()
+        self.tail_bytes = 0
+        self.omitted_bytes = 0
+        self.omitted_lines = 0
+        self._partial = ""
+
+    @property
+    def truncated(self) -> bool:
+        return self.omitted_bytes > 0
+
+    def feed(self, text: str):
+        """Add a chunk of output."""
+        lines = (self._partial + text).splitlines(keepends=True)
+        self._partial = ""
+        if lines and not lines[-1].endswith(("\n", "\r")):
+            self._partial = lines.pop()
+            # Don't let a single endless line grow without bound
+            if len(self._partial) > self.tail_bytes_limit:
+                lines.append(self._partial)
+                self._partial = ""
+        for line in lines:
+            self._add_line(line)
+
+    def finish(self):
+        """Flush a trailing line without a newline."""
+        if self._partial:
+            self._add_line(self._partial)
+            self._partial = ""
+
+    def _add_line(self, line: str):
+        size = len(line.encode("utf-8"))
+        if (
+            not self.tail
+            and self.head_bytes + size <= self.head_bytes_limit
+            and len(self.head) < self.head_lines_limit
+        ):
+            self.head.append(line)
+            self.head_bytes += size
+            return
+
+        if size > self.tail_bytes_limit:
+            kept = line.encode("utf-8")[-self.tail_bytes_limit:].decode("utf-8", errors="ignore")
+            self.omitted_bytes += size - len(kept.encode("utf-8"))
+            line, size = kept, len(kept.encode("utf-8"))
+
+        self.tail.append(line)
+        self.tail_bytes += size
+        while self.tail and (
+            self.tail_bytes > self.tail_bytes_limit or len(self.tail) > self.tail_lines_limit
+        ):
+            dropped = self.tail.popleft()
+            dropped_size = len(dropped.encode("utf-8"))
+            self.tail_bytes -= dropped_size
+            self.omitted_bytes += dropped_size
+            self.omitted_lines += 1
+
+    def text(self) -> str:
+        """Return the retained output, marking where lines were omitted."""
+        if not self.truncated:
+            return "".join(self.head) + "".join(self.tail)
+        marker = f"\n... [{self.omitted_lines} lines, {self.omitted_bytes} bytes omitted] ...\n"
+        return "".join(self.head) + marker + "".join(self.tail)
+
+
+async def _pump(
+    stream: asyncio.StreamReader,
+    output: CappedOutput,
+    on_output: Optional[Callable[[str], None]],
+):
+    """Read a process stream until EOF, decoding and forwarding chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        data = await stream.read(READ_CHUNK_SIZE)
+        text = decoder.decode(data, final=not data)
+        if text:
+            output.feed(text)
+            if on_output:
+                on_output(text)
+        if not data:
+            break
+    output.finish()
+
+
+def _kill(process: asyncio.subprocess.Process):
+    """Kill the process and, on POSIX, every process it started."""
+    try:
+        if sys.platform == "win32":
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+# One prompt at a time per place prompts are shown (this terminal, or a
+# daemon client's connection), keyed by confirm function
+_prompt_locks: "PerLoop[weakref.WeakKeyDictionary]" = PerLoop(weakref.WeakKeyDictionary)
+
+
+def _prompt_lock(confirm: Callable[[str], Awaitable[bool]]) -> asyncio.Lock:
+    locks = _prompt_locks.get()
+    if confirm not in locks:
+        locks[confirm] = asyncio.Lock()
+    return locks[confirm]
+
+
+async def ask_confirmation(command: str) -> bool:
+    """Ask on this terminal whether a command may run."""
+    console.print(f"\n[bold yellow]Tool Request:[/bold yellow] run_command")
+    console.print(f"[dim]Command:[/dim] [cyan]{command}[/cyan]")
+    return await asyncio.to_thread(Confirm.ask, "[bold]Allow execution?[/bold]", default=False)
+
+
+async def run_command_async(
     command: str,
     require_confirmation: bool = True,
     timeout: int = 30,
+    max_output_bytes: int = DEFAULT_MAX_OUTPUT_BYTES,
+    max_output_lines: int = DEFAULT_MAX_OUTPUT_LINES,
+    on_output: Optional[Callable[[str], None]] = None,
+    cwd: Optional[str] = None,
 ) -> ToolResult:
     """
-    Execute a shell command with optional human confirmation.
-    
+    Execute a shell command, streaming its output as it arrives.
+
     Args:
         command: The shell command to execute
         require_confirmation: Whether to ask user before executing
         timeout: Maximum seconds to wait for command completion
-    
+        max_output_bytes: Bytes of stdout (and of stderr) to keep
+        max_output_lines: Lines of stdout (and of stderr) to keep
+        on_output: Called with each chunk of stdout/stderr text
+        cwd: Directory to run in (default: command_cwd, else the current one)
+
     Returns:
-        ToolResult with success status and output/error
+        ToolResult with success status, output/error and truncation info
     """
     if require_confirmation:
-        console.print(f"\n[bold yellow]Tool Request:[/bold yellow] run_command")
-        console.print(f"[dim]Command:[/dim] [cyan]{command}[/cyan]")
-        
-        if not Confirm.ask("[bold]Allow execution?[/bold]", default=False):
+        confirm = confirm_command.get() or ask_confirmation
+        # Only the prompt is serialized; the command runs outside the lock
+        async with _prompt_lock(confirm):
+            allowed = await confirm(command)
+        if not allowed:
             return ToolResult(
                 success=False,
                 output="",
                 error="User denied execution"
             )
-    
+
+    stdout = CappedOutput(max_output_bytes, max_output_lines)
+    stderr = CappedOutput(max_output_bytes, max_output_lines)
+    cwd = cwd or command_cwd.get()
+
     try:
-        import sys
         # Use cmd /c on Windows to avoid shell=True permission issues
         if sys.platform == "win32":
-            result = subprocess.run(
-                ["cmd", "/c", command],
-                capture_output=True,
-                text=True,
-                timeout=timeout,
+            process = await asyncio.create_subprocess_exec(
+                "cmd", "/c", command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd,
             )
         else:
-            result = subprocess.run(
+            # New session so a timeout can kill the whole process group
+            process = await asyncio.create_subprocess_shell(
                 command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=timeout,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd,
+                start_new_session=True,
             )
-        
-        output = result.stdout
-        error = result.stderr if result.returncode != 0 else None
-        
-        return ToolResult(
-            success=result.returncode == 0,
-            output=output,
-            error=error,
-        )
-        
-    except subprocess.TimeoutExpired:
+    except Exception as e:
         return ToolResult(
             success=False,
             output="",
-            error=f"Command timed out after {timeout} seconds"
+            error=str(e)
         )
-    except Exception as e:
+
+    pumps = asyncio.gather(
+        _pump(process.stdout, stdout, on_output),
+        _pump(process.stderr, stderr, on_output),
+    )
+    finished = asyncio.gather(pumps, process.wait())
+    try:
+        await asyncio.wait_for(finished, timeout)
+    except asyncio.TimeoutError:
+        _kill(process)
+        pumps.cancel()
+        await process.wait()
+        stdout.finish()
         return ToolResult(
             success=False,
-            output="",
-            error=str(e)
+            output=stdout.text(),
+            error=f"Command timed out after {timeout} seconds",
+            truncated=stdout.truncated,
+            omitted_bytes=stdout.omitted_bytes,
+            omitted_lines=stdout.omitted_lines,
         )
+    except BaseException:
+        _kill(process)
+        # Cancelled along with this call; consume their outcome so it isn't reported
+        for future in (finished, pumps):
+            future.cancel()
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        raise
+
+    success = process.returncode == 0
+    return ToolResult(
+        success=success,
+        output=stdout.text(),
+        error=None if success else stderr.text(),
+        truncated=stdout.truncated or stderr.truncated,
+        omitted_bytes=stdout.omitted_bytes + stderr.omitted_bytes,
+        omitted_lines=stdout.omitted_lines + stderr.omitted_lines,
+    )
+
+
+def run_command(
+    command: str,
+    require_confirmation: bool = True,
+    timeout: int = 30,
+    max_output_bytes: int = DEFAULT_MAX_OUTPUT_BYTES,
+    max_output_lines: int = DEFAULT_MAX_OUTPUT_LINES,
+) -> ToolResult:
+    """
+    Execute a shell command with optional human confirmation.
+
+    Blocking wrapper around run_command_async for callers outside an
+    event loop.
+
+    Args:
+        command: The shell command to execute
+        require_confirmation: Whether to ask user before executing
+        timeout: Maximum seconds to wait for command completion
+        max_output_bytes: Bytes of stdout (and of stderr) to keep
+        max_output_lines: Lines of stdout (and of stderr) to keep
+
+    Returns:
+        ToolResult with success status and output/error
+    """
+    return asyncio.run(run_command_async(
+        command,
+        require_confirmation=require_confirmation,
+        timeout=timeout,
+        max_output_bytes=max_output_bytes,
+        max_output_lines=max_output_lines,
+    ))
+
+
+# Commands whose output depends only on the files they're given and the
+# working directory, and that change nothing. Recursive commands (grep -r,
+# du, tree) and ones reading the whole working tree (git status, git diff)
+# aren't listed: no fingerprint of the files named covers what they read.
+READ_ONLY_COMMANDS = frozenset({"ls", "cat", "head", "tail", "wc", "pwd", "stat", "file"})
+# ... and git commands that only read commits, the index or named files
+READ_ONLY_GIT_COMMANDS = frozenset({"log", "show", "blame", "ls-files"})
+# Options making git read refs other than HEAD, which aren't fingerprinted
+GIT_REF_OPTIONS = ("--all", "--branches", "--tags", "--remotes", "--glob", "--reflog")
+# HEAD and revisions relative to it, like HEAD^ or HEAD^2:README.md
+GIT_HEAD_REVISION = re.compile(r"HEAD([~^]\d*)*(:.*)?")
+SHELL_METACHARACTERS = frozenset(";&|<>$`(){}*?[]~!\n")
+
+
+def _git_paths(cwd: str) -> Optional[List[str]]:
+    """The files whose changes move the commits and index of the repository at `cwd`."""
+    directory = cwd
+    while not os.path.isdir(os.path.join(directory, ".git")):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            # Not a repository, or a worktree whose .git is a file
+            return None
+        directory = parent
+    git_dir = os.path.join(directory, ".git")
+    paths = [os.path.join(git_dir, name) for name in ("HEAD", "index", "packed-refs")]
+    try:
+        with open(paths[0]) as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+    if head.startswith("ref: "):
+        paths.append(os.path.join(git_dir, head[len("ref: "):]))
+    return paths
+
+
+def read_only_command_paths(arguments: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Files a run_command call depends on, if it is a single read-only
+    command (`ls`, `cat file`, `git log`, ...), else None.
+
+    These are the working directory, every argument that could name a
+    file (missing ones too, so creating them counts as a change), the
+    entries of directories `ls` lists and, for git, HEAD, the branch it
+    points to and the index. The cached output of such a command is
+    dropped when any of them changes. Git commands that may read other
+    refs (`git log main`, `git show --all`) aren't cacheable.
+    """
+    command = arguments.get("command", "")
+    if sys.platform == "win32" or any(char in SHELL_METACHARACTERS for char in command):
+        return None
+    try:
+        words = shlex.split(command)
+    except ValueError:
+        return None
+    if not words:
+        return None
+    options = [word for word in words[1:] if word.startswith("-")]
+    if words[0] == "git":
+        if len(words) < 2 or words[1] not in READ_ONLY_GIT_COMMANDS:
+            return None
+        # ls-files options can list untracked files, which the index doesn't cover
+        if words[1] == "ls-files" and options:
+            return None
+        if any(option.startswith(GIT_REF_OPTIONS) for option in options):
+            return None
+    elif words[0] not in READ_ONLY_COMMANDS:
+        return None
+    elif words[0] == "ls" and any(
+        option == "--recursive" or (not option.startswith("--") and "R" in option) for option in options
+    ):
+        return None
+
+    cwd = os.path.abspath(command_cwd.get() or os.getcwd())
+    paths = [cwd]
+    if words[0] == "git":
+        git_paths = _git_paths(cwd)
+        if git_paths is None:
+            return None
+        paths += git_paths
+        # Anything else that isn't a file may be a branch, tag or commit
+        # (`git log main`), whose moves the fingerprint wouldn't see
+        arguments = words[2:]
+        if "--" in arguments:
+            arguments = arguments[:arguments.index("--")]
+        if any(
+            not word.startswith("-")
+            and not GIT_HEAD_REVISION.fullmatch(word)
+            and not os.path.exists(os.path.join(cwd, word))
+            for word in arguments
+        ):
+            return None
+    named = [os.path.join(cwd, word) for word in words[1:] if not word.startswith("-")]
+    paths += named
+    if words[0] == "ls":
+        # `ls -l` shows sizes and times, which don't change the directory's own
+        for directory in named or [cwd]:
+            if os.path.isdir(directory):
+                try:
+                    paths += [entry.path for entry in os.scandir(directory)]
+                except OSError:
+                    return None
+    return paths
 
 
 # Tool schema for LLM
@@ -0,0 +1,232 @@
+"""Lightweight spans for timing the agent's hot paths.
+
+Tracing is off until `tracer.configure(path)` is called. While it is off,
+`tracer.span()` returns a shared no-op and `@traced` wrappers only check a
+flag, so instrumented code pays almost nothing.
+
+Finished spans are appended to a JSON lines file, one span per line, with
+OpenTelemetry's field names (traceId, spanId, parentSpanId, name,
+startTimeUnixNano, endTimeUnixNano, attributes), so they can be converted to
+OTLP or read by `urpe stats`.
+"""
+
+import atexit
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Span attributes `summarize` totals
+TOKEN_ATTRIBUTES = ("prompt_tokens", "cached_tokens")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("urpe_span", default=None)
+
+
+class Span:
+    """A timed operation; use as a (sync or async) context manager or call end()."""
+
+    __slots__ = ("tracer", "name", "attributes", "trace_id", "span_id", "parent_id", "start_ns", "_previous")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any], activate: bool):
+        parent = _current.get()
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self._previous = parent
+        if activate:
+            # set() rather than a reset token: spans may end in another
+            # context than they started in (e.g. across generator yields)
+            _current.set(self)
+        self.start_ns = time.time_ns()
+
+    def set(self, **attributes):
+        """Add attributes to the span."""
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None):
+        end_ns = time.time_ns()
+        if _current.get() is self:
+            _current.set(self._previous)
+        if error is not None:
+            self.attributes["error"] = type(error).__name__
+        self.tracer._record({
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": end_ns,
+            "attributes": self.attributes,
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.end(exc)
+
+
+class _NoopSpan:
+    """Stands in for Span while tracing is off."""
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def end(self, error: Optional[BaseException] = None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Collects finished spans and appends them to a file in batches."""
+
+    def __init__(self, batch_size: int = 256):
+        self.enabled = False
+        self.path: Optional[str] = None
+        self.batch_size = batch_size
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._atexit = False
+
+    def configure(self, path: Optional[str]):
+        """Write spans to `path` from now on; None turns tracing off."""
+        self.flush()
+        self.path = path
+        self.enabled = path is not None
+        if self.enabled:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            if not self._atexit:
+                atexit.register(self.flush)
+                self._atexit = True
+
+    def span(self, name: str, activate: bool = True, **attributes):
+        """
+        Start a span. Spans started while it is active become its children
+        unless `activate` is False.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes, activate)
+
+    def record(self, name: str, duration_ns: int, **attributes):
+        """Record a span that ends now and lasted `duration_ns`, e.g. time summed over a loop."""
+        if not self.enabled:
+            return
+        span = Span(self, name, attributes, activate=False)
+        span.start_ns = span.start_ns - duration_ns
+        span.end()
+
+    def _record(self, span: Dict[str, Any]):
+        with self._lock:
+            self._buffer.append(span)
+            if len(self._buffer) < self.batch_size:
+                return
+        self.flush()
+
+    def flush(self):
+        """Append buffered spans to the trace file."""
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+            if not spans or self.path is None:
+                return
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(span, default=str) + "\n" for span in spans)
+
+
+tracer = Tracer()
+
+
+def traced(name: str) -> Callable:
+    """Decorator recording a span around each call of a sync or async function."""
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await func(*args, **kwargs)
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of some samples, or 0.0 if there are none."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(path: str) -> Dict[str, Dict[str, float]]:
+    """
+    Per span name: count, total and p50/p95/p99 duration in milliseconds,
+    from a trace file written by the tracer. Token counts recorded on spans
+    (TOKEN_ATTRIBUTES) are summed.
+    """
+    durations: Dict[str, List[float]] = {}
+    tokens: Dict[str, Dict[str, int]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                span = json.loads(line)
+                duration = (span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e6
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+            durations.setdefault(span["name"], []).append(duration)
+            for attribute in TOKEN_ATTRIBUTES:
+                value = span.get("attributes", {}).get(attribute)
+                if isinstance(value, int):
+                    counts = tokens.setdefault(span["name"], {})
+                    counts[attribute] = counts.get(attribute, 0) + value
+
+    summary = {}
+    for name, values in durations.items():
+        summary[name] = {
+            "count": len(values),
+            "total_ms": sum(values),
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99),
+            **tokens.get(name, {}),
+        }
+    return summary
@@ -0,0 +1,12 @@
+"""Fixtures shared by the tests."""
+
+import pytest
+
+from urpe.memory import MemoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MemoryStore(db_path=str(tmp_path / "test.db"))
+    yield store
+    store.close()
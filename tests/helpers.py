@@ -0,0 +1,33 @@
+"""Fake LLM streams shared by the tests."""
+
+import json
+from types import SimpleNamespace
+
+
+def fake_stream(*deltas):
+    """Build an async LiteLLM-style stream yielding the given deltas."""
+    async def stream():
+        for delta in deltas:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+    return stream()
+
+
+def text_delta(text):
+    return SimpleNamespace(content=text, tool_calls=None)
+
+
+def tool_delta(index, call_id, name, arguments):
+    function = SimpleNamespace(name=name, arguments=arguments)
+    return SimpleNamespace(
+        content=None,
+        tool_calls=[SimpleNamespace(index=index, id=call_id, function=function)],
+    )
+
+
+def command_delta(command):
+    """A run_command tool call."""
+    return tool_delta(0, "call-1", "run_command", json.dumps({"command": command}))
+
+
+async def collect(agen):
+    return [chunk async for chunk in agen]
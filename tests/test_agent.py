@@ -1,10 +1,16 @@
 """Tests for agent module."""
 
+import threading
+from types import SimpleNamespace
+
 import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
 
 from urpe.agent import Agent
 from urpe.config import Settings
+from urpe.memory import AsyncMemoryStore
+from urpe.tools import ToolResult
+from tests.helpers import fake_stream, text_delta, collect
 
 
 @pytest.fixture
@@ -13,6 +19,12 @@ def mock_settings():
     with patch("urpe.agent.settings") as mock:
         mock.default_model = "test-model"
         mock.gemini_api_key = "test-key"
+        mock.context_max_tokens = 100_000
+        mock.context_strategy = "sliding_window"
+        mock.context_pinned_messages = 1
+        mock.context_tokenizer = "approx"
+        mock.stream_coalesce_interval = 0.03
+        mock.stream_coalesce_max_chars = 4096
         yield mock
 
 
@@ -64,3 +76,158 @@ def test_get_tools_schema_disabled(mock_settings):
     schemas = agent._get_tools_schema()
     
     assert schemas is None
+
+
+@pytest.mark.asyncio
+async def test_process_message_reads_history_once(agent):
+    """Test that turns append to the in-memory context instead of re-reading it."""
+    with patch("urpe.agent.memory") as mock_memory, \
+            patch("urpe.agent.get_llm_response", new_callable=AsyncMock) as mock_llm:
+        mock_memory.get_llm_messages.return_value = [{"role": "user", "content": "earlier"}]
+        mock_memory.get_summary.return_value = None
+        mock_llm.side_effect = lambda **kwargs: fake_stream(text_delta("ok"))
+        
+        await agent.resume_conversation("conv-1")
+        await collect(agent.process_message("first"))
+        await collect(agent.process_message("second"))
+        
+        mock_memory.get_llm_messages.assert_called_once_with("conv-1")
+        assert mock_memory.add_message.call_count == 4
+        assert [m["content"] for m in agent.messages] == ["earlier", "first", "ok", "second", "ok"]
+
+
+@pytest.mark.asyncio
+async def test_process_message_keeps_tool_call_context(agent):
+    """Test that tool results follow the assistant message that requested them."""
+    tool_delta = SimpleNamespace(
+        content=None,
+        tool_calls=[SimpleNamespace(
+            index=0,
+            id="call-1",
+            function=SimpleNamespace(name="run_command", arguments='{"command": "ls"}'),
+        )],
+    )
+    responses = iter([fake_stream(tool_delta), fake_stream(text_delta("done"))])
+    
+    with patch("urpe.agent.memory"), \
+            patch("urpe.agent.get_llm_response", new_callable=AsyncMock) as mock_llm, \
+            patch.object(agent.executor, "execute_many", new_callable=AsyncMock) as mock_execute:
+        mock_execute.return_value = [ToolResult(success=True, output="file.txt")]
+        mock_llm.side_effect = lambda **kwargs: next(responses)
+        
+        await collect(agent.process_message("list files"))
+    
+    roles = [m["role"] for m in agent.messages]
+    assert roles == ["user", "assistant", "tool", "assistant"]
+    assert agent.messages[1]["tool_calls"][0]["id"] == "call-1"
+    assert agent.messages[2]["tool_call_id"] == "call-1"
+    assert mock_execute.await_args.args[0] == [("run_command", '{"command": "ls"}')]
+
+
+@pytest.mark.asyncio
+async def test_process_message_with_async_memory_store(mock_settings, tmp_path):
+    """Test that the agent works transparently with an async memory store."""
+    store = AsyncMemoryStore(db_path=str(tmp_path / "test.db"))
+    agent = Agent(model="test-model", enable_tools=False, memory_store=store)
+    
+    with patch("urpe.agent.get_llm_response", new_callable=AsyncMock) as mock_llm:
+        mock_llm.side_effect = lambda **kwargs: fake_stream(text_delta("hi"))
+        await collect(agent.process_message("hello"))
+    
+    messages = await store.get_messages(agent.conversation_id)
+    await store.close()
+    
+    assert [m["content"] for m in messages] == ["hello", "hi"]
+
+
+@pytest.mark.asyncio
+async def test_sync_memory_store_runs_off_the_event_loop(mock_settings, tmp_path):
+    """Test that a sync store's writes run in a worker thread, not on the loop."""
+    from urpe.memory import MemoryStore
+    
+    store = MemoryStore(db_path=str(tmp_path / "test.db"))
+    threads = []
+    add_message = store.add_message
+    
+    def recording_add_message(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return add_message(*args, **kwargs)
+    
+    agent = Agent(model="test-model", enable_tools=False, memory_store=store)
+    with patch.object(store, "add_message", side_effect=recording_add_message), \
+            patch("urpe.agent.get_llm_response", new_callable=AsyncMock) as mock_llm:
+        mock_llm.side_effect = lambda **kwargs: fake_stream(text_delta("hi"))
+        await collect(agent.process_message("hello"))
+    
+    messages = store.get_messages(agent.conversation_id)
+    store.close()
+    
+    assert [m["content"] for m in messages] == ["hello", "hi"]
+    assert len(threads) == 2 and threading.get_ident() not in threads
+
+
+def test_start_conversation_rejects_async_store(mock_settings, tmp_path):
+    """Test that the sync entry point points async store users to astart_conversation."""
+    agent = Agent(memory_store=AsyncMemoryStore(db_path=str(tmp_path / "test.db")))
+    
+    with pytest.raises(TypeError):
+        agent.start_conversation()
+
+
+@pytest.mark.asyncio
+async def test_process_message_streams_tool_output(agent):
+    """Test that streamed tool output is yielded live instead of repeated at the end."""
+    tool_delta = SimpleNamespace(
+        content=None,
+        tool_calls=[SimpleNamespace(
+            index=0,
+            id="call-1",
+            function=SimpleNamespace(name="run_command", arguments='{"command": "ls"}'),
+        )],
+    )
+    responses = iter([fake_stream(tool_delta), fake_stream(text_delta("done"))])
+    
+    async def execute_many(calls, on_output=None, scope=None):
+        on_output(0, "file.txt\n")
+        return [ToolResult(success=True, output="file.txt\n")]
+    
+    with patch("urpe.agent.memory"), \
+            patch("urpe.agent.get_llm_response", new_callable=AsyncMock) as mock_llm, \
+            patch.object(agent.executor, "execute_many", side_effect=execute_many):
+        mock_llm.side_effect = lambda **kwargs: next(responses)
+        
+        chunks = await collect(agent.process_message("list files"))
+    
+    assert chunks.count("file.txt\n") == 1
+    assert agent.messages[2]["content"] == "file.txt\n"
+
+
+@pytest.mark.asyncio
+async def test_resumed_conversation_replays_tool_calls(mock_settings, tmp_path):
+    """Test that a resumed conversation has the same LLM context as the original."""
+    from urpe.memory import MemoryStore
+    
+    tool_delta = SimpleNamespace(
+        content=None,
+        tool_calls=[SimpleNamespace(
+            index=0,
+            id="call-1",
+            function=SimpleNamespace(name="run_command", arguments='{"command": "ls"}'),
+        )],
+    )
+    responses = iter([fake_stream(tool_delta), fake_stream(text_delta("done"))])
+    store = MemoryStore(db_path=str(tmp_path / "test.db"))
+    agent = Agent(model="test-model", memory_store=store)
+    
+    with patch("urpe.agent.get_llm_response", new_callable=AsyncMock) as mock_llm, \
+            patch.object(agent.executor, "execute_many", new_callable=AsyncMock) as mock_execute:
+        mock_execute.return_value = [ToolResult(success=True, output="file.txt")]
+        mock_llm.side_effect = lambda **kwargs: next(responses)
+        await collect(agent.process_message("list files"))
+    
+    resumed = Agent(model="test-model", memory_store=store)
+    await resumed.resume_conversation(agent.conversation_id)
+    store.close()
+    
+    assert resumed.messages == agent.messages
+    assert resumed.messages[2]["tool_call_id"] == "call-1"
@@ -0,0 +1,102 @@
+"""Tests for batch mode."""
+
+import asyncio
+import io
+import json
+
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+
+from urpe.batch import completed_ids, read_items, run_batch
+from urpe.sessions import SessionManager
+from tests.helpers import fake_stream, text_delta
+
+
+async def _echo_llm(**kwargs):
+    prompt = kwargs["messages"][-1]["content"]
+    if prompt == "fail":
+        raise RuntimeError("provider error")
+    return fake_stream(text_delta(f"re: {prompt}"))
+
+
+@pytest_asyncio.fixture
+async def manager(store):
+    manager = SessionManager(memory_store=store, model="test-model", enable_tools=False)
+    yield manager
+    await manager.close()
+
+
+def test_read_items():
+    """Test that strings and objects are accepted and bad lines become errors."""
+    lines = [
+        '"just a prompt"\n',
+        '{"id": "a", "prompt": "hi", "model": "m"}\n',
+        "\n",
+        "{not json\n",
+        '{"id": "b"}\n',
+    ]
+    items = list(read_items(lines))
+
+    assert [(i.id, i.prompt, i.model) for i in items[:2]] == [("1", "just a prompt", None), ("a", "hi", "m")]
+    assert items[2].id == "4" and "Invalid JSON" in items[2].error
+    assert items[3].id == "5" and items[3].error
+
+
+def test_completed_ids_repairs_partial_line(tmp_path):
+    """Test that finished ids are found and a line cut short by a crash is dropped."""
+    path = tmp_path / "results.jsonl"
+    path.write_text(
+        '{"id": "1", "response": "ok"}\n'
+        '{"id": "2", "error": "boom"}\n'
+        '{"id": "3", "resp'
+    )
+
+    assert completed_ids(str(path)) == {"1"}
+    assert path.read_text().endswith('"boom"}\n')
+    assert completed_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+@pytest.mark.asyncio
+async def test_run_batch_writes_results(manager):
+    """Test that every item gets a result line, including failures."""
+    output = io.StringIO()
+    items = read_items(['"one"\n', '"two"\n', '"fail"\n'])
+
+    with patch("urpe.agent.get_llm_response", _echo_llm):
+        report = await run_batch(items, output, manager, concurrency=2)
+
+    results = {r["id"]: r for r in map(json.loads, output.getvalue().splitlines())}
+    assert results["1"]["response"] == "re: one"
+    assert results["2"]["response"] == "re: two"
+    assert results["3"]["error"] == "provider error"
+    assert (report.succeeded, report.failed) == (2, 1)
+    assert len(report.latencies_ms) == 2
+    # Finished conversations aren't kept around
+    assert len(manager) == 0
+
+
+@pytest.mark.asyncio
+async def test_run_batch_bounds_concurrency_and_skips(manager):
+    """Test that at most `concurrency` items run at once and skipped ids aren't run."""
+    running = 0
+    peak = 0
+
+    async def slow_llm(**kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return fake_stream(text_delta("ok"))
+
+    output = io.StringIO()
+    items = read_items([json.dumps({"id": str(n), "prompt": f"p{n}"}) for n in range(12)])
+
+    with patch("urpe.agent.get_llm_response", slow_llm):
+        report = await run_batch(items, output, manager, concurrency=3, skip={"0", "1"})
+
+    assert peak == 3
+    assert report.skipped == 2
+    assert report.succeeded == 10
+    assert {json.loads(line)["id"] for line in output.getvalue().splitlines()} == {str(n) for n in range(2, 12)}
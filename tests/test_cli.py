@@ -0,0 +1,82 @@
+"""Tests for CLI startup."""
+
+import io
+import subprocess
+import sys
+
+import pytest
+from rich.console import Console
+from unittest.mock import patch
+
+
+def test_import_is_lazy(tmp_path):
+    """Test that importing the CLI loads no heavy modules and opens no database."""
+    code = (
+        "import sys, urpe.cli; "
+        "print(sorted(m for m in ('litellm', 'sqlalchemy', 'urpe.agent') if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=tmp_path, capture_output=True, text=True, check=True
+    )
+    
+    assert result.stdout.strip() == "[]"
+    assert not (tmp_path / "data").exists()
+
+
+def test_lazy_object_builds_once():
+    """Test that a lazy singleton is built on first attribute access only."""
+    from urpe.lazy import LazyObject
+    
+    calls = []
+    
+    class Thing:
+        value = 1
+    
+    def factory():
+        calls.append(1)
+        return Thing()
+    
+    lazy = LazyObject(factory)
+    assert not lazy.is_resolved
+    assert lazy.value == 1
+    lazy.value = 2
+    assert lazy.value == 2
+    assert calls == [1]
+
+
+@pytest.mark.asyncio
+async def test_confirmations_pause_the_reply_stream():
+    """Test that commands confirmed mid-reply, locally or through the daemon, pause the live region."""
+    from urpe import cli
+    from urpe.render import MarkdownStream
+    
+    live = []
+    
+    async def ask(command):
+        live.append(stream._live.is_started)
+        return True
+    
+    with patch("urpe.cli.ask_confirmation", ask):
+        with MarkdownStream(Console(file=io.StringIO())) as stream, cli.confirming_over(stream):
+            # What run_command_async asks locally, and what the daemon client asks
+            assert await cli.confirm_command.get()("ls") is True
+            assert await cli.confirm("ls") is True
+        assert await cli.confirm("ls") is True
+    
+    assert live == [False, False, False]
+
+
+def test_per_loop_state():
+    """Test that per-loop state is built once per event loop."""
+    import asyncio
+    from urpe.lazy import PerLoop
+    
+    state = PerLoop(list)
+    
+    async def use():
+        first = state.get()
+        first.append(1)
+        return first is state.get(), len(state.get())
+    
+    assert asyncio.run(use()) == (True, 1)
+    assert asyncio.run(use()) == (True, 1)
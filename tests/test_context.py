@@ -0,0 +1,114 @@
+"""Tests for context window module."""
+
+import pytest
+from unittest.mock import AsyncMock
+
+from urpe.context import (
+    ApproxTokenizer,
+    CachedTokenizer,
+    ContextSummary,
+    ContextWindow,
+)
+
+
+def _conversation(turns, size=40):
+    """Build alternating user/assistant messages of roughly `size` tokens each."""
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"q{i} " + "x" * size * 4})
+        messages.append({"role": "assistant", "content": f"a{i} " + "y" * size * 4})
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_fits_in_budget_unchanged():
+    """Test that short conversations are sent as-is."""
+    window = ContextWindow(max_tokens=10_000)
+    messages = _conversation(3)
+    
+    result = await window.build(messages)
+    
+    assert result.messages == messages
+    assert result.tokens == window.count_tokens(messages)
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_keeps_pinned_and_recent():
+    """Test that the oldest unpinned messages are dropped first."""
+    window = ContextWindow(max_tokens=500, pinned=1)
+    messages = _conversation(20)
+    
+    result = await window.build(messages)
+    
+    assert result.tokens <= 500
+    assert result.messages[0] == messages[0]
+    assert result.messages[-1] == messages[-1]
+    assert len(result.messages) < len(messages)
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_skips_orphaned_tool_results():
+    """Test that the window never starts with a tool result."""
+    window = ContextWindow(max_tokens=200, pinned=0)
+    messages = [
+        {"role": "user", "content": "x" * 400},
+        {"role": "assistant", "content": "", "tool_calls": [{"id": "1"}]},
+        {"role": "tool", "tool_call_id": "1", "content": "y" * 200},
+        {"role": "assistant", "content": "done"},
+    ]
+    
+    result = await window.build(messages, reserved_tokens=130)
+    
+    assert result.messages[0]["role"] != "tool"
+
+
+@pytest.mark.asyncio
+async def test_summarize_reuses_stored_summary():
+    """Test that a stored summary is reused instead of recomputed."""
+    summarizer = AsyncMock(return_value="summary")
+    window = ContextWindow(max_tokens=500, strategy="summarize", summarizer=summarizer)
+    messages = _conversation(20)
+    
+    first = await window.build(messages)
+    assert summarizer.await_count == 1
+    assert first.summary.covered_until > 1
+    assert first.messages[1]["content"].endswith("summary")
+    assert first.tokens <= 500
+    
+    messages.append({"role": "user", "content": "short"})
+    second = await window.build(messages, summary=first.summary)
+    
+    assert summarizer.await_count == 1
+    assert second.summary == first.summary
+    assert second.messages[-1]["content"] == "short"
+
+
+@pytest.mark.asyncio
+async def test_summarize_rolls_previous_summary():
+    """Test that newly evicted messages are folded into the previous summary."""
+    summarizer = AsyncMock(return_value="rolled")
+    window = ContextWindow(max_tokens=500, strategy="summarize", summarizer=summarizer)
+    messages = _conversation(40)
+    
+    result = await window.build(messages, summary=ContextSummary(content="old", covered_until=5))
+    
+    previous, evicted = summarizer.await_args.args
+    assert previous == "old"
+    assert evicted[0] == messages[5]
+    assert result.summary.covered_until > 5
+
+
+def test_summarize_requires_summarizer():
+    """Test that the summarize strategy needs a summarizer."""
+    with pytest.raises(ValueError):
+        ContextWindow(max_tokens=100, strategy="summarize")
+
+
+def test_cached_tokenizer():
+    """Test that token counts are memoized."""
+    tokenizer = CachedTokenizer(ApproxTokenizer())
+    
+    assert tokenizer.count("abcdefgh") == 2
+    tokenizer.count("abcdefgh")
+    
+    assert tokenizer.count.cache_info().hits == 1
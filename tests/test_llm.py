@@ -0,0 +1,479 @@
+"""Tests for the LLM wrapper, its response cache, request scheduler and model router."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from urpe.llm import PRIORITY_BATCH, PRIORITY_INTERACTIVE, LLMLimiter, get_llm_response, request_key
+from urpe.llm_cache import ResponseCache, replay
+from urpe.llm_fallback import LatencyHistogram, ModelRouter
+from urpe.llm_scheduler import RequestScheduler, TokenBucket, retry_after
+from tests.helpers import fake_stream, text_delta, tool_delta, collect
+
+
+@pytest.fixture
+def response_cache(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "cache.db"))
+    yield cache
+    cache.close()
+
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def test_cache_key_is_stable():
+    """Test that keys ignore dict ordering but not content or params."""
+    key = request_key("m", [{"role": "user", "content": "hi"}], temperature=0)
+    assert key == request_key("m", [{"content": "hi", "role": "user"}], temperature=0)
+    assert key != request_key("m", [{"role": "user", "content": "hello"}], temperature=0)
+    assert key != request_key("m", [{"role": "user", "content": "hi"}], temperature=1)
+    assert key != request_key("other", [{"role": "user", "content": "hi"}], temperature=0)
+
+
+@pytest.mark.asyncio
+async def test_record_and_replay(response_cache):
+    """Test that a recorded stream replays with the same content and tool calls."""
+    key = request_key("m", MESSAGES)
+    stream = fake_stream(
+        text_delta("Let me check. "),
+        tool_delta(0, "call-1", "run_command", '{"comm'),
+        tool_delta(0, None, None, 'and": "ls"}'),
+    )
+    await collect(response_cache.record(key, "m", stream))
+
+    chunks = await collect(replay(response_cache.get(key)))
+    deltas = [chunk.choices[0].delta for chunk in chunks]
+    assert deltas[0].content == "Let me check. "
+    assert deltas[1].tool_calls[0].id == "call-1"
+    assert deltas[1].tool_calls[0].function.name == "run_command"
+    assert "".join(d.tool_calls[0].function.arguments for d in deltas[1:]) == '{"command": "ls"}'
+    assert response_cache.stats()["hits_memory"] == 1
+
+
+@pytest.mark.asyncio
+async def test_partial_stream_is_not_cached(response_cache):
+    """Test that an abandoned stream is not stored."""
+    key = request_key("m", MESSAGES)
+    recording = response_cache.record(key, "m", fake_stream(text_delta("a"), text_delta("b")))
+    await recording.__anext__()
+    await recording.aclose()
+
+    assert response_cache.get(key) is None
+    assert response_cache.stats()["misses"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    """Test that responses persist across cache instances."""
+    path = str(tmp_path / "cache.db")
+    first = ResponseCache(db_path=path)
+    first.put("key", "m", [{"content": "cached", "tool_calls": None}])
+    first.close()
+
+    second = ResponseCache(db_path=path)
+    assert second.get("key") == [{"content": "cached", "tool_calls": None}]
+    assert second.get("key") is not None
+    assert second.stats()["hits_disk"] == 1
+    assert second.stats()["hits_memory"] == 1
+    assert second.disk_stats() == {"entries": 1, "hits": 1}
+    second.close()
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_is_used_off_the_event_loop(response_cache):
+    """Test that the async lookups and stores do their SQLite I/O in a worker thread."""
+    with patch("urpe.llm_cache.asyncio.to_thread", wraps=asyncio.to_thread) as to_thread:
+        await response_cache.aput("key", "m", [{"content": "cached", "tool_calls": None}])
+        response_cache._memory.clear()
+        assert await response_cache.aget("key") == [{"content": "cached", "tool_calls": None}]
+        assert await response_cache.aget("key") is not None
+
+    assert to_thread.call_count == 2
+    assert response_cache.stats()["hits_disk"] == 1
+    assert response_cache.stats()["hits_memory"] == 1
+
+
+def test_expired_entries_miss(tmp_path):
+    """Test that entries past their TTL are not returned."""
+    cache = ResponseCache(db_path=str(tmp_path / "cache.db"), ttl=60)
+    cache.put("key", "m", [{"content": "old", "tool_calls": None}])
+
+    with patch("urpe.llm_cache.time.time", return_value=time.time() + 120):
+        assert cache.get("key") is None
+        assert cache.disk_stats()["entries"] == 0
+    cache.close()
+
+
+def test_size_eviction(tmp_path):
+    """Test that each tier drops its least recently used entries."""
+    cache = ResponseCache(db_path=str(tmp_path / "cache.db"), max_memory_entries=2, max_disk_entries=3)
+    for n in range(5):
+        cache.put(f"key-{n}", "m", [{"content": str(n), "tool_calls": None}])
+
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.disk_stats()["entries"] == 3
+    assert cache.get("key-0") is None
+    assert cache.get("key-4") is not None
+    cache.close()
+
+
+def test_memory_only_cache():
+    """Test a cache without a persistent tier."""
+    cache = ResponseCache(db_path=None)
+    cache.put("key", "m", [{"content": "x", "tool_calls": None}])
+    assert cache.get("key") is not None
+    assert cache.disk_stats() == {"entries": 0, "hits": 0}
+
+
+@pytest.mark.asyncio
+async def test_get_llm_response_uses_cache(response_cache):
+    """Test that identical requests only reach the provider once."""
+    with patch("urpe.llm.get_response_cache", return_value=response_cache), \
+            patch("urpe.llm.acompletion", new_callable=AsyncMock) as mock_completion:
+        mock_completion.side_effect = lambda **kwargs: fake_stream(text_delta("answer"))
+
+        first = await collect(await get_llm_response("m", MESSAGES, temperature=0))
+        second = await collect(await get_llm_response("m", MESSAGES, temperature=0))
+
+    assert mock_completion.call_count == 1
+    assert first[0].choices[0].delta.content == second[0].choices[0].delta.content == "answer"
+    assert response_cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_llm_response_bypasses_cache(response_cache):
+    """Test that use_cache=False always calls the provider."""
+    with patch("urpe.llm.get_response_cache", return_value=response_cache), \
+            patch("urpe.llm.acompletion", new_callable=AsyncMock) as mock_completion:
+        mock_completion.side_effect = lambda **kwargs: fake_stream(text_delta("answer"))
+
+        await collect(await get_llm_response("m", MESSAGES, use_cache=False))
+        await collect(await get_llm_response("m", MESSAGES, use_cache=False))
+
+    assert mock_completion.call_count == 2
+    assert response_cache.stats()["stores"] == 0
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, headers=None):
+        super().__init__("slow down")
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class BadRequestError(Exception):
+    status_code = 400
+
+
+def test_retry_after_headers():
+    """Test that Retry-After is read in seconds, milliseconds and as an HTTP date."""
+    assert retry_after(RateLimitError({"retry-after": "2"})) == 2
+    assert retry_after(RateLimitError({"retry-after-ms": "250"})) == 0.25
+    assert retry_after(RateLimitError({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0
+    assert retry_after(RateLimitError()) is None
+
+
+def test_token_bucket():
+    """Test that a bucket allows a minute's worth at once, then refills at its rate."""
+    bucket = TokenBucket(per_minute=60)
+    now = bucket.updated
+    assert bucket.delay(60, now) == 0
+    bucket.take(60, now)
+    assert bucket.delay(1, now) == pytest.approx(1.0)
+    assert bucket.delay(1, now + 0.5) == pytest.approx(0.5)
+    # Requests larger than the bucket wait for a full bucket instead of forever
+    assert bucket.delay(1000, now) == pytest.approx(60.0)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_retries_after_rate_limit():
+    """Test that a rate-limited request is retried once the provider's delay has passed."""
+    scheduler = RequestScheduler(backoff=10)
+    attempts = []
+
+    async def flaky(**kwargs):
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RateLimitError({"retry-after-ms": "20"})
+        return "stream"
+
+    assert await scheduler.submit(flaky, model="m", messages=MESSAGES) == "stream"
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.02
+    assert scheduler.stats()["m"]["retries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_scheduler_gives_up():
+    """Test that errors surface once retries are used up, and others aren't retried."""
+    scheduler = RequestScheduler(max_retries=1, backoff=0.001)
+    calls = []
+
+    async def limited(**kwargs):
+        calls.append(kwargs)
+        raise RateLimitError()
+
+    async def invalid(**kwargs):
+        calls.append(kwargs)
+        raise BadRequestError()
+
+    with pytest.raises(RateLimitError):
+        await scheduler.submit(limited, model="m", messages=MESSAGES)
+    assert len(calls) == 2
+
+    with pytest.raises(BadRequestError):
+        await scheduler.submit(invalid, model="m", messages=MESSAGES)
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_scheduler_serves_interactive_first():
+    """Test that requests held back by a rate limit go out by priority, then arrival."""
+    scheduler = RequestScheduler()
+    sent = []
+
+    async def provider(**kwargs):
+        sent.append(kwargs["name"])
+        if len(sent) == 1:
+            raise RateLimitError({"retry-after-ms": "50"})
+        return kwargs["name"]
+
+    first = asyncio.create_task(scheduler.submit(provider, model="m", messages=MESSAGES, name="first"))
+    await asyncio.sleep(0.01)
+    batch = asyncio.create_task(scheduler.submit(provider, model="m", messages=MESSAGES, name="batch"))
+    chat = asyncio.create_task(scheduler.submit(
+        provider, priority=PRIORITY_INTERACTIVE, model="m", messages=MESSAGES, name="chat"
+    ))
+    await asyncio.sleep(0.01)
+    assert scheduler.stats()["m"]["queued"] == 3
+
+    await asyncio.gather(first, batch, chat)
+    assert sent == ["first", "chat", "first", "batch"]
+
+
+@pytest.mark.asyncio
+async def test_limiter_admits_interactive_first():
+    """Test that a free slot goes to the waiting stream with the lowest priority value."""
+    limiter = LLMLimiter(max_concurrency=1)
+    admitted = []
+    release = asyncio.Event()
+
+    async def llm(**kwargs):
+        admitted.append(kwargs["name"])
+        return kwargs["name"]
+
+    async def turn(name, priority):
+        async with limiter.stream(llm, name=name, priority=priority):
+            await release.wait()
+
+    holder = asyncio.create_task(turn("holder", PRIORITY_BATCH))
+    await asyncio.sleep(0)
+    batch = asyncio.create_task(turn("batch", PRIORITY_BATCH))
+    gone = asyncio.create_task(turn("gone", PRIORITY_INTERACTIVE))
+    chat = asyncio.create_task(turn("chat", PRIORITY_INTERACTIVE))
+    await asyncio.sleep(0)
+    assert limiter.waiting == 3
+    gone.cancel()
+
+    release.set()
+    await asyncio.gather(holder, batch, chat)
+    assert admitted == ["holder", "chat", "batch"]
+    assert limiter.active == limiter.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_coalesces_identical_requests():
+    """Test that identical requests in flight share one provider call."""
+    scheduler = RequestScheduler()
+    calls = 0
+
+    async def provider(**kwargs):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return fake_stream(text_delta("sha"), text_delta("red"))
+
+    streams = await asyncio.gather(*(
+        scheduler.submit(provider, key="same", model="m", messages=MESSAGES) for _ in range(3)
+    ))
+    chunks = await asyncio.gather(*(collect(stream) for stream in streams))
+
+    assert calls == 1
+    assert [[c.choices[0].delta.content for c in stream] for stream in chunks] == [["sha", "red"]] * 3
+    assert scheduler.stats()["m"]["coalesced"] == 2
+
+    # Once the first response has been read, the same request is sent again
+    await collect(await scheduler.submit(provider, key="same", model="m", messages=MESSAGES))
+    assert calls == 2
+
+
+def _provider(latencies, failing=()):
+    """Opener for fake models answering after the given delays; records what it started and what was closed."""
+    started, closed = [], []
+
+    async def open_model(model):
+        started.append(model)
+        if model in failing:
+            raise BadRequestError(model)
+
+        async def stream():
+            role_only = SimpleNamespace(role="assistant", content=None, tool_calls=None)
+            try:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=role_only)])
+                await asyncio.sleep(latencies[model])
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=text_delta(model))])
+            finally:
+                closed.append(model)
+        return stream()
+
+    return open_model, started, closed
+
+
+def _contents(chunks):
+    return [c.choices[0].delta.content for c in chunks if c.choices[0].delta.content]
+
+
+def test_latency_histogram():
+    """Test that percentiles land in the right log bucket."""
+    histogram = LatencyHistogram()
+    assert histogram.percentile(95) is None
+    for _ in range(95):
+        histogram.observe(0.1)
+    for _ in range(5):
+        histogram.observe(3.0)
+
+    assert 0.1 <= histogram.percentile(50) < 0.125
+    assert 0.1 <= histogram.percentile(95) < 0.125
+    assert 3.0 <= histogram.percentile(99) < 3.75
+
+
+@pytest.mark.asyncio
+async def test_router_falls_back_on_error():
+    """Test that the next model is used when one fails."""
+    router = ModelRouter()
+    opener, started, _ = _provider({"b": 0}, failing={"a"})
+
+    chunks = await collect(await router.open(["a", "b"], opener))
+
+    assert _contents(chunks) == ["b"]
+    assert started == ["a", "b"]
+    assert router.stats()["a"]["errors"] == 1
+    assert router.stats()["b"]["wins"] == 1
+
+
+@pytest.mark.asyncio
+async def test_router_raises_when_all_fail():
+    """Test that the last error surfaces when no model delivers."""
+    opener, _, _ = _provider({}, failing={"a", "b"})
+
+    with pytest.raises(BadRequestError):
+        await ModelRouter().open(["a", "b"], opener)
+
+
+@pytest.mark.asyncio
+async def test_router_falls_back_on_slow_first_token():
+    """Test that a model missing its time-to-first-token deadline is dropped."""
+    router = ModelRouter(ttft_timeout=0.02)
+    opener, started, closed = _provider({"a": 1.0, "b": 0})
+
+    chunks = await collect(await router.open(["a", "b"], opener))
+
+    assert _contents(chunks) == ["b"]
+    assert "a" in closed
+    assert router.stats()["a"]["timeouts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_router_hedges_slow_requests():
+    """Test that a hedge is fired after the delay and the slower stream is cancelled."""
+    router = ModelRouter(hedge=True, hedge_delay=0.02)
+    opener, started, closed = _provider({"a": 1.0, "b": 0.01})
+
+    chunks = await collect(await router.open(["a", "b"], opener))
+    await asyncio.sleep(0)
+
+    assert _contents(chunks) == ["b"]
+    assert started == ["a", "b"]
+    assert closed.count("a") == 1
+    assert router.stats()["a"]["hedged"] == 1
+
+
+@pytest.mark.asyncio
+async def test_router_counts_dropped_waits_apart_from_latency():
+    """Test that streams dropped before their first token are counted, not taken as latencies."""
+    router = ModelRouter(hedge=True, hedge_delay=0.02)
+    opener, _, _ = _provider({"a": 1.0, "b": 0.05})
+
+    await collect(await router.open(["a", "b"], opener))
+
+    assert "a" not in router.latency
+    assert router.stats()["a"]["censored"] == 1
+    assert router.latency["b"].count == 1
+    assert router.hedge_after("a") == 0.02
+
+
+@pytest.mark.asyncio
+async def test_router_closes_losers_finished_with_the_winner():
+    """Test that a stream reaching its first token in the same round as the winner is closed."""
+    gate = asyncio.Event()
+    closed = []
+
+    async def open_model(model):
+        async def stream():
+            try:
+                await gate.wait()
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=text_delta(model))])
+            finally:
+                closed.append(model)
+        return stream()
+
+    router = ModelRouter(hedge=True, hedge_delay=0.01)
+    opening = asyncio.ensure_future(router.open(["a", "b"], open_model))
+    await asyncio.sleep(0.05)
+    gate.set()
+    chunks = await collect(await opening)
+
+    assert len(_contents(chunks)) == 1
+    assert sorted(closed) == ["a", "b"]
+    assert router.latency["a"].count == router.latency["b"].count == 1
+
+
+@pytest.mark.asyncio
+async def test_router_skips_hedge_for_fast_model():
+    """Test that no hedge is sent when the first model answers in time."""
+    router = ModelRouter(hedge=True, hedge_delay=0.5)
+    opener, started, _ = _provider({"a": 0.01, "b": 0})
+
+    chunks = await collect(await router.open(["a", "b"], opener))
+
+    assert _contents(chunks) == ["a"]
+    assert started == ["a"]
+
+
+def test_hedge_delay_follows_latency():
+    """Test that the hedge threshold tracks the model's recorded latencies."""
+    router = ModelRouter(hedge=True, hedge_delay=2.0, min_samples=10)
+    assert router.hedge_after("a") == 2.0
+    for _ in range(10):
+        router.observe("a", 0.2)
+    assert 0.2 <= router.hedge_after("a") < 0.25
+
+
+@pytest.mark.asyncio
+async def test_get_llm_response_uses_fallbacks():
+    """Test that get_llm_response walks the configured fallback chain."""
+    async def completion(**kwargs):
+        if kwargs["model"] == "primary":
+            raise BadRequestError("down")
+        return fake_stream(text_delta("from backup"))
+
+    with patch("urpe.llm.fallback_chain", return_value=["primary", "backup"]), \
+            patch("urpe.llm.get_router", return_value=ModelRouter()), \
+            patch("urpe.llm.get_response_cache", return_value=None), \
+            patch("urpe.llm.acompletion", side_effect=completion):
+        chunks = await collect(await get_llm_response("primary", MESSAGES))
+
+    assert _contents(chunks) == ["from backup"]
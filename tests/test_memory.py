@@ -1,10 +1,20 @@
 """Tests for memory module."""
 
 import pytest
+import pytest_asyncio
+import sqlite3
+import time
+from datetime import datetime
 import tempfile
 import os
+from unittest.mock import patch
+
+from sqlalchemy.exc import OperationalError
 
 from urpe.memory.sqlite import MemoryStore
+from urpe.memory.migrations import MIGRATIONS, get_version
+from urpe.memory.async_sqlite import AsyncMemoryStore
+from urpe.memory.write_behind import WriteBehindStore
 
 
 @pytest.fixture
@@ -82,3 +92,430 @@ def test_get_nonexistent_conversation(memory_store):
     conv = memory_store.get_conversation("nonexistent-id")
     
     assert conv is None
+
+
+def test_save_and_get_summary(memory_store):
+    """Test storing and replacing a context summary."""
+    conv_id = memory_store.create_conversation()
+    
+    assert memory_store.get_summary(conv_id) is None
+    
+    memory_store.save_summary(conv_id, "first", covered_until=4)
+    memory_store.save_summary(conv_id, "second", covered_until=8)
+    
+    assert memory_store.get_summary(conv_id) == {"content": "second", "covered_until": 8}
+
+
+@pytest_asyncio.fixture
+async def async_memory_store():
+    """Create a temporary async memory store for testing."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = AsyncMemoryStore(db_path=os.path.join(tmpdir, "test.db"))
+        yield store
+        await store.close()
+
+
+@pytest.mark.asyncio
+async def test_async_add_and_get_messages(async_memory_store):
+    """Test the async store round-trips messages."""
+    conv_id = await async_memory_store.create_conversation(model="test-model")
+    
+    tool_calls = [{"name": "run_command", "arguments": {"command": "ls"}}]
+    await async_memory_store.add_message(conv_id, "user", "Hello!")
+    await async_memory_store.add_message(conv_id, "assistant", "", tool_calls=tool_calls)
+    
+    messages = await async_memory_store.get_messages(conv_id)
+    
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+    assert messages[1]["tool_calls"] == tool_calls
+
+
+@pytest.mark.asyncio
+async def test_async_get_conversations(async_memory_store):
+    """Test the async store lists conversations with message counts."""
+    conv_id = await async_memory_store.create_conversation(model="model-1")
+    await async_memory_store.create_conversation(model="model-2")
+    await async_memory_store.add_message(conv_id, "user", "Hello!")
+    
+    convs = await async_memory_store.get_conversations(limit=10)
+    counts = {conv["id"]: conv["message_count"] for conv in convs}
+    
+    assert len(convs) == 2
+    assert counts[conv_id] == 1
+
+
+@pytest.mark.asyncio
+async def test_async_get_conversation(async_memory_store):
+    """Test getting a conversation from the async store."""
+    conv_id = await async_memory_store.create_conversation(model="test-model")
+    await async_memory_store.add_message(conv_id, "user", "Test message")
+    
+    conv = await async_memory_store.get_conversation(conv_id)
+    
+    assert conv["model"] == "test-model"
+    assert len(conv["messages"]) == 1
+    assert await async_memory_store.get_conversation("nonexistent-id") is None
+
+
+def test_add_messages_batch(memory_store):
+    """Test inserting several messages in one transaction."""
+    conv_id = memory_store.create_conversation()
+    
+    ids = memory_store.add_messages([
+        {"conversation_id": conv_id, "role": "user", "content": "Hello!"},
+        {"conversation_id": conv_id, "role": "assistant", "content": "Hi!", "tool_calls": [{"id": "1"}]},
+    ])
+    
+    messages = memory_store.get_messages(conv_id)
+    
+    assert len(ids) == 2
+    assert [m["content"] for m in messages] == ["Hello!", "Hi!"]
+    assert messages[1]["tool_calls"] == [{"id": "1"}]
+
+
+def test_wal_mode_enabled(memory_store):
+    """Test that the engine runs SQLite in WAL mode."""
+    with memory_store.engine.connect() as conn:
+        mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+    
+    assert mode.lower() == "wal"
+
+
+@pytest.fixture
+def write_behind(memory_store):
+    """Create a write-behind store that only flushes on demand or by count."""
+    store = WriteBehindStore(memory_store, batch_size=3, flush_interval=3600)
+    yield store
+    store.close()
+
+
+def test_write_behind_queues_until_flush(write_behind, memory_store):
+    """Test that messages are only written when flushed."""
+    conv_id = write_behind.create_conversation()
+    
+    write_behind.add_message(conv_id, "user", "Hello!")
+    
+    assert write_behind.pending == 1
+    assert memory_store.get_messages(conv_id) == []
+    
+    write_behind.flush()
+    
+    assert write_behind.pending == 0
+    assert len(memory_store.get_messages(conv_id)) == 1
+
+
+def test_write_behind_flushes_full_batch(write_behind, memory_store):
+    """Test that reaching batch_size triggers a group commit."""
+    conv_id = write_behind.create_conversation()
+    
+    for i in range(3):
+        write_behind.add_message(conv_id, "user", f"message {i}")
+    
+    # Written by the writer thread, not the caller
+    deadline = time.monotonic() + 5
+    while not memory_store.get_messages(conv_id) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert write_behind.pending == 0
+    assert [m["content"] for m in memory_store.get_messages(conv_id)] == [
+        "message 0", "message 1", "message 2"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_write_behind_aflush_keeps_messages_when_busy(write_behind, memory_store, caplog):
+    """Test that an awaited flush logs a busy database and leaves the messages queued."""
+    conv_id = write_behind.create_conversation()
+    write_behind.add_message(conv_id, "user", "Hello!")
+    locked = OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked"))
+    
+    with patch.object(memory_store, "add_messages", side_effect=locked):
+        await write_behind.aflush()
+    assert write_behind.pending == 1
+    assert "Flush failed" in caplog.text
+    
+    await write_behind.aflush()
+    assert write_behind.pending == 0
+    assert len(memory_store.get_messages(conv_id)) == 1
+
+
+def test_write_behind_reads_see_pending(write_behind):
+    """Test that reads through the write-behind store include queued messages."""
+    conv_id = write_behind.create_conversation()
+    write_behind.add_message(conv_id, "user", "Hello!")
+    
+    assert len(write_behind.get_messages(conv_id)) == 1
+    assert write_behind.get_conversations()[0]["message_count"] == 1
+
+
+def test_write_behind_close_flushes(memory_store):
+    """Test that closing the store writes queued messages."""
+    store = WriteBehindStore(memory_store, batch_size=100, flush_interval=3600)
+    conv_id = store.create_conversation()
+    store.add_message(conv_id, "user", "Hello!")
+    
+    store.close()
+    
+    assert len(memory_store.get_messages(conv_id)) == 1
+
+
+
+def test_write_behind_drops_only_unwritable_messages(write_behind, memory_store, caplog):
+    """Test that a message for an unknown conversation doesn't block the others."""
+    conv_id = write_behind.create_conversation()
+    write_behind.add_message("missing", "user", "lost")
+    write_behind.add_message(conv_id, "user", "kept")
+    
+    write_behind.flush()
+    
+    assert write_behind.pending == 0
+    assert [m["content"] for m in memory_store.get_messages(conv_id)] == ["kept"]
+    assert "conversation missing" in caplog.text
+    
+    write_behind.add_message(conv_id, "user", "later")
+    write_behind.flush()
+    assert len(memory_store.get_messages(conv_id)) == 2
+
+
+def test_write_behind_retries_when_database_busy(memory_store):
+    """Test that a locked database keeps messages queued and the background flusher alive."""
+    store = WriteBehindStore(memory_store, batch_size=100, flush_interval=0.01)
+    conv_id = store.create_conversation()
+    add_messages = memory_store.add_messages
+    failures = []
+    
+    def locked_twice(messages):
+        if len(failures) < 2:
+            failures.append(1)
+            raise OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked"))
+        return add_messages(messages)
+    
+    with patch.object(memory_store, "add_messages", side_effect=locked_twice):
+        store.add_message(conv_id, "user", "Hello!")
+        deadline = time.monotonic() + 5
+        while store.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+    store.close()
+    
+    assert len(failures) == 2
+    assert len(memory_store.get_messages(conv_id)) == 1
+
+def test_conversation_stats_maintained(memory_store):
+    """Test that message_count and last_message_at are kept up to date."""
+    conv_id = memory_store.create_conversation()
+    memory_store.add_message(conv_id, "user", "Hello!")
+    memory_store.add_messages([
+        {"conversation_id": conv_id, "role": "assistant", "content": "Hi!"},
+        {"conversation_id": conv_id, "role": "user", "content": "Bye!"},
+    ])
+    
+    conv = memory_store.get_conversations()[0]
+    
+    assert conv["message_count"] == 3
+    assert conv["last_message_at"] is not None
+
+
+def test_get_conversations_keyset_paging(memory_store):
+    """Test paging through conversations with cursors."""
+    created = [memory_store.create_conversation() for _ in range(5)]
+    
+    first = memory_store.get_conversations(limit=2)
+    second = memory_store.get_conversations(limit=2, before=first[-1]["cursor"])
+    third = memory_store.get_conversations(limit=2, before=second[-1]["cursor"])
+    
+    seen = [conv["id"] for conv in first + second + third]
+    assert len(third) == 1
+    assert sorted(seen) == sorted(created)
+
+
+def test_get_conversations_invalid_cursor(memory_store):
+    """Test that a malformed cursor is rejected."""
+    with pytest.raises(ValueError):
+        memory_store.get_conversations(before="garbage")
+
+
+def test_upgrade_backfills_conversation_stats(tmp_path):
+    """Test that databases created before the stats columns are upgraded."""
+    db_path = tmp_path / "old.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE conversations (id VARCHAR PRIMARY KEY, created_at DATETIME, model VARCHAR);
+        CREATE TABLE messages (
+            id VARCHAR PRIMARY KEY, conversation_id VARCHAR NOT NULL, role VARCHAR NOT NULL,
+            content TEXT NOT NULL, tool_calls TEXT, created_at DATETIME
+        );
+        INSERT INTO conversations VALUES ('c1', '2026-01-01 00:00:00', NULL);
+        INSERT INTO messages VALUES ('m1', 'c1', 'user', 'hi', NULL, '2026-01-01 00:00:01');
+        INSERT INTO messages VALUES ('m2', 'c1', 'assistant', 'hello', NULL, '2026-01-01 00:00:02');
+    """)
+    conn.close()
+    
+    store = MemoryStore(db_path=str(db_path))
+    conv = store.get_conversations()[0]
+    store.add_message("c1", "user", "again")
+    messages = store.get_messages("c1")
+    with store.engine.connect() as conn:
+        version = get_version(conn)
+    store.close()
+    
+    assert conv["message_count"] == 2
+    assert conv["last_message_at"].startswith("2026-01-01T00:00:02")
+    assert [m["content"] for m in messages] == ["hi", "hello", "again"]
+    assert version == len(MIGRATIONS)
+
+
+def test_new_database_stamped_with_latest_version(memory_store):
+    """Test that fresh databases skip migrations."""
+    with memory_store.engine.connect() as conn:
+        assert get_version(conn) == len(MIGRATIONS)
+
+
+def test_messages_ordered_by_seq_with_equal_timestamps(memory_store):
+    """Test that messages with identical timestamps keep insertion order."""
+    conv_id = memory_store.create_conversation()
+    stamp = datetime(2026, 1, 1)
+    
+    memory_store.add_messages([
+        {"conversation_id": conv_id, "role": "tool", "content": f"result {i}", "created_at": stamp}
+        for i in range(5)
+    ])
+    memory_store.add_message(conv_id, "assistant", "done")
+    
+    messages = memory_store.get_messages(conv_id)
+    
+    assert [m["content"] for m in messages] == [f"result {i}" for i in range(5)] + ["done"]
+
+
+def test_add_message_unknown_conversation(memory_store):
+    """Test that messages can't be added to a missing conversation."""
+    with pytest.raises(ValueError):
+        memory_store.add_message("nonexistent-id", "user", "Hello!")
+
+
+def test_search_messages(memory_store):
+    """Test full-text search returns ranked snippets with conversation ids."""
+    conv_id = memory_store.create_conversation()
+    other_id = memory_store.create_conversation()
+    memory_store.add_message(conv_id, "user", "How do I restart the nginx server?")
+    memory_store.add_message(conv_id, "assistant", "Run systemctl restart nginx.")
+    memory_store.add_message(other_id, "user", "Write a haiku about autumn")
+    
+    results = memory_store.search("nginx restart")
+    
+    assert len(results) == 2
+    assert {r["conversation_id"] for r in results} == {conv_id}
+    assert "[nginx]" in results[0]["snippet"]
+    assert results[0]["rank"] <= results[1]["rank"]
+
+
+def test_search_quotes_user_input(memory_store):
+    """Test that FTS5 syntax characters in plain queries don't raise."""
+    conv_id = memory_store.create_conversation()
+    memory_store.add_message(conv_id, "user", "what does AND mean in C++?")
+    
+    assert len(memory_store.search('C++ "AND')) == 1
+    assert memory_store.search("   ") == []
+
+
+def test_search_indexes_existing_messages(tmp_path):
+    """Test that upgrading a database indexes messages written before FTS existed."""
+    db_path = tmp_path / "old.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE conversations (id VARCHAR PRIMARY KEY, created_at DATETIME, model VARCHAR);
+        CREATE TABLE messages (
+            id VARCHAR PRIMARY KEY, conversation_id VARCHAR NOT NULL, role VARCHAR NOT NULL,
+            content TEXT NOT NULL, tool_calls TEXT, created_at DATETIME
+        );
+        INSERT INTO conversations VALUES ('c1', '2026-01-01 00:00:00', NULL);
+        INSERT INTO messages VALUES ('m1', 'c1', 'user', 'kubernetes rollout', NULL, '2026-01-01 00:00:01');
+    """)
+    conn.close()
+    
+    store = MemoryStore(db_path=str(db_path))
+    results = store.search("kubernetes")
+    store.rebuild_search_index()
+    rebuilt = store.search("kubernetes")
+    store.close()
+    
+    assert [r["message_id"] for r in results] == ["m1"]
+    assert rebuilt == results
+
+
+@pytest.mark.asyncio
+async def test_async_search(async_memory_store):
+    """Test full-text search through the async store."""
+    conv_id = await async_memory_store.create_conversation()
+    await async_memory_store.add_message(conv_id, "user", "postgres vacuum settings")
+    
+    results = await async_memory_store.search("vacuum")
+    
+    assert results[0]["conversation_id"] == conv_id
+
+
+@pytest.mark.asyncio
+async def test_async_maintenance(async_memory_store):
+    """Test that the async store can report its size and rebuild the search index."""
+    conv_id = await async_memory_store.create_conversation()
+    await async_memory_store.add_messages([
+        {"conversation_id": conv_id, "role": "user", "content": "postgres vacuum settings"},
+        {"conversation_id": conv_id, "role": "assistant", "content": "autovacuum"},
+    ])
+    
+    await async_memory_store.rebuild_search_index()
+    
+    assert await async_memory_store.stats() == {"conversations": 1, "messages": 2}
+    assert len(await async_memory_store.search("vacuum")) == 1
+
+
+def test_llm_messages_round_trip_tool_calls(memory_store):
+    """Test that stored messages come back ready to send, tool call ids included."""
+    conv_id = memory_store.create_conversation()
+    calls = [{"id": "call-1", "name": "run_command", "arguments": '{"command": "ls"}'}]
+    memory_store.add_message(conv_id, "user", "list files")
+    memory_store.add_message(conv_id, "assistant", "", tool_calls=calls)
+    memory_store.add_messages([
+        {"conversation_id": conv_id, "role": "tool", "content": "a.txt", "tool_call_id": "call-1"},
+        {"conversation_id": conv_id, "role": "assistant", "content": "One file."},
+    ])
+
+    assert memory_store.get_llm_messages(conv_id) == [
+        {"role": "user", "content": "list files"},
+        {
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [{
+                "id": "call-1",
+                "type": "function",
+                "function": {"name": "run_command", "arguments": '{"command": "ls"}'},
+            }],
+        },
+        {"role": "tool", "content": "a.txt", "tool_call_id": "call-1"},
+        {"role": "assistant", "content": "One file."},
+    ]
+    assert memory_store.get_llm_messages("missing") == []
+
+
+def test_upgrade_backfills_llm_payloads(tmp_path):
+    """Test that messages stored before payloads existed get them, tool results paired with their calls."""
+    db_path = tmp_path / "old.db"
+    store = MemoryStore(db_path=str(db_path))
+    conv_id = store.create_conversation()
+    calls = [{"id": "a", "name": "one", "arguments": "{}"}, {"id": "b", "name": "two", "arguments": "{}"}]
+    store.add_message(conv_id, "assistant", "", tool_calls=calls)
+    store.add_message(conv_id, "tool", "first")
+    store.add_message(conv_id, "tool", "second")
+    store.close()
+
+    # Roll back to before the payload migration
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE messages SET payload = NULL")
+    conn.execute(f"PRAGMA user_version = {len(MIGRATIONS) - 1}")
+    conn.commit()
+    conn.close()
+
+    store = MemoryStore(db_path=str(db_path))
+    messages = store.get_llm_messages(conv_id)
+    store.close()
+
+    assert [tc["id"] for tc in messages[0]["tool_calls"]] == ["a", "b"]
+    assert [m["tool_call_id"] for m in messages[1:]] == ["a", "b"]
@@ -0,0 +1,125 @@
+"""Tests for plugin tool discovery."""
+
+import json
+import sys
+from types import SimpleNamespace
+
+import pytest
+from unittest.mock import patch
+
+from urpe.tools import ToolExecutor, ToolResult
+from urpe.tools.base import Tool, ToolRegistry
+from urpe.tools.plugins import load_plugins
+
+HANDLER = '''
+import sys
+from urpe.tools import ToolResult
+
+sys.modules["urpe_test_plugin_imports"] = sys.modules.get("urpe_test_plugin_imports", 0) + 1
+
+def count(path):
+    return ToolResult(success=True, output=str(len(open(path).read().split())))
+'''
+
+MANIFEST = '''
+name: word_count
+description: Count the words in a file
+parameters:
+  type: object
+  properties:
+    path: {type: string}
+  required: [path]
+requires_confirmation: false
+handler: word_count.py:count
+'''
+
+
+@pytest.fixture
+def no_entry_points():
+    with patch("urpe.tools.plugins.entry_points", return_value=[]):
+        yield
+
+
+@pytest.fixture
+def tool_dir(tmp_path):
+    directory = tmp_path / "tools"
+    directory.mkdir()
+    (directory / "word_count.py").write_text(HANDLER)
+    (directory / "word_count.yaml").write_text(MANIFEST)
+    yield directory
+    sys.modules.pop("urpe_test_plugin_imports", None)
+
+
+@pytest.mark.asyncio
+async def test_directory_tools_import_handler_on_first_call(tool_dir, tmp_path, no_entry_points):
+    """Test that manifests register tools whose handler module loads only when called."""
+    tool_registry = ToolRegistry()
+    load_plugins(tool_registry, [str(tool_dir)])
+
+    assert [t.name for t in tool_registry.list_tools()] == ["word_count"]
+    assert tool_registry.get_schemas()[0]["function"]["parameters"]["required"] == ["path"]
+    assert "urpe_test_plugin_imports" not in sys.modules
+
+    text = tmp_path / "text.txt"
+    text.write_text("one two three")
+    executor = ToolExecutor(tool_registry, max_workers=1)
+    results = await executor.execute_many([("word_count", {"path": str(text)}) for _ in range(2)])
+    executor.shutdown()
+
+    assert [r.output for r in results] == ["3", "3"]
+    assert sys.modules["urpe_test_plugin_imports"] == 1
+
+
+def test_entry_point_tools(no_entry_points):
+    """Test that entry points may name Tools or definition dicts, lists included."""
+    definitions = [
+        {"name": "a", "description": "a", "parameters": {}, "handler": "os.path:exists"},
+        Tool(name="b", description="b", parameters={}, handler="os.path:isdir"),
+    ]
+    entry_point = SimpleNamespace(name="test", load=lambda: definitions)
+    tool_registry = ToolRegistry()
+
+    with patch("urpe.tools.plugins.entry_points", return_value=[entry_point]):
+        load_plugins(tool_registry, [])
+
+    assert [t.name for t in tool_registry.list_tools()] == ["a", "b"]
+    assert tool_registry.get_handler("b") is __import__("os").path.isdir
+
+
+@pytest.mark.asyncio
+async def test_bad_plugins_are_skipped(tmp_path, no_entry_points):
+    """Test that broken manifests, name clashes and unimportable handlers don't break the registry."""
+    (tmp_path / "broken.yaml").write_text("name: [unclosed")
+    (tmp_path / "clash.json").write_text(json.dumps(
+        {"name": "existing", "description": "x", "parameters": {}, "handler": "os:getcwd"}
+    ))
+    (tmp_path / "missing.json").write_text(json.dumps({"tools": [
+        {"name": "missing", "description": "x", "parameters": {}, "handler": "no_such_module_xyz:run"},
+    ]}))
+    tool_registry = ToolRegistry()
+    tool_registry.register(
+        Tool(name="existing", description="built in", parameters={}, requires_confirmation=False),
+        lambda: ToolResult(success=True, output="built in"),
+    )
+
+    with pytest.warns(RuntimeWarning) as warned:
+        load_plugins(tool_registry, [str(tmp_path)])
+
+    assert len(warned) == 2
+    assert tool_registry.get_tool("existing").description == "built in"
+    result = await ToolExecutor(tool_registry, max_workers=1).execute("missing", {})
+    assert result.success is False
+    assert "Could not load missing" in result.error
+
+
+def test_loaders_run_on_first_lookup():
+    """Test that plugin discovery is deferred until the registry is first used."""
+    calls = []
+    tool_registry = ToolRegistry()
+    tool_registry.add_loader(lambda r: calls.append(r))
+
+    assert calls == []
+    tool_registry.list_tools()
+    tool_registry.get_schemas()
+
+    assert calls == [tool_registry]
@@ -0,0 +1,177 @@
+"""Tests for prompt prefix caching."""
+
+import hashlib
+import json
+from types import SimpleNamespace
+
+import pytest
+from unittest.mock import patch
+
+from urpe.agent import Agent
+from urpe.prompt_cache import CACHE_CONTROL, PromptPrefix
+
+
+def _unmarked(item):
+    """A message or tool as it would be without cache markers."""
+    item = {k: v for k, v in item.items() if k != "cache_control"}
+    if isinstance(item.get("content"), list):
+        item["content"] = "".join(block["text"] for block in item["content"])
+    return item
+
+
+def _is_marked(item):
+    if "cache_control" in item:
+        return True
+    content = item.get("content")
+    return isinstance(content, list) and any("cache_control" in block for block in content)
+
+
+class FakeCachingProvider:
+    """
+    Streams a fixed reply and reports usage like a provider with prompt
+    caching: a prefix ending at a cache marker is stored, and later requests
+    starting with a stored prefix get its tokens reported as cached.
+    """
+
+    def __init__(self):
+        self.cached = set()
+        self.requests = []
+
+    async def __call__(self, messages, tools=None, **kwargs):
+        self.requests.append({"messages": messages, "tools": tools, **kwargs})
+        items = list(tools or []) + list(messages)
+        digest = hashlib.sha256()
+        tokens = 0
+        cached_tokens = 0
+        for item in items:
+            digest.update(json.dumps(_unmarked(item), sort_keys=True).encode())
+            tokens += len(json.dumps(_unmarked(item))) // 4
+            if digest.hexdigest() in self.cached:
+                cached_tokens = tokens
+            if _is_marked(item):
+                self.cached.add(digest.hexdigest())
+
+        async def stream():
+            delta = SimpleNamespace(content="ok", tool_calls=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+            usage = SimpleNamespace(
+                prompt_tokens=tokens,
+                prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+            )
+            yield SimpleNamespace(choices=[], usage=usage)
+        return stream()
+
+
+def test_prefix_marks_breakpoints():
+    """Test that tools, system messages, the previous prompt and the last message are marked."""
+    prefix = PromptPrefix()
+    tools = [{"type": "function", "function": {"name": "a"}}, {"type": "function", "function": {"name": "b"}}]
+    first = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "hi"}]
+
+    marked, marked_tools = prefix.prepare(first, tools)
+    assert marked_tools[-1]["cache_control"] == CACHE_CONTROL
+    assert "cache_control" not in tools[-1]
+    assert [_is_marked(m) for m in marked] == [True, True]
+    assert first[1]["content"] == "hi"
+
+    second = first + [{"role": "assistant", "content": "hello"}, {"role": "user", "content": "more"}]
+    marked, _ = prefix.prepare(second, tools)
+    assert prefix.reused == 2
+    assert [_is_marked(m) for m in marked] == [True, True, False, True]
+
+
+def test_prefix_resets_when_history_changes():
+    """Test that a prompt whose start changed (e.g. trimmed history) isn't expected to be cached."""
+    prefix = PromptPrefix()
+    prefix.prepare([{"role": "user", "content": "one"}, {"role": "assistant", "content": "1"}])
+    prefix.prepare([{"role": "user", "content": "summary"}, {"role": "user", "content": "two"}])
+
+    assert prefix.reused == 0
+    assert prefix.resets == 1
+
+
+def test_prefix_skips_empty_messages():
+    """Test that markers go on the nearest message with text, not on empty content."""
+    prefix = PromptPrefix()
+    messages = [
+        {"role": "user", "content": "run it"},
+        {"role": "assistant", "content": "", "tool_calls": [{"id": "1"}]},
+    ]
+    marked, _ = prefix.prepare(messages)
+
+    assert _is_marked(marked[0])
+    assert marked[1]["content"] == ""
+
+
+@pytest.mark.asyncio
+async def test_agent_turns_reuse_cached_prefix(tmp_path):
+    """Test that each turn's prompt reads the prefix the previous turn cached."""
+    from urpe.memory import MemoryStore
+
+    provider = FakeCachingProvider()
+    store = MemoryStore(db_path=str(tmp_path / "test.db"))
+    agent = Agent(model="test-model", memory_store=store)
+
+    usage = []
+    with patch("urpe.prompt_cache.settings", SimpleNamespace(llm_prompt_cache=True)), \
+            patch("urpe.agent.get_llm_response", provider):
+        for message in ("one", "two", "three"):
+            [chunk async for chunk in agent.process_message(message)]
+            usage.append(dict(agent.usage))
+    store.close()
+
+    assert provider.requests[0]["stream_options"] == {"include_usage": True}
+    assert usage[0]["cached_tokens"] == 0
+    # Everything but the two newest messages came from the cache
+    for turn in usage[1:]:
+        assert 0 < turn["cached_tokens"] < turn["prompt_tokens"]
+    assert usage[2]["cached_tokens"] > usage[1]["cached_tokens"]
+    assert agent.prompt_prefix.resets == 0
+
+
+@pytest.mark.asyncio
+async def test_agent_without_prompt_caching_sends_plain_prompts(tmp_path):
+    """Test that prompts aren't marked for models without prompt caching."""
+    from urpe.memory import MemoryStore
+
+    provider = FakeCachingProvider()
+    store = MemoryStore(db_path=str(tmp_path / "test.db"))
+    agent = Agent(model="test-model", memory_store=store)
+
+    with patch("urpe.prompt_cache.settings", SimpleNamespace(llm_prompt_cache=False)), \
+            patch("urpe.agent.get_llm_response", provider):
+        [chunk async for chunk in agent.process_message("one")]
+    store.close()
+
+    request = provider.requests[0]
+    assert "stream_options" not in request
+    assert not any(_is_marked(m) for m in request["messages"] + request["tools"])
+
+
+@pytest.mark.asyncio
+async def test_cached_tokens_are_traced(tmp_path):
+    """Test that provider usage is recorded on llm.request spans and totalled by summarize."""
+    from urpe.memory import MemoryStore
+    from urpe.tracing import summarize, tracer
+
+    trace_path = tmp_path / "traces.jsonl"
+    tracer.configure(str(trace_path))
+    provider = FakeCachingProvider()
+    store = MemoryStore(db_path=str(tmp_path / "test.db"))
+    agent = Agent(model="test-model", memory_store=store)
+    total = {"prompt_tokens": 0, "cached_tokens": 0}
+    try:
+        with patch("urpe.prompt_cache.settings", SimpleNamespace(llm_prompt_cache=True)), \
+                patch("urpe.agent.get_llm_response", provider):
+            for message in ("one", "two"):
+                [chunk async for chunk in agent.process_message(message)]
+                for key in total:
+                    total[key] += agent.usage[key]
+        tracer.flush()
+    finally:
+        tracer.configure(None)
+        store.close()
+
+    request = summarize(str(trace_path))["llm.request"]
+    assert request["prompt_tokens"] == total["prompt_tokens"]
+    assert request["cached_tokens"] == total["cached_tokens"] > 0
@@ -0,0 +1,99 @@
+"""Tests for streamed Markdown rendering."""
+
+import io
+
+import pytest
+from rich.console import Console
+from unittest.mock import patch
+
+from urpe import render
+from urpe.render import MarkdownStream
+
+RESPONSE = (
+    "# Title\n"
+    "\n"
+    "First paragraph.\n"
+    "\n"
+    "- item\n"
+    "\n"
+    "  continued item\n"
+    "\n"
+    "```python\n"
+    "x = 1\n"
+    "\n"
+    "y = 2\n"
+    "```\n"
+    "\n"
+    "Last **words**"
+)
+
+
+def _console():
+    return Console(file=io.StringIO(), width=60, force_terminal=False)
+
+
+def test_finished_blocks_leave_the_live_tail():
+    """Test that only the block still being written stays in the live region."""
+    console = _console()
+    with MarkdownStream(console) as stream:
+        for char in RESPONSE:
+            stream.feed(char)
+        tail = "".join(stream._tail)
+
+    assert tail == "Last **words**"
+    output = console.file.getvalue()
+    for text in ("Title", "First paragraph.", "continued item", "x = 1", "y = 2", "Last words"):
+        assert text in output
+    assert "".join(stream.text) == RESPONSE
+
+
+def test_blank_lines_in_code_fence_do_not_split():
+    """Test that a code block with blank lines is kept whole until it closes."""
+    stream = MarkdownStream(_console())
+    with stream:
+        stream.feed("```\na\n\nb\n")
+        assert "".join(stream._tail) == "```\na\n\nb\n"
+        stream.feed("```\n\nafter\n")
+        assert "".join(stream._tail) == "after\n"
+
+
+def test_redraws_are_capped():
+    """Test that the tail is re-parsed at most once per frame, not per chunk."""
+    built = []
+
+    def counting_markdown(text):
+        built.append(text)
+        return text
+
+    with patch.object(render, "Markdown", counting_markdown), \
+            MarkdownStream(_console(), max_fps=1) as stream:
+        for n in range(1000):
+            stream.feed(f"word{n} ")
+
+    # The first frame and the final render on close
+    assert len(built) == 2
+
+
+@pytest.mark.asyncio
+async def test_prompts_pause_the_live_region():
+    """Test that the live region is stopped, with the text so far printed, while a prompt is shown."""
+    console = _console()
+    seen = []
+
+    async def ask(command):
+        seen.append((command, stream._live.is_started, console.file.getvalue()))
+        return True
+
+    with MarkdownStream(console) as stream:
+        stream.feed("Running `ls`.")
+        allowed = await stream.pausing(ask)("ls")
+        assert stream._live.is_started
+        stream.feed("\n\nDone.")
+
+    assert allowed is True
+    command, live, printed = seen[0]
+    assert command == "ls" and live is False
+    assert "Running ls." in printed
+    output = console.file.getvalue()
+    assert output.count("Running ls.") == 1
+    assert output.index("Running ls.") < output.index("Done.")
@@ -0,0 +1,140 @@
+"""Tests for the agent daemon and its client."""
+
+import asyncio
+import os
+import stat
+
+import pytest
+import pytest_asyncio
+from unittest.mock import patch, AsyncMock
+
+from urpe.client import DaemonClient, DaemonError
+from urpe.server import AgentServer
+from tests.helpers import fake_stream, text_delta, command_delta, collect
+
+
+@pytest_asyncio.fixture
+async def server(tmp_path, store):
+    server = AgentServer(str(tmp_path / "urpe.sock"), memory_store=store)
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_connect_without_daemon(tmp_path):
+    """Test that the client reports no daemon instead of failing."""
+    assert await DaemonClient.connect(str(tmp_path / "missing.sock")) is None
+
+
+@pytest.mark.asyncio
+async def test_socket_is_private_from_creation(tmp_path, store):
+    """Test that the socket is bound owner-only rather than restricted afterwards."""
+    modes = []
+    start_unix_server = asyncio.start_unix_server
+
+    async def bind(*args, path, **kwargs):
+        server = await start_unix_server(*args, path=path, **kwargs)
+        modes.append(stat.S_IMODE(os.stat(path).st_mode))
+        return server
+
+    server = AgentServer(str(tmp_path / "urpe.sock"), memory_store=store)
+    with patch("urpe.server.asyncio.start_unix_server", bind):
+        await server.start()
+    await server.close()
+
+    assert modes == [0o600]
+
+
+@pytest.mark.asyncio
+async def test_ping(server):
+    """Test the ping request."""
+    client = await DaemonClient.connect(server.socket_path)
+    reply = await client.ping()
+    await client.close()
+
+    assert reply["ok"] is True
+
+
+@pytest.mark.asyncio
+async def test_messages_continue_conversation(server, store):
+    """Test that replies stream back and later messages reuse the conversation."""
+    client = await DaemonClient.connect(server.socket_path)
+
+    with patch("urpe.agent.get_llm_response", new_callable=AsyncMock) as mock_llm:
+        mock_llm.side_effect = lambda **kwargs: fake_stream(text_delta("hel"), text_delta("lo"))
+        first = await collect(client.send_message("hi", model="test-model", enable_tools=False))
+        conversation_id = client.conversation_id
+        await collect(client.send_message("again", model="test-model", enable_tools=False))
+    await client.close()
+
+    assert first == ["hel", "lo"]
+    assert client.conversation_id == conversation_id
+    # The second turn was sent with the first turn as context
+    assert len(mock_llm.call_args.kwargs["messages"]) == 3
+    assert [m["content"] for m in store.get_messages(conversation_id)] == ["hi", "hello", "again", "hello"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_conversation_reports_error(server):
+    """Test that errors are sent back to the client and the connection survives."""
+    client = await DaemonClient.connect(server.socket_path)
+    client.conversation_id = "missing"
+
+    with patch("urpe.agent.get_llm_response", new_callable=AsyncMock) as mock_llm:
+        mock_llm.side_effect = lambda **kwargs: fake_stream(text_delta("ok"))
+        with pytest.raises(DaemonError):
+            await collect(client.send_message("hi", model="test-model"))
+
+    assert (await client.ping())["ok"] is True
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_resume(server):
+    """Test that resuming checks the conversation exists before any message is sent."""
+    client = await DaemonClient.connect(server.socket_path)
+    with pytest.raises(DaemonError, match="No conversation missing"):
+        await client.resume("missing")
+
+    with patch("urpe.agent.get_llm_response", new_callable=AsyncMock) as mock_llm:
+        mock_llm.side_effect = lambda **kwargs: fake_stream(text_delta("ok"))
+        await collect(client.send_message("hi", model="test-model", enable_tools=False))
+    conversation_id = client.conversation_id
+    await client.close()
+
+    client = await DaemonClient.connect(server.socket_path)
+    await client.resume(conversation_id)
+    await client.close()
+
+    assert client.conversation_id == conversation_id
+
+
+@pytest.mark.asyncio
+async def test_commands_confirmed_by_client_in_its_directory(server, tmp_path, monkeypatch):
+    """Test that confirmation is asked of the client and commands run in its directory."""
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    monkeypatch.chdir(workdir)
+    client = await DaemonClient.connect(server.socket_path)
+    asked = []
+
+    async def confirm(command):
+        asked.append(command)
+        return True
+
+    responses = iter([fake_stream(command_delta("pwd")), fake_stream(text_delta("done"))])
+    with patch("urpe.agent.get_llm_response", new_callable=AsyncMock) as mock_llm:
+        mock_llm.side_effect = lambda **kwargs: next(responses)
+        chunks = await collect(client.send_message("where am I?", model="test-model", confirm=confirm))
+    await client.close()
+
+    assert asked == ["pwd"]
+    assert str(workdir) in "".join(chunks)
+
+
+@pytest.mark.asyncio
+async def test_refuses_second_daemon(server, store):
+    """Test that a daemon won't take over a socket that is in use."""
+    with pytest.raises(RuntimeError):
+        await AgentServer(server.socket_path, memory_store=store).start()
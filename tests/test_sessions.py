@@ -0,0 +1,187 @@
+"""Tests for the concurrent session runtime."""
+
+import asyncio
+import sys
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+
+from urpe.sessions import SessionBusy, SessionError, SessionManager, TurnCancelled
+from tests.helpers import fake_stream, text_delta, command_delta, collect
+
+
+@pytest_asyncio.fixture
+async def manager(store):
+    manager = SessionManager(memory_store=store, model="test-model", enable_tools=False, max_llm_calls=2)
+    yield manager
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_sessions_keep_separate_context(manager, store):
+    """Test that concurrent conversations don't see each other's messages."""
+    async def fake_llm(**kwargs):
+        return fake_stream(text_delta(f"re: {kwargs['messages'][-1]['content']}"))
+
+    with patch("urpe.agent.get_llm_response", fake_llm):
+        first = await manager.open()
+        second = await manager.open()
+        await asyncio.gather(
+            collect(first.send("one")),
+            collect(second.send("two")),
+        )
+
+    assert [m["content"] for m in first.agent.messages] == ["one", "re: one"]
+    assert [m["content"] for m in store.get_messages(second.id)] == ["two", "re: two"]
+
+
+@pytest.mark.asyncio
+async def test_llm_calls_are_bounded(manager):
+    """Test that no more than max_llm_calls streams run at once."""
+    running = 0
+    peak = 0
+
+    async def slow_stream():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=text_delta("ok"))])
+
+    async def fake_llm(**kwargs):
+        return slow_stream()
+
+    with patch("urpe.agent.get_llm_response", fake_llm):
+        await asyncio.gather(*(collect(manager.send(None, f"message {n}")) for n in range(10)))
+
+    assert peak == 2
+    assert len(manager) == 10
+
+
+@pytest.mark.asyncio
+async def test_cancel_running_turn(manager):
+    """Test that a turn can be cancelled from outside and the session stays usable."""
+    started = asyncio.Event()
+
+    async def hanging_stream():
+        started.set()
+        await asyncio.sleep(60)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=text_delta("late"))])
+
+    async def fake_llm(**kwargs):
+        return hanging_stream()
+
+    session = await manager.open()
+    with patch("urpe.agent.get_llm_response", fake_llm):
+        turn = asyncio.create_task(collect(session.send("hi")))
+        await started.wait()
+        assert manager.cancel(session.id) is True
+        with pytest.raises(TurnCancelled):
+            await turn
+
+    assert manager.llm_limiter.active == 0
+    assert manager.cancel(session.id) is False
+
+    async def quick_llm(**kwargs):
+        return fake_stream(text_delta("ok"))
+
+    with patch("urpe.agent.get_llm_response", quick_llm):
+        assert await collect(session.send("again")) == ["ok"]
+
+
+@pytest.mark.asyncio
+async def test_cancel_answers_pending_tool_calls(store):
+    """Test that tool calls interrupted by a cancel get a result, keeping the history valid."""
+    manager = SessionManager(memory_store=store, model="test-model")
+    started = asyncio.Event()
+
+    async def confirm(command):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def fake_llm(**kwargs):
+        return fake_stream(command_delta("ls"))
+
+    session = await manager.open()
+    with patch("urpe.agent.get_llm_response", fake_llm), \
+            patch("urpe.tools.shell.ask_confirmation", confirm):
+        turn = asyncio.create_task(collect(session.send("list files")))
+        await started.wait()
+        session.cancel()
+        with pytest.raises(TurnCancelled):
+            await turn
+    await manager.close()
+
+    roles = [m["role"] for m in session.agent.messages]
+    assert roles == ["user", "assistant", "tool"]
+    assert session.agent.messages[2]["tool_call_id"] == "call-1"
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(sys.platform == "win32", reason="uses a POSIX shell")
+async def test_cancel_stops_running_tools(store, tmp_path):
+    """Test that cancelling a turn kills the commands its tool calls started."""
+    manager = SessionManager(memory_store=store, model="test-model")
+    started, done = tmp_path / "started", tmp_path / "done"
+
+    async def confirm(command):
+        return True
+
+    async def fake_llm(**kwargs):
+        return fake_stream(command_delta(f"touch {started}; sleep 1; touch {done}"))
+
+    session = await manager.open()
+    with patch("urpe.agent.get_llm_response", fake_llm), \
+            patch("urpe.tools.shell.ask_confirmation", confirm):
+        turn = asyncio.create_task(collect(session.send("run it")))
+        while not started.exists():
+            await asyncio.sleep(0.01)
+        session.cancel()
+        with pytest.raises(TurnCancelled):
+            await turn
+    await manager.close()
+    await asyncio.sleep(1.5)
+
+    assert not done.exists()
+    assert session.agent.messages[-1]["role"] == "tool"
+
+@pytest.mark.asyncio
+async def test_resume_checks_conversation_exists(manager):
+    """Test that opening an unknown conversation fails instead of hosting an empty session."""
+    with patch("urpe.agent.get_llm_response") as mock_llm:
+        mock_llm.side_effect = lambda **kwargs: fake_stream(text_delta("ok"))
+        session = await manager.open()
+        await collect(session.send("hi"))
+    manager.drop(session.id)
+
+    with pytest.raises(SessionError):
+        await manager.open("missing")
+    assert len(manager) == 0
+    assert (await manager.open(session.id)).agent.messages[0]["content"] == "hi"
+
+
+@pytest.mark.asyncio
+async def test_idle_sessions_are_evicted(store):
+    """Test that the least recently used idle session is dropped beyond max_sessions."""
+    manager = SessionManager(memory_store=store, model="test-model", max_sessions=2)
+    first = await manager.open()
+    second = await manager.open()
+    await manager.open(first.id)
+    third = await manager.open()
+    hosted = {manager.get(first.id), manager.get(second.id), manager.get(third.id)}
+    await manager.close()
+
+    assert hosted == {first, third, None}
+
+
+@pytest.mark.asyncio
+async def test_busy_when_queue_is_full(manager):
+    """Test that new turns are refused once too many are waiting for the model."""
+    manager.max_queued_turns = 1
+    manager.llm_limiter.waiting = 1
+
+    with pytest.raises(SessionBusy):
+        await collect(manager.send(None, "hi"))
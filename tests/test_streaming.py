@@ -0,0 +1,96 @@
+"""Tests for stream accumulation and coalescing."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from urpe.streaming import ChunkCoalescer, StreamAccumulator, paced
+
+
+def _call(index, id=None, name=None, arguments=None):
+    return SimpleNamespace(index=index, id=id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def _delta(content=None, tool_calls=None):
+    return SimpleNamespace(content=content, tool_calls=tool_calls)
+
+
+def test_accumulator_joins_content():
+    """Test that text pieces are returned as they come and joined at the end."""
+    accumulator = StreamAccumulator()
+
+    assert accumulator.add(_delta("Hel")) == "Hel"
+    assert accumulator.add(_delta("lo")) == "lo"
+    assert accumulator.add(_delta()) is None
+    assert accumulator.content == "Hello"
+    assert accumulator.tool_calls == []
+
+
+def test_accumulator_interleaved_sparse_tool_calls():
+    """Test that parallel tool call deltas are grouped by index, in any order."""
+    accumulator = StreamAccumulator()
+    accumulator.add(_delta(tool_calls=[_call(2, id="b", name="read_file", arguments='{"pa')]))
+    accumulator.add(_delta(tool_calls=[_call(0, id="a", name="run_command", arguments='{"command":')]))
+    accumulator.add(_delta(tool_calls=[_call(2, arguments='th": "x"}'), _call(0, arguments=' "ls"}')]))
+
+    assert accumulator.tool_calls == [
+        {"id": "a", "name": "run_command", "arguments": '{"command": "ls"}'},
+        {"id": "b", "name": "read_file", "arguments": '{"path": "x"}'},
+    ]
+
+
+def test_accumulator_tool_calls_without_index():
+    """Test that deltas without an index are matched by id or continue the last call."""
+    accumulator = StreamAccumulator()
+    accumulator.add(_delta(tool_calls=[_call(None, id="a", name="first", arguments="{")]))
+    accumulator.add(_delta(tool_calls=[_call(None, arguments="}")]))
+    accumulator.add(_delta(tool_calls=[_call(None, name="second", arguments="{}")]))
+    accumulator.add(_delta(tool_calls=[_call(None, id="c", name="third")]))
+
+    assert [(c["id"], c["name"], c["arguments"]) for c in accumulator.tool_calls] == [
+        ("a", "first", "{}{}"),
+        ("c", "third", ""),
+    ]
+
+
+def test_coalescer_merges_fast_chunks():
+    """Test that chunks within the interval are merged and flushed at the end."""
+    coalescer = ChunkCoalescer(interval=3600, max_chars=10)
+
+    assert coalescer.push("first") == "first"
+    assert coalescer.push("a") is None
+    assert coalescer.push("b") is None
+    assert coalescer.push("cdefghij") == "abcdefghij"
+    assert coalescer.push("k") is None
+    assert coalescer.flush() == "k"
+    assert coalescer.flush() is None
+
+
+def test_coalescer_disabled():
+    """Test that an interval of 0 passes every chunk through."""
+    coalescer = ChunkCoalescer(interval=0)
+
+    assert [coalescer.push(text) for text in "abc"] == ["a", "b", "c"]
+    assert coalescer.flush() is None
+
+
+@pytest.mark.asyncio
+async def test_buffered_text_is_flushed_when_due():
+    """Test that buffered text goes out on its deadline while the stream stalls."""
+    coalescer = ChunkCoalescer(interval=0.05)
+
+    async def stalling():
+        yield "a"
+        yield "b"
+        await asyncio.sleep(0.5)
+        yield "c"
+
+    output = []
+    async for text in paced(stalling(), coalescer.due_in):
+        if text is None:
+            output.append(("due", coalescer.flush()))
+        elif text := coalescer.push(text):
+            output.append(("chunk", text))
+    assert output == [("chunk", "a"), ("due", "b"), ("chunk", "c")]
+    assert coalescer.due_in() is None
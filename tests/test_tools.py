@@ -1,10 +1,20 @@
 """Tests for tools module."""
 
+import asyncio
+import os
+import sys
+import threading
+import time
+
 import pytest
 from unittest.mock import patch, MagicMock
 
-from urpe.tools import registry, run_command, ToolResult
-from urpe.tools.base import Tool
+from urpe.tools import registry, run_command, run_command_async, ToolResult
+from urpe.tools.cache import ToolResultCache
+from urpe.tools.shell import CappedOutput, command_cwd, confirm_command, read_only_command_paths
+from urpe.tools.base import Tool, ToolRegistry
+from urpe.tools.executor import ToolExecutor
+from urpe.tools.schema import ArgumentError, compile_schema
 
 
 def test_run_command_success_no_confirmation():
@@ -57,3 +67,427 @@ def test_registry_get_schemas():
     assert len(schemas) >= 1
     assert schemas[0]["type"] == "function"
     assert "name" in schemas[0]["function"]
+
+
+
+def test_registry_caches_schemas_until_register():
+    """Test that the schema list is built once and rebuilt after a new tool is registered."""
+    tool_registry = ToolRegistry()
+    tool_registry.register(_tool("first"), lambda: None)
+    version = tool_registry.version
+    schemas = tool_registry.get_schemas()
+    
+    assert tool_registry.get_schemas() is schemas
+    
+    tool_registry.register(_tool("second"), lambda: None)
+    
+    assert tool_registry.version > version
+    assert [s["function"]["name"] for s in tool_registry.get_schemas()] == ["first", "second"]
+
+
+FILE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "path": {"type": "string", "minLength": 1},
+        "limit": {"type": "integer", "minimum": 1},
+        "mode": {"enum": ["read", "write"]},
+        "follow": {"type": "boolean"},
+        "ranges": {
+            "type": "array",
+            "items": {"type": "object", "properties": {"start": {"type": "integer"}}, "required": ["start"]},
+        },
+    },
+    "required": ["path"],
+    "additionalProperties": False,
+}
+
+
+def test_schema_validation_coerces_arguments():
+    """Test that JSON text is decoded and string numbers and booleans coerced."""
+    validate = compile_schema(FILE_SCHEMA)
+    
+    assert validate('{"path": "a.txt", "limit": "10", "follow": "true", "ranges": [{"start": 2.0}]}') == {
+        "path": "a.txt", "limit": 10, "follow": True, "ranges": [{"start": 2}],
+    }
+    assert compile_schema({})("") == {}
+
+
+@pytest.mark.parametrize("arguments, error", [
+    ('{"path": ', "arguments are not valid JSON"),
+    ('["a.txt"]', "arguments must be a JSON object, got array"),
+    ({}, "missing required argument 'path'"),
+    ({"path": 3}, "path: expected string, got integer 3"),
+    ({"path": ""}, "path: must be at least 1 characters"),
+    ({"path": "a", "limit": "ten"}, "limit: expected integer, got string 'ten'"),
+    ({"path": "a", "limit": 0}, "limit: must be at least 1"),
+    ({"path": "a", "mode": "append"}, 'mode: must be one of "read", "write"'),
+    ({"path": "a", "ranges": [{"start": 1}, {}]}, "ranges[1]: missing required argument 'start'"),
+    ({"path": "a", "recursive": True}, "unexpected argument 'recursive'"),
+])
+def test_schema_validation_errors(arguments, error):
+    """Test that bad arguments are rejected with an error naming the field."""
+    with pytest.raises(ArgumentError) as exc_info:
+        compile_schema(FILE_SCHEMA)(arguments)
+    
+    assert error in str(exc_info.value)
+
+
+@pytest.mark.asyncio
+async def test_executor_rejects_invalid_arguments():
+    """Test that calls not matching the schema fail without running the handler."""
+    handler = MagicMock(return_value=ToolResult(success=True, output="ok"))
+    tool = Tool(name="read", description="read", parameters=FILE_SCHEMA, requires_confirmation=False)
+    executor = _executor_with((tool, handler))
+    
+    bad, good = await executor.execute_many([("read", '{"limit": 5}'), ("read", '{"path": "a", "limit": "5"}')])
+    
+    assert bad.success is False
+    assert bad.error == "Invalid arguments for read: missing required argument 'path'"
+    assert good.success is True
+    handler.assert_called_once_with(path="a", limit=5)
+    executor.shutdown()
+
+
+def _executor_with(*tools):
+    """Create an executor over a fresh registry with the given (tool, handler) pairs."""
+    tool_registry = ToolRegistry()
+    for tool, handler in tools:
+        tool_registry.register(tool, handler)
+    return ToolExecutor(tool_registry, max_workers=4)
+
+
+def _tool(name, **kwargs):
+    return Tool(
+        name=name,
+        description=name,
+        parameters={"type": "object", "properties": {}},
+        requires_confirmation=False,
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_executor_runs_calls_concurrently_in_order():
+    """Test that independent calls overlap and results keep call order."""
+    running = 0
+    peak = 0
+    
+    async def slow(value):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        return ToolResult(success=True, output=value)
+    
+    executor = _executor_with((_tool("slow"), slow))
+    
+    results = await executor.execute_many([("slow", {"value": str(i)}) for i in range(4)])
+    
+    assert [r.output for r in results] == ["0", "1", "2", "3"]
+    assert peak == 4
+
+
+@pytest.mark.asyncio
+async def test_executor_offloads_sync_handlers():
+    """Test that blocking sync handlers run off the event loop thread."""
+    def blocking():
+        time.sleep(0.1)
+        return ToolResult(success=True, output=threading.current_thread().name)
+    
+    executor = _executor_with((_tool("blocking"), blocking))
+    
+    start = time.perf_counter()
+    results = await executor.execute_many([("blocking", {}), ("blocking", {})])
+    elapsed = time.perf_counter() - start
+    
+    assert all(r.output.startswith("urpe-tool") for r in results)
+    assert elapsed < 0.19
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_executor_respects_max_concurrency():
+    """Test that per-tool concurrency limits are enforced."""
+    running = 0
+    peak = 0
+    
+    async def limited():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return ToolResult(success=True, output="")
+    
+    executor = _executor_with((_tool("limited", max_concurrency=2), limited))
+    
+    await executor.execute_many([("limited", {})] * 6)
+    
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_executor_reports_errors():
+    """Test that unknown tools and handler exceptions become error results."""
+    def broken():
+        raise RuntimeError("boom")
+    
+    executor = _executor_with((_tool("broken"), broken))
+    
+    unknown, failed = await executor.execute_many([("missing", {}), ("broken", {})])
+    
+    assert "Unknown tool" in unknown.error
+    assert failed.error == "boom"
+
+
+def test_capped_output_keeps_head_and_tail():
+    """Test that long output keeps its first and last lines."""
+    output = CappedOutput(max_bytes=1_000_000, max_lines=10)
+    
+    for i in range(100):
+        output.feed(f"line {i}\n")
+    output.finish()
+    text = output.text()
+    
+    assert output.truncated
+    assert output.omitted_lines == 90
+    assert text.startswith("line 0\nline 1\n")
+    assert text.endswith("line 98\nline 99\n")
+    assert "90 lines" in text
+
+
+def test_capped_output_bounds_single_long_line():
+    """Test that a line without newlines can't exceed the byte budget."""
+    output = CappedOutput(max_bytes=100, max_lines=10)
+    
+    for _ in range(1000):
+        output.feed("x" * 100)
+    output.finish()
+    
+    assert len(output.text().encode()) < 200
+    assert output.omitted_bytes > 99_000
+
+
+@pytest.mark.asyncio
+async def test_run_command_async_streams_and_caps_output():
+    """Test that output is streamed incrementally and capped in the result."""
+    chunks = []
+    command = f'"{sys.executable}" -c "for i in range(20000): print(i)"'
+    
+    result = await run_command_async(
+        command,
+        require_confirmation=False,
+        max_output_bytes=1000,
+        max_output_lines=100,
+        on_output=chunks.append,
+    )
+    
+    assert result.success is True
+    assert result.truncated is True
+    assert result.omitted_lines > 0
+    assert "".join(chunks).splitlines()[-1] == "19999"
+    assert result.output.splitlines()[-1] == "19999"
+    assert len(result.output) < 1200
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(sys.platform == "win32", reason="process groups are POSIX-only")
+async def test_run_command_async_timeout_kills_process_group():
+    """Test that a timeout kills background children holding the pipes open."""
+    start = time.perf_counter()
+    
+    result = await run_command_async("sleep 30 & sleep 30", require_confirmation=False, timeout=1)
+    
+    assert result.success is False
+    assert "timed out" in result.error.lower()
+    assert time.perf_counter() - start < 5
+
+
+@pytest.mark.asyncio
+async def test_executor_streams_output_from_sync_handlers():
+    """Test that output from sync handlers in worker threads reaches the callback."""
+    def noisy(on_output=None):
+        on_output("a")
+        on_output("b")
+        return ToolResult(success=True, output="ab")
+    
+    executor = _executor_with((_tool("noisy"), noisy))
+    received = []
+    
+    await executor.execute_many([("noisy", {})], on_output=lambda i, text: received.append((i, text)))
+    await asyncio.sleep(0)
+    
+    assert received == [(0, "a"), (0, "b")]
+    executor.shutdown()
+
+
+def _counting(output="ok"):
+    calls = []
+    
+    def handler(**kwargs):
+        calls.append(kwargs)
+        return ToolResult(success=True, output=output)
+    return handler, calls
+
+
+@pytest.mark.asyncio
+async def test_executor_reuses_cacheable_results_per_conversation():
+    """Test that identical calls to a cacheable tool in one conversation run once."""
+    handler, calls = _counting()
+    executor = _executor_with((_tool("lookup", cacheable=True), handler))
+    
+    first = await executor.execute("lookup", '{"q": "a"}', scope="conv-1")
+    again = await executor.execute("lookup", {"q": "a"}, scope="conv-1")
+    other_args = await executor.execute("lookup", {"q": "b"}, scope="conv-1")
+    other_conversation = await executor.execute("lookup", {"q": "a"}, scope="conv-2")
+    unscoped = await executor.execute("lookup", {"q": "a"})
+    
+    assert len(calls) == 4
+    assert not first.cached and again.cached and again.output == "ok"
+    assert not other_args.cached and not other_conversation.cached and not unscoped.cached
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_executor_cache_invalidated_by_side_effects_and_files(tmp_path):
+    """Test that non-cacheable calls, changed files, failures and expiry make calls run again."""
+    watched = tmp_path / "notes.txt"
+    watched.write_text("v1")
+    handler, calls = _counting()
+    failing_calls = []
+    
+    def failing():
+        failing_calls.append(1)
+        return ToolResult(success=False, output="", error="nope")
+    
+    executor = _executor_with(
+        (_tool("read", cacheable=True, cache_paths=lambda args: [str(watched)]), handler),
+        (_tool("write"), lambda: ToolResult(success=True, output="")),
+        (_tool("flaky", cacheable=True), failing),
+    )
+    
+    async def read():
+        return await executor.execute("read", {}, scope="conv")
+    
+    await read()
+    assert (await read()).cached
+    await executor.execute("write", {}, scope="conv")
+    assert not (await read()).cached
+    
+    stat = watched.stat()
+    os.utime(watched, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert not (await read()).cached
+    assert len(calls) == 3
+    
+    await executor.execute("flaky", {}, scope="conv")
+    await executor.execute("flaky", {}, scope="conv")
+    assert len(failing_calls) == 2
+    
+    expiring = _executor_with((_tool("read", cacheable=True), handler))
+    expiring.result_cache = ToolResultCache(ttl=0)
+    await expiring.execute("read", {}, scope="conv")
+    assert not (await expiring.execute("read", {}, scope="conv")).cached
+    executor.shutdown()
+    expiring.shutdown()
+
+
+def test_read_only_command_paths(tmp_path):
+    """Test that only single read-only commands are cacheable, fingerprinted by the files they name."""
+    (tmp_path / "a.txt").write_text("a")
+    (tmp_path / ".git" / "refs" / "heads").mkdir(parents=True)
+    (tmp_path / ".git" / "HEAD").write_text("ref: refs/heads/main\n")
+    (tmp_path / "sub").mkdir()
+    token = command_cwd.set(str(tmp_path / "sub"))
+    try:
+        assert read_only_command_paths({"command": "cat ../a.txt missing.txt"}) == [
+            str(tmp_path / "sub"), str(tmp_path / "sub" / "../a.txt"), str(tmp_path / "sub" / "missing.txt"),
+        ]
+        assert str(tmp_path / "sub" / "../a.txt") in read_only_command_paths({"command": "ls -l .."})
+        # Commits move the branch HEAD points to, not HEAD itself
+        assert str(tmp_path / ".git" / "refs/heads/main") in read_only_command_paths({"command": "git log"})
+        for command in ("git log ../a.txt", "git show HEAD^^:a.txt", "git log -- gone.txt"):
+            assert read_only_command_paths({"command": command}) is not None, command
+        for command in (
+            "rm a.txt", "git commit -m x", "cat a.txt > b.txt", "ls; rm a.txt", "ls $(pwd)", "",
+            # These read files they don't name
+            "git status", "git diff", "grep -r x .", "rg x", "du", "tree", "ls -R", "git ls-files -o",
+            # ... or refs that the fingerprint doesn't cover
+            "git log main", "git show v1.0", "git blame origin/main a.txt", "git log --all", "git log --tags=v*",
+        ):
+            assert read_only_command_paths({"command": command}) is None, command
+    finally:
+        command_cwd.reset(token)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(sys.platform == "win32", reason="read-only commands are detected for POSIX shells")
+async def test_repeated_read_only_command_asks_once(tmp_path):
+    """Test that re-running `ls` in a conversation reuses its output without asking again."""
+    (tmp_path / "a.txt").write_text("a")
+    asked = []
+    
+    async def confirm(command):
+        asked.append(command)
+        return True
+    
+    executor = ToolExecutor(registry, max_workers=1, result_cache=ToolResultCache())
+    cwd_token = command_cwd.set(str(tmp_path))
+    confirm_token = confirm_command.set(confirm)
+    try:
+        first = await executor.execute("run_command", {"command": "ls"}, scope="conv")
+        second = await executor.execute("run_command", {"command": "ls"}, scope="conv")
+        (tmp_path / "b.txt").write_text("b")
+        third = await executor.execute("run_command", {"command": "ls"}, scope="conv")
+    finally:
+        confirm_command.reset(confirm_token)
+        command_cwd.reset(cwd_token)
+        executor.shutdown()
+    
+    assert asked == ["ls", "ls"]
+    assert second.cached and second.output == first.output == "a.txt\n"
+    assert "b.txt" in third.output and not third.cached
+
+
+def _shell_tool(require_confirmation):
+    async def handler(command):
+        return await run_command_async(command, require_confirmation=require_confirmation)
+    return Tool(name="shell", description="shell", parameters={}, requires_confirmation=True), handler
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(sys.platform == "win32", reason="uses a POSIX shell")
+async def test_confirmed_commands_run_concurrently():
+    """Test that commands run concurrently, whether or not they ask for confirmation first."""
+    for require_confirmation in (False, True):
+        executor = _executor_with(_shell_tool(require_confirmation))
+        with patch("urpe.tools.shell.ask_confirmation", return_value=True):
+            start = time.perf_counter()
+            results = await executor.execute_many([("shell", {"command": "sleep 0.5"})] * 2)
+        
+        assert all(r.success for r in results)
+        assert time.perf_counter() - start < 0.9
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_confirmation_prompts_are_serialized():
+    """Test that only one confirmation prompt is shown at a time."""
+    showing = 0
+    peak = 0
+    
+    async def confirm(command):
+        nonlocal showing, peak
+        showing += 1
+        peak = max(peak, showing)
+        await asyncio.sleep(0.02)
+        showing -= 1
+        return False
+    
+    executor = _executor_with(_shell_tool(True))
+    with patch("urpe.tools.shell.ask_confirmation", confirm):
+        results = await executor.execute_many([("shell", {"command": "true"})] * 3)
+    
+    assert [r.error for r in results] == ["User denied execution"] * 3
+    assert peak == 1
+    executor.shutdown()
@@ -0,0 +1,135 @@
+"""Tests for tracing."""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from urpe.agent import Agent
+from urpe.memory import MemoryStore
+from urpe.tools import ToolExecutor
+from urpe.tools.base import Tool, ToolRegistry
+from urpe.tools.shell import ToolResult
+from urpe.tracing import NOOP_SPAN, summarize, traced, tracer
+
+
+@pytest.fixture
+def trace_path(tmp_path):
+    """Turn tracing on for one test, writing to a temporary file."""
+    path = tmp_path / "traces.jsonl"
+    tracer.configure(str(path))
+    yield path
+    tracer.configure(None)
+
+
+def _spans(path):
+    tracer.flush()
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_disabled_tracer_is_noop(tmp_path):
+    """Test that spans cost nothing and write nothing while tracing is off."""
+    assert not tracer.enabled
+    assert tracer.span("anything") is NOOP_SPAN
+
+    @traced("work")
+    def work():
+        return 42
+
+    assert work() == 42
+    tracer.record("anything", 1_000)
+    tracer.flush()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spans_nest_and_summarize(trace_path):
+    """Test that child spans share the trace and point at their parent."""
+    with tracer.span("parent", kind="test"):
+        with tracer.span("child"):
+            pass
+        with tracer.span("child"):
+            pass
+    with pytest.raises(ValueError):
+        with tracer.span("failing"):
+            raise ValueError
+
+    spans = {span["name"]: span for span in _spans(trace_path)}
+    parent, child = spans["parent"], spans["child"]
+    assert child["traceId"] == parent["traceId"]
+    assert child["parentSpanId"] == parent["spanId"]
+    assert parent["parentSpanId"] is None
+    assert parent["attributes"] == {"kind": "test"}
+    assert spans["failing"]["attributes"]["error"] == "ValueError"
+    assert spans["failing"]["traceId"] != parent["traceId"]
+
+    summary = summarize(str(trace_path))
+    assert summary["child"]["count"] == 2
+    assert summary["parent"]["p99_ms"] >= summary["child"]["p50_ms"]
+
+
+@pytest.mark.asyncio
+async def test_memory_and_tool_spans(trace_path, tmp_path):
+    """Test that memory store methods and tool handlers are traced."""
+    store = MemoryStore(db_path=str(tmp_path / "test.db"))
+    conversation_id = store.create_conversation()
+    store.add_message(conversation_id, "user", "hi")
+    store.get_messages(conversation_id)
+    store.close()
+
+    tool_registry = ToolRegistry()
+    tool_registry.register(
+        Tool(name="echo", description="echo", parameters={}, requires_confirmation=False),
+        lambda text: ToolResult(success=True, output=text),
+    )
+    result = await ToolExecutor(tool_registry, max_workers=1).execute("echo", {"text": "x"})
+
+    assert result.output == "x"
+    names = [span["name"] for span in _spans(trace_path)]
+    assert names == ["memory.create_conversation", "memory.add_message", "memory.get_messages", "tool.echo"]
+
+
+@pytest.mark.asyncio
+async def test_agent_turn_phases(trace_path):
+    """Test that each phase of a turn is recorded under the turn's span."""
+    tool_delta = SimpleNamespace(
+        content=None,
+        tool_calls=[SimpleNamespace(
+            index=0,
+            id="call-1",
+            function=SimpleNamespace(name="echo", arguments='{"text": "x"}'),
+        )],
+    )
+
+    def stream(*deltas):
+        async def chunks():
+            for delta in deltas:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        return chunks()
+
+    responses = iter([stream(tool_delta), stream(SimpleNamespace(content="done", tool_calls=None))])
+    tool_registry = ToolRegistry()
+    tool_registry.register(
+        Tool(name="echo", description="echo", parameters={}, requires_confirmation=False),
+        lambda text: ToolResult(success=True, output=text),
+    )
+    agent = Agent(model="test-model", tool_executor=ToolExecutor(tool_registry, max_workers=1))
+
+    with patch("urpe.agent.memory"), \
+            patch("urpe.agent.get_llm_response", new_callable=AsyncMock) as mock_llm:
+        mock_llm.side_effect = lambda **kwargs: next(responses)
+        [chunk async for chunk in agent.process_message("hi")]
+
+    spans = _spans(trace_path)
+    by_name = {}
+    for span in spans:
+        by_name.setdefault(span["name"], []).append(span)
+
+    turn = by_name["agent.turn"][0]
+    assert {span["traceId"] for span in spans} == {turn["traceId"]}
+    assert len(by_name["llm.request"]) == 2
+    assert len(by_name["llm.first_token"]) == 2
+    assert len(by_name["agent.build_prompt"]) == 2
+    assert by_name["agent.chunks"][0]["attributes"]["chunks"] == 1
+    assert by_name["tool.echo"][0]["parentSpanId"] == by_name["agent.tools"][0]["spanId"]
+    assert by_name["agent.tools"][0]["parentSpanId"] == turn["spanId"]